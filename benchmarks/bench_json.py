@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark the decoding of on-demand syllabus payloads.
+
+Compares the json module with the optional backends used by coursera-dl
+(orjson for whole documents, ijson for incremental parsing) on a synthetic
+syllabus, reporting the time and the peak memory of each.
+
+Usage:
+  python benchmarks/bench_json.py [num_modules]
+"""
+
+from __future__ import print_function
+
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from coursera import utils  # noqa: E402
+
+
+def make_syllabus(num_modules, num_sections=6, num_lectures=12):
+    modules = []
+    for m in range(num_modules):
+        sections = []
+        for s in range(num_sections):
+            lectures = []
+            for l in range(num_lectures):
+                lectures.append({
+                    'id': 'id-%d-%d-%d' % (m, s, l),
+                    'slug': 'lecture-%d-%d-%d' % (m, s, l),
+                    'name': 'Lecture %d.%d.%d' % (m, s, l),
+                    'timeCommitment': 600000,
+                    'content': {
+                        'typeName': 'lecture',
+                        'definition': {
+                            'videoId': 'v%d-%d-%d' % (m, s, l),
+                            'duration': 600000,
+                            'assets': [],
+                        },
+                    },
+                })
+            sections.append({'slug': 'section-%d-%d' % (m, s),
+                             'name': 'Section %d.%d' % (m, s),
+                             'elements': lectures})
+        modules.append({'slug': 'module-%d' % m,
+                        'name': 'Module %d' % m,
+                        'description': 'x' * 2000,
+                        'elements': sections})
+
+    return json.dumps({'courseMaterial': {'elements': modules}}).encode('utf-8')
+
+
+def walk_dom(dom):
+    return sum(len(section['elements'])
+               for module in dom['courseMaterial']['elements']
+               for section in module['elements'])
+
+
+def walk_items(items):
+    return sum(len(section['elements'])
+               for module in items
+               for section in module['elements'])
+
+
+def measure(name, func, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        result = func()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    print('{0: <24} {1: >8.3f}s {2: >10.1f}MB  ({3} lectures)'.format(
+        name, best, peak / 1024.0 / 1024.0, result))
+
+
+def main():
+    num_modules = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    data = make_syllabus(num_modules)
+    text = data.decode('utf-8')
+    print('Syllabus with %d modules: %.1fMB' % (num_modules,
+                                                 len(data) / 1024.0 / 1024.0))
+
+    measure('json (text)', lambda: walk_dom(json.loads(text)))
+
+    if utils.orjson is not None:
+        measure('orjson (bytes)', lambda: walk_dom(utils.orjson.loads(data)))
+    else:
+        print('orjson is not installed')
+
+    if utils.ijson is not None:
+        measure('ijson (incremental)', lambda: walk_items(
+            utils.iter_json_items(data, 'courseMaterial.elements', 0)))
+    else:
+        print('ijson is not installed')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Measure the memory used by a synthetic catalog of lectures, comparing the
+nested tuples and dicts that used to describe the syllabus with the
+classes of coursera.models.
+
+Usage:
+  python benchmarks/bench_models.py [num_lectures]
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from coursera.models import Module, Section, Lecture, Resource  # noqa: E402
+
+LANGUAGES = ['en', 'es', 'pt-BR', 'zh-CN', 'fr']
+LECTURES_PER_SECTION = 10
+SECTIONS_PER_MODULE = 5
+
+
+def _lecture_resources(n):
+    resources = [('mp4', 'https://cdn.example.org/video/%d/720p.mp4' % n)]
+    for language in LANGUAGES:
+        for ext in ('srt', 'txt'):
+            # build the format at runtime, as the JSON decoder does
+            fmt = ''.join([language, '.', ext])
+            resources.append(
+                (fmt, 'https://www.coursera.org/api/subtitles/%d/%s' % (n, fmt)))
+    return resources
+
+
+def _catalog_shape(num_lectures):
+    per_module = LECTURES_PER_SECTION * SECTIONS_PER_MODULE
+    for m in range(num_lectures // per_module):
+        yield m, [(s, [m * per_module + s * LECTURES_PER_SECTION + l
+                       for l in range(LECTURES_PER_SECTION)])
+                  for s in range(SECTIONS_PER_MODULE)]
+
+
+def build_tuples(num_lectures):
+    modules = []
+    for m, sections in _catalog_shape(num_lectures):
+        module_sections = []
+        for s, lectures in sections:
+            section_lectures = []
+            for n in lectures:
+                content = {}
+                for fmt, url in _lecture_resources(n):
+                    content[fmt] = [(url, '')]
+                section_lectures.append(('lecture-%d' % n, content))
+            module_sections.append(('section-%d-%d' % (m, s), section_lectures))
+        modules.append(('module-%d' % m, module_sections))
+    return modules
+
+
+def build_models(num_lectures):
+    modules = []
+    for m, sections in _catalog_shape(num_lectures):
+        module_sections = []
+        for s, lectures in sections:
+            section_lectures = [
+                Lecture('lecture-%d' % n,
+                        [Resource(fmt, url) for fmt, url in _lecture_resources(n)])
+                for n in lectures]
+            module_sections.append(Section('section-%d-%d' % (m, s),
+                                           section_lectures))
+        modules.append(Module('module-%d' % m, module_sections))
+    return modules
+
+
+def measure(name, build, num_lectures):
+    tracemalloc.start()
+    catalog = build(num_lectures)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print('{0: <16} {1: >8.1f}MB'.format(name, size / 1024.0 / 1024.0))
+    return catalog
+
+
+def main():
+    num_lectures = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    print('Catalog with %d lectures, %d resources each' % (
+        num_lectures, 1 + 2 * len(LANGUAGES)))
+
+    measure('tuples and dicts', build_tuples, num_lectures)
+    measure('models', build_models, num_lectures)
+
+
+if __name__ == '__main__':
+    main()
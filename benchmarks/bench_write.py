@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Measure the CPU time spent by NativeDownloader per GB written, comparing
+the loop that read a new string for every chunk with the reusable buffer
+of NativeDownloader._copy_stream.
+
+The file is served from memory by a local HTTP server, running in another
+process so that its CPU time isn't counted, and written to a temporary
+directory.
+
+Usage:
+  python benchmarks/bench_write.py [size_in_mb] [chunk_size_in_kb]
+"""
+
+from __future__ import print_function
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+from multiprocessing import Process, Queue
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import requests  # noqa: E402
+from six.moves import BaseHTTPServer, socketserver  # noqa: E402
+
+from coursera.downloaders import NativeDownloader  # noqa: E402
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        data = self.server.data
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        view = memoryview(data)
+        for i in range(0, len(data), 4194304):
+            self.wfile.write(view[i:i + 4194304])
+
+
+class _Server(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+def serve(size, queue):
+    server = _Server(('127.0.0.1', 0), _Handler)
+    server.data = os.urandom(size)
+    queue.put(server.server_address[1])
+    server.serve_forever()
+
+
+def copy_read(downloader, r, f):
+    """
+    The previous loop: a new string for every chunk and a progress update
+    for every chunk.
+    """
+    while True:
+        data = r.raw.read(downloader.chunk_size, decode_content=True)
+        if not data:
+            break
+        r.raw.tell()
+        f.write(data)
+
+
+def copy_readinto(downloader, r, f):
+    downloader._copy_stream(r, f, lambda n: None)
+
+
+def measure(name, copy, url, filename, size, chunk_size):
+    session = requests.Session()
+    downloader = NativeDownloader(session, chunk_size=chunk_size)
+
+    wall = time.time()
+    cpu = time.process_time()
+    r = session.get(url, stream=True)
+    with open(filename, 'wb') as f:
+        copy(downloader, r, f)
+    r.close()
+    cpu = time.process_time() - cpu
+    wall = time.time() - wall
+
+    assert os.path.getsize(filename) == size
+    gb = size / 1073741824.0
+    print('{0: <10} {1: >8.2f}s CPU/GB {2: >8.2f}s wall/GB'.format(
+        name, cpu / gb, wall / gb))
+
+
+def main():
+    size = (int(sys.argv[1]) if len(sys.argv) > 1 else 512) * 1048576
+    chunk_size = (int(sys.argv[2]) if len(sys.argv) > 2 else 1024) * 1024
+
+    queue = Queue()
+    server = Process(target=serve, args=(size, queue))
+    server.daemon = True
+    server.start()
+
+    url = 'http://127.0.0.1:%d/video.mp4' % queue.get()
+    tmpdir = tempfile.mkdtemp()
+    filename = os.path.join(tmpdir, 'video.mp4')
+    print('Downloading %dMB in chunks of %dKB' % (size // 1048576,
+                                                  chunk_size // 1024))
+    try:
+        for _ in range(2):
+            measure('read', copy_read, url, filename, size, chunk_size)
+            measure('readinto', copy_readinto, url, filename, size, chunk_size)
+    finally:
+        server.terminate()
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,334 @@
+# -*- coding: utf-8 -*-
+
+"""
+Downloader that hands the files to a long-lived aria2 process, through its
+JSON-RPC interface.
+
+The process is either started by us (once for the whole run) or an
+already running `aria2c --enable-rpc` that we attach to. Either way, aria2
+keeps its connections and runs the downloads at once, and we ask it for
+the status of each file.
+"""
+
+import atexit
+import itertools
+import logging
+import os
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+
+import requests
+
+from .downloaders import (Downloader, DownloadProgress, get_cookie_values,
+                          wait_for_downloads)
+from .progress import ProgressRenderer
+from .utils import random_string
+
+# Statuses of the downloads in aria2
+ACTIVE_STATUSES = ('active', 'waiting', 'paused')
+STATUS_KEYS = ['gid', 'status', 'totalLength', 'completedLength',
+               'errorMessage']
+
+# Maximum number of downloads to ask aria2 about at once
+MAX_RESULTS = 100000
+
+
+class Aria2RpcError(Exception):
+    """
+    Raised if aria2 fails to answer a call, or answers with an error.
+    """
+
+
+class Aria2RpcServer(object):
+    """
+    A running aria2 with the RPC interface enabled.
+
+    :param url: URL of the RPC interface, e.g. http://localhost:6800/jsonrpc.
+    :param secret: Secret token of the RPC interface, if any.
+    :param process: The aria2c process, if we started it.
+    """
+
+    def __init__(self, url, secret=None, process=None):
+        self.url = url
+        self.secret = secret
+        self.process = process
+
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._http = requests.Session()
+
+    def call(self, method, *params):
+        """
+        Call an aria2 method (without its 'aria2.' prefix) and return its
+        result.
+        """
+        if self.secret:
+            params = ('token:' + self.secret,) + params
+        with self._lock:
+            request_id = next(self._ids)
+        try:
+            r = self._http.post(self.url, json={
+                'jsonrpc': '2.0', 'id': request_id,
+                'method': 'aria2.' + method, 'params': list(params)},
+                timeout=30)
+            reply = r.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            raise Aria2RpcError('Cannot call aria2.{0}: {1}'.format(method,
+                                                                   e))
+        if 'error' in reply:
+            raise Aria2RpcError('aria2.{0} failed: {1}'.format(
+                method, reply['error'].get('message')))
+        return reply['result']
+
+    def wait_until_ready(self, timeout=10):
+        """
+        Wait until aria2 answers.
+        """
+        deadline = time.time() + timeout
+        while True:
+            try:
+                return self.call('getVersion')
+            except Aria2RpcError:
+                if self.process and self.process.poll() is not None:
+                    raise Aria2RpcError('aria2c exited with code %d' %
+                                        self.process.returncode)
+                if time.time() > deadline:
+                    raise
+                time.sleep(0.1)
+
+    def shutdown(self):
+        """
+        Stop the aria2c process, if we started it.
+        """
+        if self.process is None or self.process.poll() is not None:
+            return
+        try:
+            self.call('shutdown')
+            self.process.wait()
+        except Aria2RpcError:
+            self.process.terminate()
+
+
+def _get_free_port():
+    sock = socket.socket()
+    try:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+    finally:
+        sock.close()
+
+
+def start_rpc_server(bin='aria2c', jobs=1, max_per_host=None):
+    """
+    Start aria2c with the RPC interface on a free local port, with a random
+    secret, and return its Aria2RpcServer.
+    """
+    port = _get_free_port()
+    secret = random_string(32)
+
+    # keep the secret out of the command line
+    fd, conf_path = tempfile.mkstemp(prefix='coursera-dl-aria2-')
+    with os.fdopen(fd, 'w') as f:
+        f.write('rpc-secret={0}\n'.format(secret))
+
+    command = [bin, '--enable-rpc', '--rpc-listen-all=false',
+               '--rpc-listen-port={0}'.format(port),
+               '--conf-path={0}'.format(conf_path),
+               '--max-concurrent-downloads={0}'.format(jobs),
+               '--max-connection-per-server={0}'.format(max_per_host or 4),
+               '--min-split-size=1M', '--check-certificate=false',
+               '--auto-file-renaming=false', '--quiet=true']
+    logging.debug('Executing %s: %s', bin, command)
+    try:
+        process = subprocess.Popen(command)
+    except OSError as e:
+        os.remove(conf_path)
+        raise OSError("{0}. Are you sure that '{1}' is the right bin?".format(
+            e, bin))
+
+    server = Aria2RpcServer('http://127.0.0.1:{0}/jsonrpc'.format(port),
+                            secret, process)
+    try:
+        server.wait_until_ready()
+    except Aria2RpcError:
+        server.shutdown()
+        raise
+    finally:
+        os.remove(conf_path)
+    return server
+
+
+# aria2c processes that we started, shared by all the classes of the run
+_servers = {}
+_servers_lock = threading.Lock()
+
+
+def _shutdown_servers():
+    with _servers_lock:
+        for server in _servers.values():
+            server.shutdown()
+        _servers.clear()
+
+
+def get_rpc_server(bin='aria2c', url=None, secret=None, jobs=1,
+                   max_per_host=None):
+    """
+    Return the server at url, or an aria2c process that we start the first
+    time and keep until the end of the run.
+    """
+    if url:
+        return Aria2RpcServer(url, secret)
+
+    with _servers_lock:
+        if bin not in _servers:
+            if not _servers:
+                atexit.register(_shutdown_servers)
+            _servers[bin] = start_rpc_server(bin, jobs, max_per_host)
+        return _servers[bin]
+
+
+class Aria2RpcDownloader(Downloader):
+    """
+    Downloads files with a long-lived aria2 process, over JSON-RPC.
+
+    download() only adds the file to aria2 and returns at once; join()
+    polls aria2 for the status of the files, drawing their progress, until
+    they are all done.
+
+    :param session: Requests session, whose cookies are passed to aria2.
+    :param server: Aria2RpcServer to use.
+    :param poll_interval: Seconds between two polls of the status.
+    """
+
+    def __init__(self, session, server, poll_interval=0.5):
+        self.session = session
+        self.server = server
+        self.poll_interval = poll_interval
+        self.renderer = ProgressRenderer()
+
+        self._pending = []
+        self._rate = None
+
+    def _get_options(self, url, filename, resume):
+        filename = os.path.abspath(filename)
+        options = {
+            'dir': os.path.dirname(filename),
+            'out': os.path.basename(filename),
+        }
+        if resume:
+            options['continue'] = 'true'
+        else:
+            options['allow-overwrite'] = 'true'
+
+        cookie_values = get_cookie_values(self.session, url)
+        if cookie_values:
+            options['header'] = ['Cookie: ' + cookie_values]
+        return options
+
+    def download(self, url, filename, resume=False):
+        if self.manifest:
+            self.manifest.start(filename, url)
+
+        logging.info('Downloading %s -> %s', url, filename)
+        try:
+            part = self._get_part(filename, resume)
+            gid = self.server.call('addUri', [url],
+                                   self._get_options(url, part, resume))
+        except (Aria2RpcError, OSError) as e:
+            logging.error('Cannot add %s to aria2: %s', url, e)
+            gid = None
+        self._pending.append([gid, filename, None])
+
+    def _apply_rate_limit(self):
+        """
+        Pass the current speed limit to aria2, which follows the schedule
+        this way.
+        """
+        rate = self.limiter.get_rate() if self.limiter else None
+        if rate != self._rate:
+            self.server.call('changeGlobalOption', {
+                'max-overall-download-limit': str(rate or 0)})
+            self._rate = rate
+
+    def _get_statuses(self):
+        """
+        Return the statuses of all the downloads that aria2 knows about, by
+        gid.
+        """
+        statuses = (self.server.call('tellActive', STATUS_KEYS) +
+                    self.server.call('tellWaiting', 0, MAX_RESULTS,
+                                     STATUS_KEYS) +
+                    self.server.call('tellStopped', 0, MAX_RESULTS,
+                                     STATUS_KEYS))
+        return dict((status['gid'], status) for status in statuses)
+
+    def _poll(self, pending):
+        """
+        Update the progress of the pending downloads, returning the
+        statuses of those that are done, by gid.
+        """
+        statuses = self._get_statuses()
+        done = {}
+        for entry in pending:
+            gid, filename, progress = entry
+            status = statuses.get(gid)
+            if status is None:
+                status = {'status': 'error',
+                          'errorMessage': 'unknown to aria2'}
+            if status['status'] not in ACTIVE_STATUSES:
+                done[gid] = status
+
+            total = int(status.get('totalLength') or 0)
+            if progress is None and total:
+                progress = entry[2] = DownloadProgress(total, filename,
+                                                       self.renderer)
+                progress.start()
+            if progress is not None:
+                progress.report(int(status.get('completedLength') or 0))
+        return done
+
+    def join(self):
+        """
+        Wait for all the downloads added to aria2.
+
+        Returns the number of failed downloads.
+        """
+        pending, self._pending = self._pending, []
+        results = {}
+        waiting = [entry for entry in pending if entry[0] is not None]
+        try:
+            while waiting:
+                self._apply_rate_limit()
+                done = self._poll(waiting)
+                for gid, status in done.items():
+                    results[gid] = status
+                    if status.get('gid'):
+                        self.server.call('removeDownloadResult', gid)
+                waiting = [entry for entry in waiting
+                           if entry[0] not in results]
+                if waiting:
+                    time.sleep(self.poll_interval)
+        except Aria2RpcError as e:
+            logging.error('Lost aria2: %s', e)
+        finally:
+            for gid, filename, progress in pending:
+                if progress is not None:
+                    progress.stop()
+
+        finished = []
+        for gid, filename, progress in pending:
+            status = results.get(gid)
+            result = status is not None and status['status'] == 'complete'
+            if status is not None and not result:
+                logging.error('aria2 could not download %s: %s', filename,
+                              status.get('errorMessage'))
+            result = self._finish(filename, result)
+            finished.append((filename, lambda result=result: result))
+        return wait_for_downloads(finished)
+
+    def close(self):
+        self.renderer.close()
+        super(Aria2RpcDownloader, self).close()
@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+"""
+Native downloader based on asyncio.
+
+All the transfers run as coroutines of a single event loop, which lives in
+a background thread, so that hundreds of small files can be downloaded at
+once without a thread per transfer. The blocking calls (the writes to the
+files and to the manifest) run in a pool of threads, so that a slow disk
+doesn't hold up the other transfers.
+
+This module needs Python 3.5+ and the aiohttp module.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+import aiohttp
+
+from .downloaders import (Downloader, DownloadProgress, RetryPolicy,
+                          get_cookie_values, get_total_size,
+                          wait_for_downloads)
+from .define import CONNECT_TIMEOUT, READ_TIMEOUT
+from .progress import ProgressRenderer
+
+# asyncio.Task.current_task was removed in Python 3.9
+current_task = getattr(asyncio, 'current_task', None) or \
+    asyncio.Task.current_task
+
+
+class AsyncioDownloader(Downloader):
+    """
+    Downloads files with aiohttp, running the transfers in one event loop.
+
+    download() only schedules the download and returns at once; join()
+    waits for the scheduled downloads. The cookies of the requests session
+    are sent with every request.
+
+    :param session: Requests session.
+    :param jobs: Number of simultaneous downloads.
+    :param max_per_host: Maximum number of simultaneous downloads from the
+        same host.
+    :param retry: RetryPolicy for the failed requests.
+    :param timeout: Seconds to wait for a connection and between two reads,
+        as a (connect timeout, read timeout) tuple.
+    """
+
+    chunk_size = 1048576
+
+    def __init__(self, session, jobs=1, max_per_host=None, retry=None,
+                 timeout=(CONNECT_TIMEOUT, READ_TIMEOUT)):
+        self.session = session
+        self.jobs = jobs
+        self.max_per_host = max_per_host or jobs
+        self.retry = retry or RetryPolicy()
+        self.timeout = timeout
+
+        self.renderer = ProgressRenderer()
+
+        self._pending = []
+        self._tasks = set()
+        self._client = None
+        self._executor = ThreadPoolExecutor(max_workers=jobs)
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run_blocking(self, func, *args):
+        """
+        Run func(*args) in the pool of threads, returning an awaitable.
+        """
+        return self._loop.run_in_executor(self._executor, func, *args)
+
+    async def _get_client(self):
+        if self._client is None:
+            connector = aiohttp.TCPConnector(limit=self.jobs,
+                                             limit_per_host=self.max_per_host)
+            connect, read = self.timeout
+            timeout = aiohttp.ClientTimeout(sock_connect=connect,
+                                            sock_read=read)
+            self._client = aiohttp.ClientSession(connector=connector,
+                                                 timeout=timeout)
+        return self._client
+
+    async def _fetch(self, url, filename, resume):
+        # resume has no meaning if the file doesn't exists!
+        resume = resume and os.path.exists(filename)
+
+        headers = {}
+        cookie_values = get_cookie_values(self.session, url)
+        if cookie_values:
+            headers['Cookie'] = cookie_values
+
+        if resume:
+            headers['Range'] = 'bytes={}-'.format(os.path.getsize(filename))
+            logging.info('Resume downloading %s -> %s', url, filename)
+        else:
+            logging.info('Downloading %s -> %s', url, filename)
+
+        client = await self._get_client()
+        error_msg = ''
+        attempt = 0
+        while True:
+            async with client.get(url, headers=headers) as r:
+                if r.status != 200:
+                    # 206 (Partial Content) and 416 (Requested Range Not
+                    # Satisfiable) are OK for us when resuming.
+                    if resume and r.status == 206:
+                        pass
+                    elif resume and r.status == 416:
+                        logging.info('%s already downloaded', filename)
+                        return True
+                    else:
+                        error_msg = '{0} {1}'.format(r.reason or 'HTTP Error',
+                                                     r.status)
+                        if not self.retry.consume(attempt):
+                            break
+                        delay = self.retry.get_delay(
+                            attempt, r.headers.get('retry-after'))
+                        logging.warning('Error downloading %s (%s), will retry '
+                                        'in %.1f seconds ...', url, error_msg,
+                                        delay)
+                        await asyncio.sleep(delay)
+                        attempt += 1
+                        continue
+
+                if resume and r.status == 200:
+                    # the server does not support partial downloads
+                    resume = False
+
+                if self.manifest:
+                    await self._run_blocking(
+                        self.manifest.update, filename,
+                        get_total_size(r.status, r.headers),
+                        r.headers.get('etag'), r.headers.get('last-modified'))
+
+                progress = DownloadProgress(r.headers.get('content-length'),
+                                            filename, self.renderer)
+                progress.start()
+                try:
+                    f = await self._run_blocking(open, filename,
+                                                 'ab' if resume else 'wb')
+                    try:
+                        async for chunk in r.content.iter_chunked(
+                                self.chunk_size):
+                            await self._run_blocking(f.write, chunk)
+                            progress.read(len(chunk))
+                            if self.limiter:
+                                delay = self.limiter.reserve(len(chunk))
+                                if delay > 0:
+                                    await asyncio.sleep(delay)
+                    finally:
+                        await self._run_blocking(f.close)
+                finally:
+                    progress.stop()
+                return True
+
+        logging.warning('Skipping, can\'t download file ...')
+        logging.error(error_msg)
+        return False
+
+    async def _download(self, url, filename, resume):
+        task = current_task(self._loop)
+        self._tasks.add(task)
+        try:
+            try:
+                part = await self._run_blocking(self._get_part, filename,
+                                                resume)
+                result = await self._fetch(url, part, resume)
+            except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as e:
+                logging.error('Error downloading %s: %s', url, e)
+                result = False
+
+            return await self._run_blocking(self._finish, filename, result)
+        finally:
+            self._tasks.discard(task)
+
+    async def _cancel_all(self):
+        """
+        Cancel the running downloads and wait for them to unwind.
+        """
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.wait(tasks)
+
+    def download(self, url, filename, resume=False):
+        if self.manifest:
+            self.manifest.start(filename, url)
+
+        future = asyncio.run_coroutine_threadsafe(
+            self._download(url, filename, resume), self._loop)
+        self._pending.append((filename, future.result))
+
+    def _start_download(self, url, filename, resume):
+        future = asyncio.run_coroutine_threadsafe(
+            self._fetch(url, filename, resume), self._loop)
+        return future.result()
+
+    def join(self):
+        """
+        Wait for all the scheduled downloads.
+
+        Returns the number of failed downloads.
+        """
+        pending, self._pending = self._pending, []
+        return wait_for_downloads(pending)
+
+    def close(self):
+        # the downloads must be done with the manifest before it is closed
+        self._pending = []
+        asyncio.run_coroutine_threadsafe(self._cancel_all(),
+                                         self._loop).result()
+        self._executor.shutdown(wait=True)
+        if self._client is not None:
+            asyncio.run_coroutine_threadsafe(
+                self._client.close(), self._loop).result()
+            self._client = None
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self.renderer.close()
+        super(AsyncioDownloader, self).close()
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+
+"""
+On-disk cache for the metadata that we get from Coursera's API.
+
+Entries are JSON documents stored below PATH_METADATA, grouped by kind
+(e.g., "video") and identified by a key that is safe to use as a filename.
+"""
+
+import json
+import logging
+import os
+import tempfile
+import time
+
+from .define import PATH_METADATA
+from .utils import mkdir_p
+
+
+def get_cache_path(kind, key):
+    """
+    Return the path of the file that stores the cache entry for key.
+    """
+    return os.path.join(PATH_METADATA, kind, key + '.json')
+
+
+def read_cache(kind, key, ttl=None):
+    """
+    Return the data cached for key, or None if there is no such entry.
+
+    When ttl (in seconds) is given, entries older than ttl are ignored.
+    """
+    path = get_cache_path(kind, key)
+
+    try:
+        if ttl is not None and time.time() - os.path.getmtime(path) > ttl:
+            logging.debug('Cache entry %s has expired.', path)
+            return None
+        with open(path) as f:
+            data = json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+
+    logging.debug('Loaded %s from the cache.', path)
+    return data
+
+
+def write_cache(kind, key, data):
+    """
+    Store data (which must be JSON serializable) as the cache entry for key.
+
+    The entry is written to a temporary file first, so that concurrent
+    readers never see a partially written entry.
+    """
+    path = get_cache_path(kind, key)
+    directory = os.path.dirname(path)
+    mkdir_p(directory, 0o700)
+
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f)
+        try:
+            os.rename(tmp_path, path)
+        except OSError:
+            # Windows does not replace existing files on rename.
+            os.remove(path)
+            os.rename(tmp_path, path)
+    except (IOError, OSError) as e:
+        logging.debug('Could not write cache entry %s: %s', path, e)
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
@@ -7,6 +7,7 @@ Cookie handling module.
 import logging
 import os
 import ssl
+import threading
 
 import requests
 from requests.adapters import HTTPAdapter
@@ -86,7 +87,7 @@ def login(session, username, password, class_name=None):
     # Hit class url
     if class_name is not None:
         class_url = CLASS_URL.format(class_name=class_name)
-        r = requests.get(class_url, allow_redirects=False)
+        r = session.get(class_url, allow_redirects=False)
         try:
             r.raise_for_status()
         except requests.exceptions.HTTPError as e:
@@ -132,6 +133,50 @@ def login(session, username, password, class_name=None):
     logging.info('Logged in on coursera.org.')
 
 
+class SessionLogin(object):
+    """
+    Logs a session in on coursera.org the first time that it is needed,
+    so that one session (with its cookies and connections) serves all the
+    classes of a run.
+
+    The login happens once even if several threads need it at once, and a
+    failed login is not tried again.
+
+    :param session: Requests session to log in.
+    :param username: Login of the user.
+    :param password: Password of the user.
+    """
+
+    def __init__(self, session, username, password):
+        self.session = session
+        self.username = username
+        self.password = password
+
+        self._lock = threading.Lock()
+        self._logged_in = False
+        self._error = None
+
+    def ensure_logged_in(self):
+        """
+        Log the session in, unless it already is.
+
+        @raise AuthenticationFailed: If the login failed, now or before.
+        """
+        with self._lock:
+            if self._error is not None:
+                raise self._error
+            # login() stores CAUTH without a domain, so look it up by name
+            if self._logged_in or self.session.cookies.get('CAUTH'):
+                logging.debug('Already logged in on coursera.org.')
+                return
+            try:
+                login(self.session, self.username, self.password)
+            except AuthenticationFailed as e:
+                self._error = e
+                raise
+            self._logged_in = True
+
+
 def down_the_wabbit_hole(session, class_name):
     """
     Authenticate on class.coursera.org
@@ -346,7 +391,25 @@ def get_cookies_for_class(session, class_name,
             write_cookies_to_cache(session.cookies, username)
 
 
-class TLSAdapter(HTTPAdapter):
+class TimeoutAdapter(HTTPAdapter):
+    """
+    An HTTP Adapter which applies a default timeout to the requests that
+    don't give one.
+
+    :param timeout: Default timeout, as accepted by requests: seconds or a
+        (connect timeout, read timeout) tuple.
+    """
+    def __init__(self, timeout=None, *args, **kwargs):
+        self.timeout = timeout
+        super(TimeoutAdapter, self).__init__(*args, **kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+        return super(TimeoutAdapter, self).send(request, **kwargs)
+
+
+class TLSAdapter(TimeoutAdapter):
     """
     A customized HTTP Adapter which uses TLS v1.2 for encrypted
     connections.
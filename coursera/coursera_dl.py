@@ -44,6 +44,7 @@ For further documentation and examples, visit the project's home at:
 import argparse
 import datetime
 import glob
+import itertools
 import json
 import logging
 import os
@@ -54,20 +55,32 @@ import sys
 import time
 
 from distutils.version import LooseVersion as V
+from multiprocessing.pool import ThreadPool
 
 import requests
+from requests.adapters import DEFAULT_POOLSIZE
 
-from six import iteritems
-
+from .cache import read_cache, write_cache
 from .cookies import (
     AuthenticationFailed, ClassNotFound,
-    get_cookies_for_class, make_cookie_values, login, TLSAdapter)
+    get_cookies_for_class, make_cookie_values, SessionLogin, TimeoutAdapter,
+    TLSAdapter)
 from .credentials import get_credentials, CredentialsError, keyring
-from .define import (CLASS_URL, ABOUT_URL, PATH_CACHE,
-                     OPENCOURSE_CONTENT_URL, OPENCOURSE_VIDEO_URL)
-from .downloaders import get_downloader
+from .define import (CLASS_URL, ABOUT_URL, PATH_CACHE, CONNECT_TIMEOUT,
+                     READ_TIMEOUT, OPENCOURSE_CONTENT_URL,
+                     OPENCOURSE_VIDEO_URL, PART_SUFFIX, URL_EXPIRY_MARGIN)
+from .downloaders import get_downloader, FSYNC_NONE, FSYNC_POLICIES
+from .filtering import SelectionPlan, ON_DEMAND_LECTURE_FORMATS
+from .integrity import DIGEST_ALGORITHMS, xxhash
+from .manifest import (DownloadManifest, MISSING, UNKNOWN, PARTIAL,
+                       COMPLETED)
+from .models import (Module, Section, Lecture, Resource,
+                     modules_to_json, modules_from_json)
+from .network import ConnectionPrewarmer, DnsCache
+from .ratelimit import RateSchedule
 from .utils import (clean_filename, get_anchor_format, mkdir_p, fix_url,
-                    decode_input, make_coursera_absolute_url)
+                    decode_input, make_coursera_absolute_url, json_loads,
+                    iter_json_items, get_url_expiry)
 
 # URL containing information about outdated modules
 _SEE_URL = " See https://github.com/coursera-dl/coursera/issues/139"
@@ -82,18 +95,43 @@ assert V(six.__version__) >= V('1.5'), "Upgrade six!" + _SEE_URL
 assert V(bs4.__version__) >= V('4.1'), "Upgrade bs4!" + _SEE_URL
 
 
+def get_urls_expiry(urls):
+    """
+    Return the time after which the first of the signed URLs expires, or
+    None if none of them expires.
+    """
+    expiries = [expiry for expiry in map(get_url_expiry, urls)
+                if expiry is not None]
+    return min(expiries) if expiries else None
+
+
 def get_on_demand_video_url(session, video_id, subtitle_language='all',
-                            resolution='720p'):
+                            resolution='720p', cache_ttl=None,
+                            refresh_cache=False):
     """
     Return the download URL of on-demand course video.
+
+    If cache_ttl (in seconds) is given, the result is kept in the on-disk
+    cache and reused for up to cache_ttl seconds, unless refresh_cache is
+    True or its signed URLs are about to expire.
     """
 
+    cache_key = '%s_%s_%s' % (video_id, resolution, subtitle_language)
+    if cache_ttl is not None and not refresh_cache:
+        video_content = read_cache('video', cache_key, cache_ttl)
+        expiry = get_urls_expiry((video_content or {}).values())
+        if expiry is not None and expiry < time.time() + URL_EXPIRY_MARGIN:
+            logging.debug('Cached URLs for video_id <%s> have expired.',
+                          video_id)
+        elif video_content is not None:
+            logging.debug('Using cached URLs for video_id <%s>.', video_id)
+            return video_content
+
     url = OPENCOURSE_VIDEO_URL.format(video_id=video_id)
-    page = get_page(session, url)
 
     logging.debug('Parsing JSON for video_id <%s>.', video_id)
     video_content = {}
-    dom = json.loads(page)
+    dom = get_page_json(session, url)
 
     # videos
     logging.info('Gathering video URLs for video_id <%s>.', video_id)
@@ -147,15 +185,19 @@ def get_on_demand_video_url(session, video_id, subtitle_language='all',
                     video_content[subtitle_language + '.' + subtitle_extension] = make_coursera_absolute_url(
                         subtitle_url)
 
+    if cache_ttl is not None:
+        write_cache('video', cache_key, video_content)
+
     return video_content
 
 
-def get_page(session, url):
+def get_reply(session, url, **kwargs):
     """
-    Download an HTML page using the requests session.
+    Request the given url using the requests session, raising an HTTPError
+    if the server replies with an error.
     """
 
-    r = session.get(url)
+    r = session.get(url, **kwargs)
 
     try:
         r.raise_for_status()
@@ -163,75 +205,224 @@ def get_page(session, url):
         logging.error("Error %s getting page %s", e, url)
         raise
 
-    return r.text
+    return r
 
 
-def get_session():
+def get_page(session, url):
     """
-    Create a session with TLS v1.2 certificate.
+    Download an HTML page using the requests session.
     """
 
+    return get_reply(session, url).text
+
+
+def get_page_json(session, url):
+    """
+    Download a JSON document using the requests session and deserialize it.
+    """
+
+    return json_loads(get_reply(session, url).content)
+
+
+def get_session(connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT,
+                pool_connections=DEFAULT_POOLSIZE, pool_maxsize=DEFAULT_POOLSIZE,
+                pool_block=False):
+    """
+    Create a session with TLS v1.2 certificate, whose requests time out
+    after the given seconds unless they say otherwise.
+
+    The session keeps the connections to pool_connections hosts, up to
+    pool_maxsize connections per host. If pool_block is True, a request
+    waits for a free connection instead of opening one that will not be
+    kept.
+    """
+
+    timeout = (connect_timeout, read_timeout)
+    pool_options = dict(pool_connections=pool_connections,
+                        pool_maxsize=pool_maxsize, pool_block=pool_block)
     session = requests.Session()
-    session.mount('https://', TLSAdapter())
+    session.mount('https://', TLSAdapter(timeout, **pool_options))
+    session.mount('http://', TimeoutAdapter(timeout, **pool_options))
 
     return session
 
 
-def get_on_demand_syllabus(session, class_name):
+def get_on_demand_syllabus(session, class_name, refresh_cache=False):
     """
     Get the on-demand course listing webpage.
+
+    The page is kept in the cache along with its ETag/Last-Modified
+    validators, so that later calls only download it again if it changed
+    on the server. If refresh_cache is True, the cached copy is ignored.
     """
 
     url = OPENCOURSE_CONTENT_URL.format(class_name=class_name)
-    page = get_page(session, url)
+
+    cached = None if refresh_cache else read_cache('syllabus', class_name)
+    headers = {}
+    if cached:
+        if cached.get('etag'):
+            headers['If-None-Match'] = cached['etag']
+        if cached.get('last_modified'):
+            headers['If-Modified-Since'] = cached['last_modified']
+
+    r = get_reply(session, url, headers=headers)
+
+    if cached and r.status_code == 304:
+        logging.info('Syllabus of %s not modified, using cached copy (%d bytes)',
+                     class_name, len(cached['page']))
+        return cached['page']
+
+    page = r.text
     logging.info('Downloaded %s (%d bytes)', url, len(page))
 
+    etag = r.headers.get('ETag')
+    last_modified = r.headers.get('Last-Modified')
+    if etag or last_modified:
+        write_cache('syllabus', class_name, {
+            'etag': etag,
+            'last_modified': last_modified,
+            'page': page,
+        })
+
     return page
 
 
-def parse_on_demand_syllabus(session, page, reverse=False, intact_fnames=False,
-                             subtitle_language='en', video_resolution=None):
+def iter_on_demand_lectures(session, page, reverse=False, intact_fnames=False,
+                            subtitle_language='en', video_resolution=None,
+                            resolve_jobs=1, cache_ttl=None,
+                            refresh_cache=False, selection=None,
+                            prewarmer=None):
     """
-    Parse a Coursera on-demand course listing/syllabus page.
+    Parse a Coursera on-demand course listing/syllabus page, yielding its
+    lectures as soon as their video URLs are resolved.
+
+    Each item is a (module_slug, section_slug, Lecture) tuple and the items
+    come in syllabus order (modules reversed if requested).
+    The video URLs are resolved ahead of the consumer by a pool of
+    `resolve_jobs` threads.
+
+    If a SelectionPlan is given, the lectures that it rules out are not
+    resolved at all and are yielded with no resources, so that the
+    numbering of the remaining lectures doesn't change.
+
+    If a ConnectionPrewarmer is given, it opens the connections to the
+    hosts of the resources as soon as they are resolved.
+
+    See get_on_demand_video_url for the meaning of cache_ttl and
+    refresh_cache.
     """
 
-    dom = json.loads(page)
+    def warm(video_content):
+        for url in video_content.values():
+            prewarmer.warm(url)
 
     logging.info('Parsing syllabus of on-demand course. '
                  'This may take some time, be patient ...')
+
+    json_modules = iter_json_items(page, 'courseMaterial.elements')
+    if reverse:
+        json_modules = list(json_modules)[::-1]
+
+    pool = ThreadPool(max(1, resolve_jobs))
+    try:
+        # Queue the resolution of every video in the order in which they
+        # will be consumed, so that the pool works ahead of the consumer.
+        pending_lectures = []
+        for module in json_modules:
+            module_slug = module['slug']
+            json_sections = module['elements']
+            for section in json_sections:
+                section_slug = section['slug']
+                json_lectures = section['elements']
+                for lecture in json_lectures:
+                    lecture_slug = lecture['slug']
+                    if lecture['content']['typeName'] != 'lecture':
+                        continue
+
+                    if selection and not selection.wants(
+                            section_slug, lecture_slug,
+                            ON_DEMAND_LECTURE_FORMATS):
+                        logging.debug('Not resolving filtered out lecture %s',
+                                      lecture_slug)
+                        pending_lectures.append(
+                            (module_slug, section_slug, lecture_slug, None))
+                    else:
+                        lecture_video_id = lecture['content']['definition']['videoId']
+                        pending = pool.apply_async(get_on_demand_video_url,
+                                                   (session,
+                                                    lecture_video_id,
+                                                    subtitle_language,
+                                                    video_resolution,
+                                                    cache_ttl,
+                                                    refresh_cache),
+                                                   callback=prewarmer and warm)
+                        pending_lectures.append(
+                            (module_slug, section_slug, lecture_slug, pending))
+        pool.close()
+
+        for module_slug, section_slug, lecture_slug, pending in pending_lectures:
+            if pending is None:
+                yield (module_slug, section_slug, Lecture(lecture_slug))
+                continue
+
+            video_content = pending.get()
+            resources = [Resource(fmt, url)
+                         for fmt, url in video_content.items()]
+
+            if resources:
+                yield (module_slug, section_slug,
+                       Lecture(lecture_slug, resources))
+    finally:
+        pool.terminate()
+
+
+def group_on_demand_lectures(lectures):
+    """
+    Group the lectures yielded by iter_on_demand_lectures into modules and
+    sections.
+
+    This yields the same Modules as parse_on_demand_syllabus returns, but
+    their sections and lectures are generators, so they must be consumed
+    in order and only once.
+    """
+
+    def _lectures(items):
+        for _module_slug, _section_slug, lecture in items:
+            yield lecture
+
+    def _sections(items):
+        for section_slug, section_items in itertools.groupby(
+                items, key=lambda item: item[1]):
+            yield Section(section_slug, _lectures(section_items))
+
+    for module_slug, module_items in itertools.groupby(
+            lectures, key=lambda item: item[0]):
+        yield Module(module_slug, _sections(module_items))
+
+
+def parse_on_demand_syllabus(session, page, reverse=False, intact_fnames=False,
+                             subtitle_language='en', video_resolution=None,
+                             resolve_jobs=1, cache_ttl=None,
+                             refresh_cache=False, selection=None,
+                             prewarmer=None):
+    """
+    Parse a Coursera on-demand course listing/syllabus page.
+
+    Returns the list of Modules of the course, with all video URLs
+    resolved. See iter_on_demand_lectures for the parameters.
+    """
+
+    lectures = iter_on_demand_lectures(session, page, reverse, intact_fnames,
+                                       subtitle_language, video_resolution,
+                                       resolve_jobs, cache_ttl, refresh_cache,
+                                       selection, prewarmer)
+
     modules = []
-    json_modules = dom['courseMaterial']['elements']
-    for module in json_modules:
-        module_slug = module['slug']
-        sections = []
-        json_sections = module['elements']
-        for section in json_sections:
-            section_slug = section['slug']
-            lectures = []
-            json_lectures = section['elements']
-            for lecture in json_lectures:
-                lecture_slug = lecture['slug']
-                if lecture['content']['typeName'] == 'lecture':
-                    lecture_video_id = lecture['content']['definition']['videoId']
-                    video_content = get_on_demand_video_url(session,
-                                                            lecture_video_id,
-                                                            subtitle_language,
-                                                            video_resolution)
-                    lecture_video_content = {}
-                    for key, value in video_content.items():
-                        lecture_video_content[key] = [(value, '')]
-
-                    if lecture_video_content:
-                        lectures.append((lecture_slug, lecture_video_content))
-
-            if lectures:
-                sections.append((section_slug, lectures))
-
-        if sections:
-            modules.append((module_slug, sections))
-
-    if modules and reverse:
-        modules.reverse()
+    for module in group_on_demand_lectures(lectures):
+        module.sections = [Section(section.name, list(section.lectures))
+                           for section in module.sections]
+        modules.append(module)
 
     return modules
 
@@ -277,7 +468,7 @@ def format_combine_number_resource(secnum, lecnum, lecname, title, fmt):
 
 def find_resources_to_get(lecture, file_formats, resource_filter, ignored_formats=None):
     """
-    Select formats to download.
+    Select the Resources of the given Lecture to download.
     """
     resources_to_get = []
 
@@ -287,22 +478,20 @@ def find_resources_to_get(lecture, file_formats, resource_filter, ignored_format
     if len(ignored_formats):
         logging.info("The following file formats will be ignored: " + ",".join(ignored_formats))
 
-    for fmt, resources in iteritems(lecture):
+    for resource in lecture.resources:
 
-        fmt0 = fmt
-        if '.' in fmt:
-            fmt = fmt.split('.')[1]
+        fmt = resource.extension
 
         if fmt in ignored_formats:
             continue
 
         if fmt in file_formats or 'all' in file_formats:
-            for r in resources:
-                if resource_filter and r[1] and not re.search(resource_filter, r[1]):
-                    logging.debug('Skipping b/c of rf: %s %s',
-                                  resource_filter, r[1])
-                    continue
-                resources_to_get.append((fmt0, r[0], r[1]))
+            if resource_filter and resource.title and not re.search(
+                    resource_filter, resource.title):
+                logging.debug('Skipping b/c of rf: %s %s',
+                              resource_filter, resource.title)
+                continue
+            resources_to_get.append(resource)
         else:
             logging.debug(
                     'Skipping b/c format %s not in %s', fmt, file_formats)
@@ -330,23 +519,29 @@ def download_lectures(downloader,
                       resume=False,
                       video_resolution='720p'):
     """
-    Download lecture resources described by sections.
+    Download lecture resources described by the given Sections.
+
+    If the downloader has a manifest, it tells which files are complete and
+    which ones have to be resumed.
 
     Returns True if the class appears completed, False otherwise.
     """
     last_update = -1
+    manifest = downloader.manifest
+    selection = SelectionPlan(file_formats, section_filter, lecture_filter,
+                              ignored_formats)
 
-    for (secnum, (section, lectures)) in enumerate(sections):
-        if section_filter and not re.search(section_filter, section):
+    for (secnum, section) in enumerate(sections):
+        if not selection.wants_section(section.name):
             logging.debug('Skipping b/c of sf: %s %s', section_filter,
-                          section)
+                          section.name)
             continue
 
         sec = os.path.join(path, class_name,
-                           format_section(secnum + 1, section, class_name, verbose_dirs))
-        for (lecnum, (lecname, lecture)) in enumerate(lectures):
-            if lecture_filter and not re.search(lecture_filter,
-                                                lecname):
+                           format_section(secnum + 1, section.name, class_name, verbose_dirs))
+        for (lecnum, lecture) in enumerate(section.lectures):
+            lecname = lecture.name
+            if not selection.wants_lecture(lecname):
                 logging.debug('Skipping b/c of lf: %s %s', lecture_filter,
                               lecname)
                 continue
@@ -360,7 +555,8 @@ def download_lectures(downloader,
                                                      ignored_formats)
 
             # write lecture resources
-            for fmt, url, title in resources_to_get:
+            for resource in resources_to_get:
+                fmt, url, title = resource.fmt, resource.url, resource.title
 
                 if combined_section_lectures_nums:
                     lecfn = os.path.join(
@@ -371,10 +567,25 @@ def download_lectures(downloader,
                     lecfn = os.path.join(
                             sec, format_resource(lecnum + 1, lecname, title, fmt))
 
-                if overwrite or not os.path.exists(lecfn) or resume:
+                if manifest is not None:
+                    state = manifest.get_state(lecfn)
+                elif os.path.exists(lecfn):
+                    state = UNKNOWN
+                elif os.path.exists(lecfn + PART_SUFFIX):
+                    state = PARTIAL
+                else:
+                    state = MISSING
+
+                # complete files are only written by complete downloads, so
+                # --resume only checks the files of older versions
+                if (overwrite or state in (MISSING, PARTIAL) or
+                        (resume and state == UNKNOWN)):
                     if not skip_download:
+                        # downloads interrupted in previous runs are resumed
+                        resume_file = not overwrite and (resume or
+                                                         state == PARTIAL)
                         logging.info('Downloading: %s', lecfn)
-                        downloader.download(url, lecfn, resume=resume)
+                        downloader.download(url, lecfn, resume=resume_file)
                     else:
                         open(lecfn, 'w').close()  # touch
                     last_update = time.time()
@@ -382,7 +593,15 @@ def download_lectures(downloader,
                     logging.info('%s already downloaded', lecfn)
                     # if this file hasn't been modified in a long time,
                     # record that time
-                    last_update = max(last_update, os.path.getmtime(lecfn))
+                    if state == COMPLETED:
+                        updated = manifest.get(lecfn)['updated']
+                    else:
+                        updated = os.path.getmtime(lecfn)
+                    last_update = max(last_update, updated)
+
+        # Playlists and hooks need the files of the section.
+        if playlist or hooks:
+            downloader.join()
 
         # After fetching resources, create a playlist in M3U format with the
         # videos downloaded.
@@ -558,6 +777,24 @@ def parse_args(args=None):
                                    default=None,
                                    help='use aria2 for downloading,'
                                         ' optionally specify aria2 bin')
+    group_external_dl.add_argument('--aria2-rpc',
+                                   dest='aria2_rpc',
+                                   action='store',
+                                   nargs='?',
+                                   const='',
+                                   default=None,
+                                   help='hand the files to a long-lived aria2'
+                                        ' over JSON-RPC: the aria2c of'
+                                        ' --aria2, started once for the whole'
+                                        ' run, or the one listening at the'
+                                        ' given URL (e.g.'
+                                        ' http://localhost:6800/jsonrpc)')
+    group_external_dl.add_argument('--aria2-rpc-secret',
+                                   dest='aria2_rpc_secret',
+                                   action='store',
+                                   default=None,
+                                   help='secret token of the aria2 given to'
+                                        ' --aria2-rpc')
     group_external_dl.add_argument('--axel',
                                    dest='axel',
                                    action='store',
@@ -571,7 +808,9 @@ def parse_args(args=None):
                         dest='resume',
                         action='store_true',
                         default=False,
-                        help='resume incomplete downloads (default: False)')
+                        help='resume the files of older versions, which'
+                             ' may be incomplete; interrupted downloads are'
+                             ' always resumed (default: False)')
 
     parser.add_argument('-o',
                         '--overwrite',
@@ -663,6 +902,226 @@ def parse_args(args=None):
                                 default=False,
                                 help='generate M3U playlists for course weeks')
 
+    group_adv_misc.add_argument('--resolve-jobs',
+                                dest='resolve_jobs',
+                                type=int,
+                                default=4,
+                                help='number of lectures whose video URLs are'
+                                     ' resolved in parallel (default: 4)')
+
+    group_adv_misc.add_argument('-j',
+                                '--jobs',
+                                dest='jobs',
+                                type=int,
+                                default=1,
+                                help='number of files downloaded in parallel'
+                                     ' (default: 1)')
+
+    group_adv_misc.add_argument('--asyncio',
+                                dest='asyncio',
+                                action='store_true',
+                                default=False,
+                                help='download with the asyncio native'
+                                     ' downloader (needs Python 3.5+ and'
+                                     ' aiohttp), running up to --jobs'
+                                     ' downloads in one thread')
+
+    group_adv_misc.add_argument('--max-per-host',
+                                dest='max_per_host',
+                                type=int,
+                                default=4,
+                                help='maximum number of parallel downloads'
+                                     ' from the same host (default: 4)')
+
+    group_adv_misc.add_argument('--segments',
+                                dest='segments',
+                                type=int,
+                                default=1,
+                                help='number of connections used by the native'
+                                     ' downloader for each big file'
+                                     ' (default: 1)')
+
+    group_adv_misc.add_argument('--segment-threshold',
+                                dest='segment_threshold',
+                                type=int,
+                                default=20,
+                                help='size in MB from which files are'
+                                     ' downloaded in segments (default: 20)')
+
+    group_adv_misc.add_argument('--chunk-size',
+                                dest='chunk_size',
+                                type=int,
+                                default=1024,
+                                help='size in KB of the buffer used by the'
+                                     ' native downloader (default: 1024)')
+
+    group_adv_misc.add_argument('--write-behind',
+                                dest='write_behind',
+                                type=int,
+                                default=0,
+                                help='number of chunks that the native'
+                                     ' downloader may read ahead while a'
+                                     ' background thread writes them to disk'
+                                     ' (default: 0, write in the same thread)')
+
+    group_adv_misc.add_argument('--fsync',
+                                dest='fsync',
+                                choices=FSYNC_POLICIES,
+                                default=FSYNC_NONE,
+                                help='when to flush the downloaded files to'
+                                     ' disk: leave it to the OS, after each'
+                                     ' file, or at the end of each course'
+                                     ' (default: none)')
+
+    group_adv_misc.add_argument('--retries',
+                                dest='retries',
+                                type=int,
+                                default=4,
+                                help='number of times that a failed or'
+                                     ' interrupted download is retried'
+                                     ' (default: 4)')
+
+    group_adv_misc.add_argument('--retry-budget',
+                                dest='retry_budget',
+                                type=int,
+                                default=0,
+                                help='maximum number of retries of all the'
+                                     ' files of a class together'
+                                     ' (default: 0, no limit)')
+
+    group_adv_misc.add_argument('--retry-max-delay',
+                                dest='retry_max_delay',
+                                type=int,
+                                default=120,
+                                help='longest wait in seconds before a'
+                                     ' retry, even if the server asks for'
+                                     ' more with Retry-After (default: 120)')
+
+    group_adv_misc.add_argument('--connect-timeout',
+                                dest='connect_timeout',
+                                type=float,
+                                default=CONNECT_TIMEOUT,
+                                help='seconds to wait for a connection to a'
+                                     ' server (default: %d)' % CONNECT_TIMEOUT)
+
+    group_adv_misc.add_argument('--read-timeout',
+                                dest='read_timeout',
+                                type=float,
+                                default=READ_TIMEOUT,
+                                help='seconds to wait for data from a server'
+                                     ' before giving up on the request'
+                                     ' (default: %d)' % READ_TIMEOUT)
+
+    group_adv_misc.add_argument('--pool-connections',
+                                dest='pool_connections',
+                                type=int,
+                                default=DEFAULT_POOLSIZE,
+                                help='number of hosts whose connections are'
+                                     ' kept open for the next requests'
+                                     ' (default: %d)' % DEFAULT_POOLSIZE)
+
+    group_adv_misc.add_argument('--pool-maxsize',
+                                dest='pool_maxsize',
+                                type=int,
+                                default=0,
+                                help='number of connections kept open to'
+                                     ' each host (default: 0, enough for'
+                                     ' --jobs, --segments and --resolve-jobs)')
+
+    group_adv_misc.add_argument('--pool-block',
+                                dest='pool_block',
+                                action='store_true',
+                                default=False,
+                                help='wait for a free connection to a host'
+                                     ' instead of opening more than'
+                                     ' --pool-maxsize of them')
+
+    group_adv_misc.add_argument('--dns-cache-ttl',
+                                dest='dns_cache_ttl',
+                                type=int,
+                                default=300,
+                                help='seconds during which the address of a'
+                                     ' host is reused instead of resolved'
+                                     ' again (default: 300, 0 to disable)')
+
+    group_adv_misc.add_argument('--prewarm',
+                                dest='prewarm',
+                                action='store_true',
+                                default=False,
+                                help='open the connections to the hosts of'
+                                     ' the videos and subtitles while the'
+                                     ' syllabus is being resolved (native'
+                                     ' downloader only)')
+
+    group_adv_misc.add_argument('--stall-speed',
+                                dest='stall_speed',
+                                type=int,
+                                default=10,
+                                help='restart the native downloads whose'
+                                     ' speed stays under this many KB/s for'
+                                     ' --stall-time seconds from where they'
+                                     ' stopped (default: 10, 0 to disable)')
+
+    group_adv_misc.add_argument('--stall-time',
+                                dest='stall_time',
+                                type=int,
+                                default=60,
+                                help='seconds under --stall-speed after which'
+                                     ' a download is restarted (default: 60)')
+
+    group_adv_misc.add_argument('--digest',
+                                dest='digest',
+                                choices=DIGEST_ALGORITHMS + ('none',),
+                                default='sha256',
+                                help='digest that the native downloader'
+                                     ' computes while writing each file and'
+                                     ' records in the manifest; files that'
+                                     ' fail the size or digest check are'
+                                     ' downloaded again (default: sha256)')
+
+    group_adv_misc.add_argument('--limit-rate',
+                                dest='limit_rate',
+                                action='store',
+                                default=None,
+                                help='maximum total download speed in bytes'
+                                     ' per second, with an optional K, M or'
+                                     ' G suffix (e.g. 20M). Default: no limit')
+
+    group_adv_misc.add_argument('--limit-schedule',
+                                dest='limit_schedule',
+                                action='store',
+                                default=None,
+                                help='comma separated speed limits for times'
+                                     ' of the day, overriding --limit-rate'
+                                     ' (e.g. "09:00-18:00=20M,'
+                                     '22:00-06:00=0", where 0 means no'
+                                     ' limit)')
+
+    group_adv_misc.add_argument('--batch',
+                                dest='batch',
+                                action='store_true',
+                                default=False,
+                                help='run the external downloader once for'
+                                     ' all the files of the class instead of'
+                                     ' once per file (aria2 and curl only)')
+
+    group_adv_misc.add_argument('--metadata-ttl',
+                                dest='metadata_ttl',
+                                type=float,
+                                default=24,
+                                help='hours during which the video metadata'
+                                     ' of a lecture is reused from the cache,'
+                                     ' unless its URLs are about to expire;'
+                                     ' 0 disables the cache (default: 24)')
+
+    group_adv_misc.add_argument('--refresh-metadata',
+                                dest='refresh_metadata',
+                                action='store_true',
+                                default=False,
+                                help='ignore the cached syllabus and video'
+                                     ' metadata and fetch them again'
+                                     ' (default: False)')
+
     # Debug options
     group_debug = parser.add_argument_group('Debugging options')
 
@@ -681,8 +1140,10 @@ def parse_args(args=None):
     group_debug.add_argument('-l',  # FIXME: remove short option from rarely used ones
                              '--process_local_page',
                              dest='local_page',
-                             help='uses or creates local cached version of syllabus'
-                                  ' page')
+                             help='uses or creates a local snapshot of the'
+                                  ' syllabus and of the video URLs of the class;'
+                                  ' with several classes, the path must contain'
+                                  ' {class_name}')
 
     # Final parsing of the options
     args = parser.parse_args(args)
@@ -715,6 +1176,64 @@ def parse_args(args=None):
         logging.warning('The python module `keyring` not found.')
         args.use_keyring = False
 
+    if args.resolve_jobs < 1:
+        logging.error('--resolve-jobs must be at least 1')
+        sys.exit(1)
+
+    if (args.jobs < 1 or args.max_per_host < 1 or args.segments < 1 or
+            args.chunk_size < 1):
+        logging.error('--jobs, --max-per-host, --segments and --chunk-size'
+                      ' must be at least 1')
+        sys.exit(1)
+
+    if args.connect_timeout <= 0 or args.read_timeout <= 0:
+        logging.error('--connect-timeout and --read-timeout must be positive')
+        sys.exit(1)
+
+    if (args.pool_connections < 1 or args.pool_maxsize < 0 or
+            args.dns_cache_ttl < 0):
+        logging.error('--pool-connections must be at least 1, and'
+                      ' --pool-maxsize and --dns-cache-ttl must not be'
+                      ' negative')
+        sys.exit(1)
+
+    if not args.pool_maxsize:
+        args.pool_maxsize = max(DEFAULT_POOLSIZE, args.jobs * args.segments,
+                                args.resolve_jobs)
+
+    if args.stall_speed > 0 and args.stall_time <= 0:
+        logging.error('--stall-time must be positive')
+        sys.exit(1)
+
+    if (args.write_behind < 0 or args.retries < 0 or args.retry_budget < 0 or
+            args.retry_max_delay < 0):
+        logging.error('--write-behind, --retries, --retry-budget and'
+                      ' --retry-max-delay must not be negative')
+        sys.exit(1)
+
+    if args.digest == 'xxhash' and xxhash is None:
+        logging.error('--digest xxhash needs the xxhash module.')
+        sys.exit(1)
+
+    try:
+        args.rate_schedule = RateSchedule.parse(args.limit_rate,
+                                                args.limit_schedule)
+    except ValueError as e:
+        logging.error('Invalid --limit-rate or --limit-schedule: %s', e)
+        sys.exit(1)
+
+    # the metadata cache works with seconds
+    if args.metadata_ttl > 0:
+        args.metadata_ttl = args.metadata_ttl * 60 * 60
+    else:
+        args.metadata_ttl = None
+
+    if (args.local_page and len(args.class_names) > 1 and
+            '{class_name}' not in args.local_page):
+        logging.error('--process_local_page needs {class_name} in the path'
+                      ' when downloading several classes')
+        sys.exit(1)
+
     if args.cookies_file and not os.path.exists(args.cookies_file):
         logging.error('Cookies file not found: %s', args.cookies_file)
         sys.exit(1)
@@ -731,69 +1250,215 @@ def parse_args(args=None):
     return args
 
 
-def download_on_demand_class(args, class_name):
+def get_snapshot_path(local_page, class_name):
+    """
+    Return the path of the snapshot of the given class.
+    """
+    return local_page.replace('{class_name}', class_name)
+
+
+def save_on_demand_snapshot(path, class_name, page, modules):
+    """
+    Save the syllabus page and the parsed modules (with the resolved video
+    and subtitle URLs) of an on-demand class to a snapshot file.
+    """
+    snapshot = {
+        'class_name': class_name,
+        'created': time.time(),
+        'syllabus': page,
+        'modules': modules_to_json(modules),
+    }
+
+    with open(path, 'w') as f:
+        json.dump(snapshot, f)
+
+    logging.info('Saved snapshot of %s to %s', class_name, path)
+
+
+def load_on_demand_snapshot(path, class_name):
+    """
+    Load the modules of an on-demand class from a snapshot file.
+
+    Returns None if the snapshot belongs to another class.
+    """
+    with open(path) as f:
+        snapshot = json.load(f)
+
+    if snapshot.get('class_name') != class_name:
+        logging.warning('Snapshot %s is for class %s, not %s; ignoring it.',
+                        path, snapshot.get('class_name'), class_name)
+        return None
+
+    logging.info('Loaded snapshot of %s from %s', class_name, path)
+    modules = modules_from_json(snapshot['modules'])
+
+    expiry = get_urls_expiry(resource.url
+                             for module in modules
+                             for section in module.sections
+                             for lecture in section.lectures
+                             for resource in lecture.resources)
+    if expiry is not None and expiry < time.time():
+        logging.warning('The video URLs of snapshot %s expired on %s, so '
+                        'their downloads will fail; remove the snapshot to '
+                        'resolve them again.', path,
+                        time.strftime('%Y-%m-%d %H:%M',
+                                      time.localtime(expiry)))
+    return modules
+
+
+def get_on_demand_modules(session, args, class_name, snapshot_path,
+                          ignored_formats, prewarmer=None):
+    """
+    Get the syllabus of the class and return its modules, saving them to
+    the snapshot_path, if any.
+
+    Without a snapshot, the lectures are streamed: downloads start while
+    the rest of the syllabus is still being resolved, and the lectures that
+    are not going to be downloaded are not resolved.
+    """
+
+    page = get_on_demand_syllabus(session, class_name, args.refresh_metadata)
+
+    if snapshot_path:
+        # a snapshot has to be complete, so parse everything up front
+        modules = parse_on_demand_syllabus(session, page,
+                                           False,
+                                           args.intact_fnames,
+                                           args.subtitle_language,
+                                           args.video_resolution,
+                                           args.resolve_jobs,
+                                           args.metadata_ttl,
+                                           args.refresh_metadata,
+                                           prewarmer=prewarmer)
+        save_on_demand_snapshot(snapshot_path, class_name, page, modules)
+        if args.reverse:
+            modules.reverse()
+        return modules
+
+    selection = SelectionPlan(args.file_formats,
+                              args.section_filter,
+                              args.lecture_filter,
+                              ignored_formats)
+    lectures = iter_on_demand_lectures(session, page,
+                                       args.reverse,
+                                       args.intact_fnames,
+                                       args.subtitle_language,
+                                       args.video_resolution,
+                                       args.resolve_jobs,
+                                       args.metadata_ttl,
+                                       args.refresh_metadata,
+                                       selection,
+                                       prewarmer)
+    return group_on_demand_lectures(lectures)
+
+
+def get_session_login(args):
+    """
+    Create the session of a run, to be logged in by the returned
+    SessionLogin when needed.
+    """
+
+    session = get_session(args.connect_timeout, args.read_timeout,
+                          args.pool_connections, args.pool_maxsize,
+                          args.pool_block)
+    return SessionLogin(session, args.username, args.password)
+
+
+def download_on_demand_class(args, class_name, session_login=None):
     """
     Download all requested resources from the on-demand class given in class_name.
 
+    The session of session_login (by default, a new one) is logged in
+    unless it already is, so that it can be shared by several classes.
+
     Returns True if the class appears completed.
     """
 
-    session = get_session()
-    login(session, args.username, args.password)
+    if session_login is None:
+        session_login = get_session_login(args)
+    session = session_login.session
 
-    # get the syllabus listing
-    page = get_on_demand_syllabus(session, class_name)
+    modules = None
+    snapshot_path = None
+    if args.local_page:
+        snapshot_path = get_snapshot_path(args.local_page, class_name)
+        if os.path.exists(snapshot_path):
+            modules = load_on_demand_snapshot(snapshot_path, class_name)
+
+    # With a snapshot and no downloads, we don't talk to Coursera at all.
+    if modules is None or not args.skip_download:
+        session_login.ensure_logged_in()
 
     ignored_formats = []
     if args.ignore_formats:
         ignored_formats = args.ignore_formats.split(",")
 
-    # parse it
-    modules = parse_on_demand_syllabus(session, page,
-                                       args.reverse,
-                                       args.intact_fnames,
-                                       args.subtitle_language,
-                                       args.video_resolution)
-
     downloader = get_downloader(session, class_name, args)
 
-    # obtain the resources
+    # only the downloads through the session can use its connections, which
+    # are opened while the syllabus is being resolved
+    prewarmer = None
+    if args.prewarm and downloader.uses_session_pool:
+        prewarmer = ConnectionPrewarmer(
+            session, min(args.jobs * args.segments, args.pool_maxsize))
+
     completed = True
-    for idx, module in enumerate(modules):
-        module_name = '%02d_%s' % (idx + 1, module[0])
-        sections = module[1]
-
-        result = download_lectures(
-                downloader,
-                module_name,
-                sections,
-                args.file_formats,
-                args.overwrite,
-                args.skip_download,
-                args.section_filter,
-                args.lecture_filter,
-                args.resource_filter,
-                os.path.join(args.path, class_name),
-                args.verbose_dirs,
-                args.preview,
-                args.combined_section_lectures_nums,
-                args.hooks,
-                args.playlist,
-                args.intact_fnames,
-                ignored_formats,
-                args.resume
-        )
-        completed = completed and result
+    try:
+        if modules is None:
+            modules = get_on_demand_modules(session, args, class_name,
+                                            snapshot_path, ignored_formats,
+                                            prewarmer)
+        elif args.reverse:
+            modules.reverse()
+
+        class_path = os.path.join(args.path, class_name)
+        mkdir_p(class_path)
+        downloader.manifest = DownloadManifest(class_path)
+
+        # obtain the resources
+        for idx, module in enumerate(modules):
+            module_name = '%02d_%s' % (idx + 1, module.name)
+            sections = module.sections
+
+            result = download_lectures(
+                    downloader,
+                    module_name,
+                    sections,
+                    args.file_formats,
+                    args.overwrite,
+                    args.skip_download,
+                    args.section_filter,
+                    args.lecture_filter,
+                    args.resource_filter,
+                    class_path,
+                    args.verbose_dirs,
+                    args.preview,
+                    args.combined_section_lectures_nums,
+                    args.hooks,
+                    args.playlist,
+                    args.intact_fnames,
+                    ignored_formats,
+                    args.resume
+            )
+            completed = completed and result
+
+        downloader.join()
+    finally:
+        if prewarmer:
+            prewarmer.close()
+        downloader.close()
+        if downloader.manifest:
+            downloader.manifest.close()
 
     return completed
 
 
-def download_class(args, class_name):
+def download_class(args, class_name, session_login=None):
     """
     Returns True if the class appears completed.
     """
     logging.debug('Downloading new style (on demand) class %s', class_name)
-    return download_on_demand_class(args, class_name)
+    return download_on_demand_class(args, class_name, session_login)
 
 
 def main():
@@ -808,10 +1473,16 @@ def main():
     if args.clear_cache:
         shutil.rmtree(PATH_CACHE)
 
+    if args.dns_cache_ttl:
+        DnsCache(args.dns_cache_ttl).install()
+
+    # one session, logged in once, for all the classes
+    session_login = get_session_login(args)
+
     for class_name in args.class_names:
         try:
             logging.info('Downloading class: %s', class_name)
-            if download_class(args, class_name):
+            if download_class(args, class_name, session_login):
                 completed_classes.append(class_name)
         except requests.exceptions.HTTPError as e:
             logging.error('HTTPError %s', e)
@@ -36,3 +36,17 @@ else:
 
 PATH_CACHE = os.path.join(tempfile.gettempdir(), _USER + "_coursera_dl_cache")
 PATH_COOKIES = os.path.join(PATH_CACHE, 'cookies')
+PATH_METADATA = os.path.join(PATH_CACHE, 'metadata')
+
+# Default timeouts, in seconds, to connect to a server and between two reads
+# from it.
+CONNECT_TIMEOUT = 30
+READ_TIMEOUT = 60
+
+# Cached video URLs that expire within this many seconds are resolved again,
+# so that they still work when their downloads start.
+URL_EXPIRY_MARGIN = 30 * 60
+
+# Suffix of the files that are being downloaded; they are renamed to their
+# final name once complete.
+PART_SUFFIX = '.part'
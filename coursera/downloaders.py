@@ -9,15 +9,61 @@ namely, aria2c, axel, curl, and wget.
 
 from __future__ import print_function
 
+import collections
+import io
 import logging
 import math
 import os
+import random
+import re
 import requests
+import shutil
+import socket
 import subprocess
 import sys
+import tempfile
+import threading
 import time
 
+from contextlib import contextmanager
+from email.utils import mktime_tz, parsedate_tz
+
+from multiprocessing.pool import ThreadPool
+
 from six import iteritems
+from six.moves import http_client, http_cookiejar, queue
+from six.moves.urllib_parse import urlparse
+
+try:  # Workaround for broken Debian/Ubuntu packages? (See issue #331)
+    from requests.packages.urllib3.exceptions import HTTPError as Urllib3Error
+except ImportError:
+    from urllib3.exceptions import HTTPError as Urllib3Error
+
+from .define import PART_SUFFIX
+from .integrity import (format_digest, get_expected_digest, hash_file,
+                        new_hasher)
+from .progress import ProgressRenderer, format_bytes, format_speed
+from .ratelimit import TokenBucket
+from .utils import replace_file
+
+# When the downloaded files are flushed to disk: never explicitly (leave it
+# to the OS), after each file or once at the end of the course.
+FSYNC_NONE = 'none'
+FSYNC_FILE = 'file'
+FSYNC_COURSE = 'course'
+FSYNC_POLICIES = (FSYNC_NONE, FSYNC_FILE, FSYNC_COURSE)
+
+# Errors of the connection while the body of a response is read
+NETWORK_ERRORS = (socket.error, http_client.HTTPException, Urllib3Error,
+                  requests.exceptions.RequestException)
+
+
+def fsync_file(filename):
+    """
+    Flush the contents of a file to disk.
+    """
+    with open(filename, 'ab') as f:
+        os.fsync(f.fileno())
 
 
 class Downloader(object):
@@ -26,6 +72,16 @@ class Downloader(object):
 
     Every subclass should implement the _start_download method.
 
+    A file is downloaded to its name plus PART_SUFFIX, and renamed to its
+    name once complete, so an existing file is always a complete one. The
+    partial file is kept if the download fails, to be resumed later.
+
+    If a DownloadManifest is assigned to the manifest attribute, the
+    downloads are recorded in it. The fsync attribute tells when the
+    downloaded files are flushed to disk (one of FSYNC_POLICIES). If a
+    ratelimit.TokenBucket is assigned to the limiter attribute, the
+    downloads keep under its speed limit.
+
     Usage::
 
       >>> import downloaders
@@ -33,6 +89,48 @@ class Downloader(object):
       >>> d.download('http://example.com', 'save/to/this/file')
     """
 
+    manifest = None
+    fsync = FSYNC_NONE
+    limiter = None
+
+    # Whether the downloads use the connection pools of the session
+    uses_session_pool = False
+
+    _unsynced = None
+    _unsynced_lock = threading.Lock()
+
+    def _sync(self, filename):
+        """
+        Apply the fsync policy to a file that has just been downloaded.
+
+        Returns False if the file could not be flushed to disk.
+        """
+        if self.fsync == FSYNC_COURSE:
+            with self._unsynced_lock:
+                if self._unsynced is None:
+                    self._unsynced = []
+                self._unsynced.append(filename)
+        elif self.fsync == FSYNC_FILE:
+            try:
+                fsync_file(filename)
+            except (IOError, OSError) as e:
+                logging.error('Could not flush %s to disk: %s', filename, e)
+                return False
+        return True
+
+    def _sync_all(self):
+        """
+        Flush to disk the files whose flush was put off to the end of the
+        course.
+        """
+        with self._unsynced_lock:
+            unsynced, self._unsynced = self._unsynced or [], None
+        for filename in unsynced:
+            try:
+                fsync_file(filename)
+            except (IOError, OSError) as e:
+                logging.error('Could not flush %s to disk: %s', filename, e)
+
     def _start_download(self, url, filename, resume):
         """
         Actual method to download the given url to the given file.
@@ -40,25 +138,363 @@ class Downloader(object):
         """
         raise NotImplementedError("Subclasses should implement this")
 
+    def _get_part(self, filename, resume):
+        """
+        Return the name of the partial file to download filename to.
+
+        When resuming a file that was written in place by an older version
+        (so that there is no partial file), the file becomes the partial
+        file.
+        """
+        part = filename + PART_SUFFIX
+        if resume and not os.path.exists(part) and os.path.exists(filename):
+            os.rename(filename, part)
+        return part
+
+    def _finish(self, filename, ok):
+        """
+        Move the partial file of a finished download into place, apply the
+        fsync policy and record the result in the manifest.
+
+        Returns False if the download failed.
+        """
+        if ok:
+            try:
+                replace_file(filename + PART_SUFFIX, filename)
+            except OSError as e:
+                logging.error('Could not move %s into place: %s', filename, e)
+                ok = False
+
+        ok = ok and self._sync(filename)
+
+        if self.manifest:
+            if not self.manifest.finish(filename, ok):
+                ok = False
+
+        return ok
+
     def download(self, url, filename, resume=False):
         """
-        Download the given url to the given file. When the download
-        is aborted by the user, the partially downloaded file is also removed.
+        Download the given url to the given file, through its partial file.
+        When the download is aborted by the user, the partial file is kept
+        to be resumed by the next run.
+
+        Returns False if the download failed.
         """
 
+        if self.manifest:
+            self.manifest.start(filename, url)
+
+        part = self._get_part(filename, resume)
         try:
-            self._start_download(url, filename, resume)
+            result = self._start_download(url, part, resume)
         except KeyboardInterrupt as e:
-            # keep the file if resume is True
-            if not resume:
-                logging.info('Keyboard Interrupt -- Removing partial file: %s',
-                             filename)
-                try:
-                    os.remove(filename)
-                except OSError:
-                    pass
+            logging.info('Keyboard Interrupt -- Keeping partial file: %s',
+                         part)
             raise e
 
+        if not self._finish(filename, result is not False):
+            result = False
+
+        return result
+
+    def join(self):
+        """
+        Wait for the scheduled downloads to finish.
+
+        Downloads are synchronous by default, so there is nothing to wait
+        for; subclasses that download in the background override this.
+        """
+
+    def close(self):
+        """
+        Release the resources held by the downloader, flushing the
+        downloaded files to disk if the fsync policy is FSYNC_COURSE.
+        """
+        self._sync_all()
+
+
+def get_cookie_values(session, url):
+    """
+    Return the value of the Cookie header that the requests session would
+    send to url.
+    """
+
+    req = requests.models.Request()
+    req.method = 'GET'
+    req.url = url
+
+    return requests.cookies.get_cookie_header(session.cookies, req)
+
+
+def get_total_size(status_code, headers):
+    """
+    Return the size of the whole file from the status code and the headers
+    of the reply to its download, or None if it is unknown.
+    """
+    if headers.get('content-encoding'):
+        # the sizes are those of the encoded body, not of the decoded file
+        return None
+    if status_code == 206:
+        # Content-Range: bytes 100-199/200
+        total = headers.get('content-range', '').rpartition('/')[2]
+    else:
+        total = headers.get('content-length', '')
+
+    return int(total) if total.isdigit() else None
+
+
+def get_validator(headers):
+    """
+    Return the validator to send in If-Range for a response with the given
+    headers: its strong ETag or its Last-Modified date, if any.
+    """
+    etag = headers.get('etag')
+    if etag and not etag.startswith('W/'):
+        return etag
+    return headers.get('last-modified')
+
+
+def parse_retry_after(value):
+    """
+    Return the number of seconds to wait given by a Retry-After header,
+    which holds either seconds or an HTTP date, or None if it is missing or
+    invalid.
+    """
+    if not value:
+        return None
+    try:
+        return max(0, int(value))
+    except ValueError:
+        pass
+    date = parsedate_tz(value)
+    if date is None:
+        return None
+    return max(0, mktime_tz(date) - time.time())
+
+
+class StreamInterrupted(IOError):
+    """
+    The connection failed in the middle of a response.
+
+    :param copied: Number of bytes of the response that were copied.
+    :param reason: What went wrong.
+    """
+
+    def __init__(self, copied, reason):
+        super(StreamInterrupted, self).__init__(reason)
+        self.copied = copied
+        self.reason = reason
+
+
+def shutdown_response(r):
+    """
+    Shut down the connection of the response r, which wakes up the threads
+    that are blocked reading from it.
+    """
+    connection = (getattr(r.raw, 'connection', None) or
+                  getattr(r.raw, '_connection', None))
+    sock = getattr(connection, 'sock', None)
+    try:
+        if sock is not None:
+            sock.shutdown(socket.SHUT_RDWR)
+        else:
+            r.close()
+    except NETWORK_ERRORS:
+        pass
+
+
+class _WatchedRead(object):
+    __slots__ = ('response', 'started', 'stalled')
+
+    def __init__(self, response):
+        self.response = response
+        self.started = time.time()
+        self.stalled = False
+
+
+class StallWatchdog(object):
+    """
+    Aborts the transfers whose speed stays under `speed` bytes per second
+    for `stall_time` seconds.
+
+    Reads are made of at most speed * stall_time bytes (see get_read_size),
+    so a read that takes longer than stall_time seconds means that the
+    speed fell under the threshold. A background thread looks at the reads
+    in progress and shuts down the connection of those that take too long.
+
+    :param speed: Minimum speed, in bytes per second.
+    :param stall_time: Seconds that the speed may stay under the minimum.
+    :param interval: Seconds between two checks of the reads.
+    """
+
+    def __init__(self, speed, stall_time, interval=1):
+        self.speed = speed
+        self.stall_time = stall_time
+        self.interval = interval
+        self.reason = 'less than {0}/s for {1} seconds'.format(
+            format_bytes(speed), stall_time)
+
+        self._lock = threading.Lock()
+        self._reads = set()
+        self._thread = None
+        self._stop = threading.Event()
+
+    def get_read_size(self, chunk_size):
+        """
+        Return the largest read to make with a buffer of chunk_size bytes.
+        """
+        return max(4096, min(chunk_size, int(self.speed * self.stall_time)))
+
+    @contextmanager
+    def watch(self, r):
+        """
+        Watch a read from the response r. The yielded object tells whether
+        the read was aborted, in which case the error of the connection is
+        not raised: whatever was read is still good.
+        """
+        read = _WatchedRead(r)
+        with self._lock:
+            self._reads.add(read)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run)
+                self._thread.daemon = True
+                self._thread.start()
+        try:
+            yield read
+        except NETWORK_ERRORS:
+            if not read.stalled:
+                raise
+        finally:
+            with self._lock:
+                self._reads.discard(read)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            now = time.time()
+            with self._lock:
+                stalled = [read for read in self._reads
+                           if not read.stalled and
+                           now - read.started > self.stall_time]
+                for read in stalled:
+                    read.stalled = True
+            for read in stalled:
+                logging.debug('Transfer stalled, aborting it')
+                shutdown_response(read.response)
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+
+class RetryPolicy(object):
+    """
+    Decides whether to retry a failed request and how long to wait first.
+
+    The waits double with each retry of a file, with random jitter so that
+    parallel downloads don't retry in lockstep, unless the server asks for
+    a given wait with Retry-After.
+
+    :param attempts: Maximum number of retries of each file.
+    :param budget: Maximum number of retries of all the files together, or
+        None for no limit.
+    :param base_delay: Wait before the first retry, in seconds.
+    :param max_delay: Longest wait, in seconds, even if the server asks for
+        a longer one.
+    """
+
+    def __init__(self, attempts=4, budget=None, base_delay=2, max_delay=120):
+        self.attempts = attempts
+        self.budget = budget
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._lock = threading.Lock()
+
+    def consume(self, attempt):
+        """
+        Tell whether a file may be retried for the attempt-th time (counting
+        from 0), taking the retry from the budget.
+        """
+        if attempt >= self.attempts:
+            return False
+        with self._lock:
+            if self.budget is not None:
+                if self.budget <= 0:
+                    logging.warning('The retry budget is exhausted.')
+                    return False
+                self.budget -= 1
+        return True
+
+    def get_delay(self, attempt, retry_after=None):
+        """
+        Return the seconds to wait before the attempt-th retry of a file,
+        given the Retry-After header of the failed response.
+        """
+        delay = parse_retry_after(retry_after)
+        if delay is None:
+            delay = self.base_delay * 2 ** attempt
+            delay = delay / 2.0 + random.uniform(0, delay / 2.0)
+        return min(delay, self.max_delay)
+
+
+def wait_for_downloads(pending):
+    """
+    Wait for background downloads, reporting their results in order.
+
+    :param pending: List of (filename, wait) pairs, where wait() blocks until
+        the download finishes and returns its result (or raises its error).
+
+    Returns the number of failed downloads.
+    """
+    failed = 0
+
+    for filename, wait in pending:
+        try:
+            ok = wait() is not False
+        except Exception as e:
+            logging.error('Error downloading %s: %s', filename, e)
+            ok = False
+
+        if ok:
+            logging.info('Finished: %s', filename)
+        else:
+            logging.error('Failed: %s', filename)
+            failed += 1
+
+    return failed
+
+
+def write_cookie_file(session, filename):
+    """
+    Export the cookies of the requests session to filename, in the Netscape
+    format that the external downloaders read.
+    """
+    jar = http_cookiejar.MozillaCookieJar(filename)
+    for cookie in session.cookies:
+        jar.set_cookie(cookie)
+    jar.save(ignore_discard=True, ignore_expires=True)
+
+
+def iter_output_lines(stream):
+    """
+    Yield the lines that a process writes to the stream as soon as they
+    are written. Progress bars are redrawn with carriage returns, so they
+    end lines too.
+    """
+    pending = b''
+    while True:
+        data = os.read(stream.fileno(), 4096)
+        if not data:
+            break
+        lines = re.split(b'[\r\n]', pending + data)
+        pending = lines.pop()
+        for line in lines:
+            if line.strip():
+                yield line.decode('utf-8', 'replace').strip()
+    if pending.strip():
+        yield pending.decode('utf-8', 'replace').strip()
+
 
 class ExternalDownloader(Downloader):
     """
@@ -67,6 +503,15 @@ class ExternalDownloader(Downloader):
     We could possibly use python to stream files to disk,
     but this is slow compared to these external downloaders.
 
+    The output of the process is parsed for its progress, which is drawn
+    by a ProgressRenderer shared by all the processes of the downloader. A
+    process that fails is run again (resuming the download if possible) as
+    long as the RetryPolicy in the retry attribute allows it.
+
+    In batch mode (if the downloader supports it), download() only adds
+    the file to a list, and join() gets all the listed files with a single
+    process.
+
     :param session: Requests session.
     :param bin: External downloader binary.
     """
@@ -74,9 +519,32 @@ class ExternalDownloader(Downloader):
     # External downloader binary
     bin = None
 
+    # Whether the downloader can carry on from a partial file
+    supports_resume = True
+
+    # Percentages in the progress output of the downloader
+    progress_re = re.compile(r'(\d+(?:\.\d+)?)%')
+
+    # Number of lines of the output to keep for the error messages
+    output_lines = 10
+
+    # RetryPolicy for the failed processes, if any
+    retry = None
+
+    # Number of processes (or transfers of a batch) that run at once, which
+    # share the speed limit
+    jobs = 1
+
+    # Whether the downloader can get many files with one process, and
+    # whether it does
+    supports_batch = False
+    batch = False
+
     def __init__(self, session, bin=None):
         self.session = session
         self.bin = bin or self.__class__.bin
+        self.renderer = ProgressRenderer()
+        self._batch = []
 
         if not self.bin:
             raise RuntimeError("No bin specified")
@@ -86,12 +554,7 @@ class ExternalDownloader(Downloader):
         Extract cookies from the requests session and add them to the command
         """
 
-        req = requests.models.Request()
-        req.method = 'GET'
-        req.url = url
-
-        cookie_values = requests.cookies.get_cookie_header(
-            self.session.cookies, req)
+        cookie_values = get_cookie_values(self.session, url)
 
         if cookie_values:
             self._add_cookies(command, cookie_values)
@@ -110,6 +573,35 @@ class ExternalDownloader(Downloader):
 
         raise RuntimeError("Subclasses should implement this")
 
+    def _add_rate_limit(self, command, rate):
+        """
+        Limit the speed of the download to rate bytes per second
+        """
+
+        raise RuntimeError("Subclasses should implement this")
+
+    def _get_rate_limit(self, share=None):
+        """
+        Return the current speed limit, divided into `share` (by default
+        jobs) parts, or None. The external downloaders can't follow a
+        schedule, so the limit of the time of the launch holds for the
+        whole download.
+        """
+
+        rate = self.limiter.get_rate() if self.limiter else None
+        if rate:
+            return max(1, rate // (share or self.jobs))
+        return None
+
+    def _prepare_rate_limit(self, command):
+        """
+        Pass the current speed limit, if any, to the command.
+        """
+
+        rate = self._get_rate_limit()
+        if rate:
+            self._add_rate_limit(command, rate)
+
     def _create_command(self, url, filename):
         """
         Create command to execute in a subprocess.
@@ -117,19 +609,139 @@ class ExternalDownloader(Downloader):
         raise NotImplementedError("Subclasses should implement this")
 
     def _start_download(self, url, filename, resume):
-        command = self._create_command(url, filename)
-        self._prepare_cookies(command, url)
-        if resume:
-            self._enable_resume(command)
+        attempt = 0
+        while True:
+            command = self._create_command(url, filename)
+            self._prepare_cookies(command, url)
+            self._prepare_rate_limit(command)
+            if resume:
+                self._enable_resume(command)
+
+            code, output = self._run(command, filename)
+            if code == 0:
+                return True
+
+            logging.error('%s exited with code %d downloading %s: %s',
+                          self.bin, code, filename, ' | '.join(output[-3:]))
+            if not self.retry or not self.retry.consume(attempt):
+                return False
+            delay = self.retry.get_delay(attempt)
+            logging.warning('Will retry %s in %.1f seconds ...', filename,
+                            delay)
+            time.sleep(delay)
+            attempt += 1
+            # carry on from what the failed run got
+            resume = self.supports_resume
+
+    def _parse_progress(self, line, filename, progress):
+        """
+        Update the progress from a line of the output of the process: the
+        bytes come from the size of the file and the total from the
+        percentage in the line, if any.
+        """
+        percents = self.progress_re.findall(line)
+        if not percents or not os.path.exists(filename):
+            return
+        current = os.path.getsize(filename)
+        percent = float(percents[-1])
+        if percent > 0:
+            progress.set_total(int(current * 100 / percent))
+        progress.report(current)
+
+    def _run(self, command, filename):
+        """
+        Run the command, drawing the progress that it prints.
 
+        Returns its exit code and the last lines of its output.
+        """
+        logging.debug('Executing %s: %s', self.bin, command)
+        try:
+            process = subprocess.Popen(command, stdout=subprocess.PIPE,
+                                       stderr=subprocess.STDOUT)
+        except OSError as e:
+            msg = "{0}. Are you sure that '{1}' is the right bin?".format(
+                e, self.bin)
+            raise OSError(msg)
+
+        output = collections.deque(maxlen=self.output_lines)
+        progress = DownloadProgress(None, filename, self.renderer)
+        progress.start()
+        try:
+            for line in iter_output_lines(process.stdout):
+                output.append(line)
+                self._parse_progress(line, filename, progress)
+            process.wait()
+        finally:
+            process.stdout.close()
+            progress.stop()
+
+        return process.returncode, list(output)
+
+    def _call(self, command, capture=False):
+        """
+        Run the command, returning its exit code, or its output if capture
+        is True.
+        """
         logging.debug('Executing %s: %s', self.bin, command)
         try:
-            subprocess.call(command)
+            if capture:
+                return subprocess.Popen(
+                    command, stdout=subprocess.PIPE).communicate()[0]
+            return subprocess.call(command)
         except OSError as e:
             msg = "{0}. Are you sure that '{1}' is the right bin?".format(
                 e, self.bin)
             raise OSError(msg)
 
+    def _run_batch(self, entries, workdir):
+        """
+        Download the (url, filename, resume) entries with one process,
+        keeping its input files in workdir.
+
+        Returns the set of the filenames that could not be downloaded.
+        """
+        raise NotImplementedError("Subclasses should implement this")
+
+    def download(self, url, filename, resume=False):
+        if not self.batch:
+            return super(ExternalDownloader, self).download(url, filename,
+                                                            resume)
+
+        if self.manifest:
+            self.manifest.start(filename, url)
+        self._batch.append((url, filename, resume))
+
+    def join(self):
+        """
+        Download the files of the batch, if any.
+
+        Returns the number of failed downloads.
+        """
+        entries, self._batch = self._batch, []
+        if not entries:
+            return 0
+
+        logging.info('Downloading %d files with %s', len(entries), self.bin)
+        parts = [(url, self._get_part(filename, resume), resume)
+                 for url, filename, resume in entries]
+        workdir = tempfile.mkdtemp(prefix='coursera-dl-')
+        try:
+            failed = self._run_batch(parts, workdir)
+        finally:
+            # the cookies are in there
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        pending = []
+        for url, filename, resume in entries:
+            result = self._finish(filename,
+                                  filename + PART_SUFFIX not in failed)
+            pending.append((filename, lambda result=result: result))
+        return wait_for_downloads(pending)
+
+    def close(self):
+        self.renderer.close()
+        super(ExternalDownloader, self).close()
+
 
 class WgetDownloader(ExternalDownloader):
     """
@@ -144,6 +756,9 @@ class WgetDownloader(ExternalDownloader):
     def _add_cookies(self, command, cookie_values):
         command.extend(['--header', "Cookie: " + cookie_values])
 
+    def _add_rate_limit(self, command, rate):
+        command.append('--limit-rate={0}'.format(rate))
+
     def _create_command(self, url, filename):
         return [self.bin, url, '-O', filename, '--no-cookies',
                 '--no-check-certificate']
@@ -155,6 +770,10 @@ class CurlDownloader(ExternalDownloader):
     """
 
     bin = 'curl'
+    supports_batch = True
+
+    # curl's write-out variables, not a format string
+    write_out = u'"%{http_code} %{filename_effective}\\n"'
 
     def _enable_resume(self, command):
         command.extend(['-C', '-'])
@@ -162,8 +781,52 @@ class CurlDownloader(ExternalDownloader):
     def _add_cookies(self, command, cookie_values):
         command.extend(['--cookie', cookie_values])
 
+    def _add_rate_limit(self, command, rate):
+        command.extend(['--limit-rate', str(rate)])
+
     def _create_command(self, url, filename):
-        return [self.bin, url, '-k', '-#', '-L', '-o', filename]
+        # --fail: an HTTP error is an error, not a file with the error page
+        return [self.bin, url, '-k', '-#', '-L', '--fail', '-o', filename]
+
+    @staticmethod
+    def _quote(value):
+        return u'"{0}"'.format(
+            value.replace(u'\\', u'\\\\').replace(u'"', u'\\"'))
+
+    def _run_batch(self, entries, workdir):
+        # Every transfer of the config file gets its own options (they are
+        # separated by "next"), and reports its status on stdout.
+        cookie_file = os.path.join(workdir, 'cookies.txt')
+        write_cookie_file(self.session, cookie_file)
+        rate = self._get_rate_limit()
+
+        config = os.path.join(workdir, 'config.txt')
+        with io.open(config, 'w', encoding='utf-8') as f:
+            for i, (url, filename, resume) in enumerate(entries):
+                if i:
+                    f.write(u'next\n')
+                f.write(u'url = {0}\n'.format(self._quote(url)))
+                f.write(u'output = {0}\n'.format(self._quote(filename)))
+                f.write(u'cookie = {0}\n'.format(self._quote(cookie_file)))
+                # an HTTP error is an error, not a file with the error page
+                f.write(u'fail\ninsecure\nlocation\n')
+                f.write(u'write-out = {0}\n'.format(self.write_out))
+                if rate:
+                    f.write(u'limit-rate = {0}\n'.format(rate))
+                if resume:
+                    f.write(u'continue-at = -\n')
+
+        output = self._call([self.bin, '--parallel', '--parallel-max',
+                             str(self.jobs), '-K', config], capture=True)
+
+        done = set()
+        for line in output.decode('utf-8', 'replace').splitlines():
+            code, _, filename = line.partition(' ')
+            # 416: a resumed file that was already complete
+            if code in ('200', '206', '416'):
+                done.add(filename)
+        return set(filename for _, filename, _ in entries
+                   if filename not in done or not os.path.exists(filename))
 
 
 class Aria2Downloader(ExternalDownloader):
@@ -173,6 +836,7 @@ class Aria2Downloader(ExternalDownloader):
     """
 
     bin = 'aria2c'
+    supports_batch = True
 
     def _enable_resume(self, command):
         command.append('-c')
@@ -180,11 +844,50 @@ class Aria2Downloader(ExternalDownloader):
     def _add_cookies(self, command, cookie_values):
         command.extend(['--header', "Cookie: " + cookie_values])
 
+    def _add_rate_limit(self, command, rate):
+        command.append('--max-overall-download-limit={0}'.format(rate))
+
     def _create_command(self, url, filename):
-        return [self.bin, url, '-o', filename,
+        # --allow-overwrite: a stale partial file is replaced (or resumed,
+        # with -c) instead of downloading to another name next to it
+        return [self.bin, url, '-o', filename, '--allow-overwrite=true',
                 '--check-certificate=false', '--log-level=notice',
                 '--max-connection-per-server=4', '--min-split-size=1M']
 
+    def _run_batch(self, entries, workdir):
+        cookie_file = os.path.join(workdir, 'cookies.txt')
+        write_cookie_file(self.session, cookie_file)
+
+        input_file = os.path.join(workdir, 'input.txt')
+        with io.open(input_file, 'w', encoding='utf-8') as f:
+            for url, filename, resume in entries:
+                filename = os.path.abspath(filename)
+                f.write(u'{0}\n'.format(url))
+                f.write(u'  dir={0}\n'.format(os.path.dirname(filename)))
+                f.write(u'  out={0}\n'.format(os.path.basename(filename)))
+                if resume:
+                    f.write(u'  continue=true\n')
+                else:
+                    # or aria2 downloads to another name, next to a stale
+                    # partial file that would be taken as complete
+                    f.write(u'  allow-overwrite=true\n')
+
+        command = [self.bin, '-i', input_file,
+                   '--load-cookies={0}'.format(cookie_file),
+                   '--max-concurrent-downloads={0}'.format(self.jobs),
+                   '--check-certificate=false', '--log-level=notice',
+                   '--max-connection-per-server=4', '--min-split-size=1M']
+        # the limit is for all the downloads of the process
+        rate = self._get_rate_limit(share=1)
+        if rate:
+            self._add_rate_limit(command, rate)
+        self._call(command)
+
+        # aria2 keeps a control file next to the unfinished downloads
+        return set(filename for _, filename, _ in entries
+                   if not os.path.exists(filename) or
+                   os.path.exists(filename + '.aria2'))
+
 
 class AxelDownloader(ExternalDownloader):
     """
@@ -193,6 +896,7 @@ class AxelDownloader(ExternalDownloader):
     """
 
     bin = 'axel'
+    supports_resume = False
 
     def _enable_resume(self, command):
         logging.warn('Resume download not implemented for this '
@@ -201,35 +905,23 @@ class AxelDownloader(ExternalDownloader):
     def _add_cookies(self, command, cookie_values):
         command.extend(['-H', "Cookie: " + cookie_values])
 
+    def _add_rate_limit(self, command, rate):
+        command.extend(['-s', str(rate)])
+
     def _create_command(self, url, filename):
         return [self.bin, '-o', filename, '-n', '4', '-a', url]
 
 
-def format_bytes(bytes):
-    """
-    Get human readable version of given bytes.
-    Ripped from https://github.com/rg3/youtube-dl
-    """
-    if bytes is None:
-        return 'N/A'
-    if type(bytes) is str:
-        bytes = float(bytes)
-    if bytes == 0.0:
-        exponent = 0
-    else:
-        exponent = int(math.log(bytes, 1024.0))
-    suffix = ['B', 'KB', 'MB', 'GB', 'TB', 'PB', 'EB', 'ZB', 'YB'][exponent]
-    converted = float(bytes) / float(1024 ** exponent)
-    return '{0:.2f}{1}'.format(converted, suffix)
-
-
 class DownloadProgress(object):
     """
     Report download progress.
     Inspired by https://github.com/rg3/youtube-dl
+
+    With a ProgressRenderer, the progress is only counted here and drawn by
+    the renderer; otherwise it is printed on every update.
     """
 
-    def __init__(self, total):
+    def __init__(self, total, name=None, renderer=None):
         if total in [0, '0', None]:
             self._total = None
         else:
@@ -241,25 +933,46 @@ class DownloadProgress(object):
 
         self._finished = False
 
+        self.name = name
+        self.renderer = renderer
+
+    @property
+    def current(self):
+        return self._current
+
+    @property
+    def total(self):
+        return self._total
+
+    def set_total(self, total):
+        self._total = total or None
+
     def start(self):
         self._now = time.time()
         self._start = self._now
+        if self.renderer:
+            self.renderer.add(self.name, self)
 
     def stop(self):
         self._now = time.time()
         self._finished = True
         self._total = self._current
-        self.report_progress()
+        if self.renderer:
+            self.renderer.remove(self.name, self)
+        else:
+            self.report_progress()
 
     def read(self, bytes):
         self._now = time.time()
         self._current += bytes
-        self.report_progress()
+        if not self.renderer:
+            self.report_progress()
 
     def report(self, bytes):
         self._now = time.time()
         self._current = bytes
-        self.report_progress()
+        if not self.renderer:
+            self.report_progress()
 
     def calc_percent(self):
         if self._total is None:
@@ -271,10 +984,7 @@ class DownloadProgress(object):
         return '[{0: <50}] {1}%'.format(done * '#', percentage)
 
     def calc_speed(self):
-        dif = self._now - self._start
-        if self._current == 0 or dif < 0.001:  # One millisecond
-            return '---b/s'
-        return '{0}/s'.format(format_bytes(float(self._current) / dif))
+        return format_speed(self._current, self._now - self._start)
 
     def report_progress(self):
         """Report download progress."""
@@ -293,33 +1003,430 @@ class DownloadProgress(object):
         sys.stdout.flush()
 
 
+class WriteBehind(object):
+    """
+    Writes chunks to a file in a background thread, so that the network is
+    read while the previous chunks are written.
+
+    The chunks are written from a fixed set of buffers: get_buffer() blocks
+    until the writer thread has written one of them, which bounds the memory
+    used and keeps the reader at most len(buffers) chunks ahead.
+
+    :param f: File to write to.
+    :param buffers: Writable memoryviews to pass the chunks in.
+    """
+
+    def __init__(self, f, buffers):
+        self._f = f
+        self._error = None
+        self._free = queue.Queue()
+        self._full = queue.Queue()
+        for buf in buffers:
+            self._free.put(buf)
+
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            item = self._full.get()
+            if item is None:
+                break
+            buf, n = item
+            if self._error is None:
+                try:
+                    self._f.write(buf[:n])
+                except Exception as e:
+                    self._error = e
+            self._free.put(buf)
+
+    def _raise_error(self):
+        if self._error is not None:
+            raise self._error
+
+    def get_buffer(self):
+        """
+        Return a buffer to read the next chunk into.
+        """
+        self._raise_error()
+        return self._free.get()
+
+    def write(self, buf, n):
+        """
+        Queue the first n bytes of buf, a buffer returned by get_buffer(),
+        to be written.
+        """
+        self._full.put((buf, n))
+
+    def close(self):
+        """
+        Wait for the queued chunks to be written.
+        """
+        self._full.put(None)
+        self._thread.join()
+        self._raise_error()
+
+
 class NativeDownloader(Downloader):
     """
     'Native' python downloader -- slower than the external downloaders.
 
+    Files of segment_threshold bytes or more are downloaded in `segments`
+    byte ranges at once, if the server supports Range requests.
+
     :param session: Requests session.
+    :param segments: Number of simultaneous connections for big files.
+    :param segment_threshold: Minimum size of the files to segment.
+    :param chunk_size: Size of the buffer used to copy the files to disk.
+    :param write_behind: Number of chunks that may wait to be written to
+        disk by a background thread while the next one is read; 0 writes
+        them in the reading thread.
+    :param retry: RetryPolicy for the failed requests and the transfers
+        that are interrupted, which resume where they stopped.
+    :param stall_speed: Minimum speed, in bytes per second, under which a
+        transfer is interrupted (and resumed) after stall_time seconds; 0
+        disables the watchdog.
+    :param stall_time: Seconds that a transfer may stay under stall_speed.
+    :param digest: Algorithm of the digest (see integrity.DIGEST_ALGORITHMS)
+        computed while the file is written and recorded in the manifest, or
+        None. A file whose size or digest is not the one announced by the
+        server is downloaded again.
     """
 
-    def __init__(self, session):
+    # Minimum interval (in seconds) between updates of the progress
+    progress_interval = 0.5
+
+    uses_session_pool = True
+
+    def __init__(self, session, segments=1, segment_threshold=20 * 1048576,
+                 chunk_size=1048576, write_behind=0, retry=None,
+                 stall_speed=0, stall_time=60, digest=None):
         self.session = session
+        self.digest = digest
+        self.segments = segments
+        self.segment_threshold = segment_threshold
+        self.chunk_size = chunk_size
+        self.write_behind = write_behind
+        self.retry = retry or RetryPolicy()
+        self.watchdog = None
+        if stall_speed > 0:
+            self.watchdog = StallWatchdog(stall_speed, stall_time)
+        self.renderer = ProgressRenderer()
+
+    def _get_readinto(self, r):
+        """
+        Return a readinto function for the (decoded) body of the response r.
+        """
+        if r.headers.get('content-encoding'):
+            return self._get_decoded_readinto(r)
+
+        fp = getattr(r.raw, '_fp', None)
+        if not hasattr(fp, 'readinto'):
+            return r.raw.readinto
+
+        # Nothing to decode, so let httplib read straight into our buffer:
+        # urllib3's readinto allocates a new string per call. urllib3 does
+        # not see the end of the body then, so the connection is given back
+        # to the pool here, or closing the response would drop it.
+        def readinto(b):
+            n = fp.readinto(b)
+            if not n:
+                r.raw.release_conn()
+            return n
+        return readinto
+
+    def _get_decoded_readinto(self, r):
+        """
+        Return a readinto function for the body of the response r, decoded
+        by urllib3 (which requests leaves to us with stream=True).
+        """
+        chunks = r.raw.stream(self.chunk_size, decode_content=True)
+        pending = [memoryview(b'')]
+
+        def readinto(b):
+            data = pending[0]
+            if not len(data):
+                data = memoryview(next(chunks, b''))
+            n = min(len(b), len(data))
+            b[:n] = data[:n]
+            pending[0] = data[n:]
+            return n
+        return readinto
+
+    def _copy_stream(self, r, f, report, hasher=None):
+        """
+        Copy the body of the response r to the file f, through a buffer that
+        is reused for every chunk (or write_behind + 1 buffers, handed to a
+        WriteBehind thread). The bytes are also fed to the hasher, if any.
+
+        report is called with the number of bytes copied since its previous
+        call, at most every progress_interval seconds and at the end.
+
+        Returns the number of bytes copied, or raises StreamInterrupted if
+        the connection fails.
+        """
+        readinto = self._get_readinto(r)
+        read_size = self.chunk_size
+        if self.watchdog:
+            read_size = self.watchdog.get_read_size(self.chunk_size)
+
+        writer = None
+        if self.write_behind:
+            writer = WriteBehind(f, [memoryview(bytearray(self.chunk_size))
+                                     for _ in range(self.write_behind + 1)])
+        else:
+            view = memoryview(bytearray(self.chunk_size))
+
+        copied = 0
+        reported = 0
+        last_report = time.time()
+        try:
+            while True:
+                if writer:
+                    view = writer.get_buffer()
+                n = 0
+                stalled = False
+                try:
+                    if self.watchdog:
+                        with self.watchdog.watch(r) as read:
+                            n = readinto(view[:read_size])
+                        stalled = read.stalled
+                    else:
+                        n = readinto(view)
+                except NETWORK_ERRORS as e:
+                    report(copied - reported)
+                    raise StreamInterrupted(copied, str(e))
+                if n:
+                    if hasher:
+                        hasher.update(view[:n])
+                    if writer:
+                        writer.write(view, n)
+                    else:
+                        f.write(view[:n])
+                    copied += n
+                    if self.limiter:
+                        self.limiter.consume(n)
+                if stalled:
+                    report(copied - reported)
+                    raise StreamInterrupted(copied, self.watchdog.reason)
+                if not n:
+                    break
+
+                now = time.time()
+                if now - last_report >= self.progress_interval:
+                    report(copied - reported)
+                    reported = copied
+                    last_report = now
+        finally:
+            if writer:
+                writer.close()
+
+        report(copied - reported)
+        return copied
+
+    def _download_segment(self, url, filename, start, end, validator,
+                          progress, progress_lock):
+        """
+        Download bytes start to end (inclusive) of url to the same offset of
+        filename. If the connection fails, the rest of the range is asked
+        for again.
+
+        Returns False if the server did not give us exactly that range.
+        """
+        def report(n):
+            with progress_lock:
+                progress.read(n)
+
+        position = start
+        attempt = 0
+        while True:
+            headers = {'Range': 'bytes={0}-{1}'.format(position, end)}
+            if validator:
+                headers['If-Range'] = validator
+
+            try:
+                r = self.session.get(url, stream=True, headers=headers)
+            except requests.exceptions.RequestException as e:
+                error = e
+            else:
+                try:
+                    if r.status_code != 206:
+                        logging.debug('Server replied %s to range %s of %s',
+                                      r.status_code, headers['Range'], url)
+                        return False
+
+                    with open(filename, 'r+b') as f:
+                        f.seek(position)
+                        position += self._copy_stream(r, f, report)
+                    if position == end + 1:
+                        return True
+                    error = 'got bytes {0}-{1}'.format(start, position - 1)
+                except StreamInterrupted as e:
+                    position += e.copied
+                    error = e
+                finally:
+                    r.close()
+
+            if not self.retry.consume(attempt):
+                return False
+            delay = self.retry.get_delay(attempt)
+            logging.debug('Error downloading range %s of %s (%s), will retry '
+                          'in %.1f seconds', headers['Range'], url, error,
+                          delay)
+            time.sleep(delay)
+            attempt += 1
+
+    def _segmented_download(self, url, filename):
+        """
+        Download url in self.segments byte ranges at once, written to their
+        offsets of a preallocated file.
+
+        Returns True if the download worked, or None if the file is too
+        small to be segmented or the server does not honour Range requests,
+        in which case the file has to be downloaded in one stream.
+        """
+        try:
+            probe = self.session.get(url, stream=True,
+                                     headers={'Range': 'bytes=0-0'})
+        except requests.exceptions.RequestException as e:
+            # the single stream retries the errors
+            logging.debug('Could not probe %s for ranges: %s', url, e)
+            return None
+        probe.close()
+        total = get_total_size(probe.status_code, probe.headers)
+        if probe.status_code != 206 or total is None:
+            logging.debug('No support for ranges, not segmenting %s', url)
+            return None
+        if total < self.segment_threshold:
+            return None
+
+        validator = get_validator(probe.headers)
+        if self.manifest:
+            self.manifest.update(filename, total, probe.headers.get('etag'),
+                                 probe.headers.get('last-modified'))
+
+        logging.info('Downloading %s -> %s in %d segments', url, filename,
+                     self.segments)
+        with open(filename, 'wb') as f:
+            f.truncate(total)
+
+        segment_size = int(math.ceil(float(total) / self.segments))
+        ranges = [(start, min(start + segment_size, total) - 1)
+                  for start in range(0, total, segment_size)]
+
+        progress = DownloadProgress(total, filename, self.renderer)
+        progress_lock = threading.Lock()
+        progress.start()
+        try:
+            pool = ThreadPool(len(ranges))
+            try:
+                results = [pool.apply_async(self._download_segment,
+                                            (url, filename, start, end,
+                                             validator, progress,
+                                             progress_lock))
+                           for start, end in ranges]
+                ok = all([result.get() for result in results])
+            finally:
+                pool.terminate()
+
+            if not ok:
+                logging.warning('Segmented download of %s failed, '
+                                'downloading it in one stream.', url)
+                return None
+
+            if self.digest:
+                # the segments arrive out of order, hash the assembled file
+                error_msg = self._verify(
+                    filename, total, hash_file(filename, self.digest),
+                    get_expected_digest(probe.headers, self.digest))
+                if error_msg:
+                    logging.warning('Segmented download of %s is corrupt '
+                                    '(%s), downloading it in one stream.',
+                                    url, error_msg)
+                    return None
+            return True
+        finally:
+            progress.stop()
+
+    def _verify(self, filename, total, hasher, expected_digest):
+        """
+        Check the size of the downloaded file against the total announced
+        by the server, and its digest against the announced one (if any),
+        and record the digest in the manifest. Neither is known for a
+        content-encoded response, whose total and expected digest are None.
+
+        Returns None if the file is fine, or what is wrong with it.
+        """
+        size = os.path.getsize(filename)
+        if total is not None and size != total:
+            return 'got {0} bytes instead of {1}'.format(size, total)
+        if hasher is None:
+            return None
+
+        digest = hasher.hexdigest()
+        if expected_digest and digest != expected_digest:
+            return 'got {0} digest {1} instead of {2}'.format(
+                self.digest, digest, expected_digest)
+        if self.manifest:
+            self.manifest.set_digest(filename,
+                                     format_digest(self.digest, hasher))
+        return None
+
+    def _get_resume_validator(self, filename):
+        """
+        Return the validator that the manifest recorded for filename in a
+        previous download, if any.
+        """
+        entry = self.manifest.get(filename) if self.manifest else None
+        if not entry:
+            return None
+        return get_validator({'etag': entry['etag'],
+                              'last-modified': entry['last_modified']})
 
     def _start_download(self, url, filename, resume=False):
         # resume has no meaning if the file doesn't exists!
         resume = resume and os.path.exists(filename)
 
-        headers = {}
-        filesize = None
+        if not resume and self.segments > 1:
+            if self._segmented_download(url, filename):
+                return True
+
         if resume:
-            filesize = os.path.getsize(filename)
-            headers['Range'] = 'bytes={}-'.format(filesize)
             logging.info('Resume downloading %s -> %s', url, filename)
         else:
             logging.info('Downloading %s -> %s', url, filename)
 
-        attempts_count = 0
+        validator = self._get_resume_validator(filename) if resume else None
+        hasher = None
+        attempt = 0
         error_msg = ''
-        while attempts_count < 5:
-            r = self.session.get(url, stream=True, headers=headers)
+        retry_after = None
+        while True:
+            if attempt:
+                if not self.retry.consume(attempt - 1):
+                    break
+                delay = self.retry.get_delay(attempt - 1, retry_after)
+                logging.warning('Error downloading %s (%s), will retry in '
+                                '%.1f seconds ...', url, error_msg, delay)
+                time.sleep(delay)
+            attempt += 1
+            retry_after = None
+
+            headers = {}
+            filesize = None
+            if resume:
+                filesize = os.path.getsize(filename)
+                headers['Range'] = 'bytes={}-'.format(filesize)
+                if validator:
+                    # if the file changed, get all of it instead
+                    headers['If-Range'] = validator
+
+            try:
+                r = self.session.get(url, stream=True, headers=headers)
+            except requests.exceptions.RequestException as e:
+                error_msg = str(e)
+                continue
 
             if r.status_code != 200:
                 # because in resume state we are downloading only a
@@ -335,50 +1442,157 @@ class NativeDownloader(Downloader):
                     r.close()
                     return True
                 else:
-                    print(r.status_code)
-                    print(url)
-                    print(filesize)
-                    logging.warn('Probably the file is missing from the AWS '
-                                 'repository...  waiting.')
-
+                    logging.debug('Server replied %s to %s (resuming from %s)',
+                                  r.status_code, url, filesize)
                     if r.reason:
                         error_msg = r.reason + ' ' + str(r.status_code)
                     else:
                         error_msg = 'HTTP Error ' + str(r.status_code)
-
-                    wait_interval = 2 ** (attempts_count + 1)
-                    msg = 'Error downloading, will retry in {0} seconds ...'
-                    print(msg.format(wait_interval))
-                    time.sleep(wait_interval)
-                    attempts_count += 1
+                    retry_after = r.headers.get('retry-after')
+                    r.close()
                     continue
 
             if resume and r.status_code == 200:
                 # if the server returns HTTP code 200 while we are in
                 # resume mode, it means that the server does not support
-                # partial downloads.
+                # partial downloads, or that the file changed.
                 resume = False
 
-            content_length = r.headers.get('content-length')
-            chunk_sz = 1048576
-            progress = DownloadProgress(content_length)
+            validator = get_validator(r.headers) or validator
+            # the body is decoded, so its length tells nothing of the file
+            encoded = bool(r.headers.get('content-encoding'))
+            content_length = None if encoded else r.headers.get(
+                'content-length')
+            total = get_total_size(r.status_code, r.headers)
+            if self.manifest:
+                self.manifest.update(filename, total, r.headers.get('etag'),
+                                     r.headers.get('last-modified'))
+
+            expected_digest = None
+            if self.digest:
+                if not encoded:
+                    # the digests of the headers are those of the encoded
+                    # body, while we hash the decoded file
+                    expected_digest = get_expected_digest(r.headers,
+                                                          self.digest)
+                if not resume:
+                    hasher = new_hasher(self.digest)
+                elif hasher is None:
+                    # the part that a previous run got
+                    hasher = hash_file(filename, self.digest)
+
+            progress = DownloadProgress(content_length, filename,
+                                        self.renderer)
             progress.start()
             f = open(filename, 'ab') if resume else open(filename, 'wb')
-            while True:
-                data = r.raw.read(chunk_sz, decode_content=True)
-                if not data:
-                    progress.stop()
-                    break
-                progress.report(r.raw.tell())
-                f.write(data)
-            f.close()
-            r.close()
-            return True
+            try:
+                copied = self._copy_stream(r, f, progress.read, hasher)
+                if content_length and copied < int(content_length):
+                    raise StreamInterrupted(
+                        copied, 'got {0} of {1} bytes'.format(copied,
+                                                               content_length))
+            except StreamInterrupted as e:
+                # carry on from what we got
+                error_msg = 'interrupted after {0} bytes: {1}'.format(
+                    e.copied, e.reason)
+                # the ranges of an encoded body are not those of the file
+                resume = not encoded
+                continue
+            finally:
+                progress.stop()
+                f.close()
+                r.close()
+
+            error_msg = self._verify(filename, total, hasher, expected_digest)
+            if error_msg is None:
+                return True
+            # the file is corrupt, get all of it again
+            resume = False
+            hasher = None
+
+        logging.warn('Skipping, can\'t download file ...')
+        logging.error(error_msg)
+        return False
+
+    def close(self):
+        self.renderer.close()
+        if self.watchdog:
+            self.watchdog.close()
+        super(NativeDownloader, self).close()
+
+
+class ParallelDownloader(Downloader):
+    """
+    Runs the downloads of another downloader in a pool of threads.
 
-        if attempts_count == 5:
-            logging.warn('Skipping, can\'t download file ...')
-            logging.error(error_msg)
-            return False
+    download() only schedules the download and returns at once. join()
+    waits for the scheduled downloads and reports their results in the order
+    in which they were scheduled.
+
+    :param downloader: Downloader that does the actual work (and whose
+        session is shared by all the downloads).
+    :param jobs: Number of simultaneous downloads.
+    :param max_per_host: Maximum number of simultaneous downloads from the
+        same host.
+    """
+
+    def __init__(self, downloader, jobs, max_per_host=None):
+        self.downloader = downloader
+        self.max_per_host = max_per_host or jobs
+
+        self._pool = ThreadPool(jobs)
+        self._pending = []
+        self._host_slots = {}
+        self._host_slots_lock = threading.Lock()
+
+    @property
+    def manifest(self):
+        return self.downloader.manifest
+
+    @manifest.setter
+    def manifest(self, manifest):
+        self.downloader.manifest = manifest
+
+    @property
+    def uses_session_pool(self):
+        return self.downloader.uses_session_pool
+
+    def _get_host_slots(self, url):
+        host = urlparse(url).netloc
+        with self._host_slots_lock:
+            if host not in self._host_slots:
+                self._host_slots[host] = threading.BoundedSemaphore(
+                    self.max_per_host)
+            return self._host_slots[host]
+
+    def _download(self, url, filename, resume):
+        with self._get_host_slots(url):
+            return self.downloader.download(url, filename, resume)
+
+    def download(self, url, filename, resume=False):
+        pending = self._pool.apply_async(self._download,
+                                         (url, filename, resume))
+        self._pending.append((filename, pending.get))
+
+    def join(self):
+        """
+        Wait for all the scheduled downloads.
+
+        Returns the number of failed downloads.
+        """
+        pending, self._pending = self._pending, []
+        return wait_for_downloads(pending)
+
+    def close(self):
+        """
+        Drop the downloads that have not started and wait for the running
+        ones, so that they are done with the manifest when it is closed
+        (e.g., after an error stopped the scheduling of downloads).
+        """
+        self._pending = []
+        self._pool.terminate()
+        self._pool.join()
+        self.downloader.close()
 
 
 def get_downloader(session, class_name, args):
@@ -393,8 +1607,64 @@ def get_downloader(session, class_name, args):
         'axel': AxelDownloader,
     }
 
+    retry = RetryPolicy(args.retries, args.retry_budget or None,
+                        max_delay=args.retry_max_delay)
+    limiter = None
+    if args.rate_schedule.is_limited():
+        limiter = TokenBucket(args.rate_schedule)
+
+    if args.asyncio:
+        try:
+            from .async_downloader import AsyncioDownloader
+        except (ImportError, SyntaxError) as e:
+            # The asyncio downloader needs Python 3.5+ and aiohttp
+            logging.warning('Cannot use the asyncio downloader (%s), '
+                            'using the native downloader instead.', e)
+        else:
+            downloader = AsyncioDownloader(session, args.jobs,
+                                           args.max_per_host, retry,
+                                           (args.connect_timeout,
+                                            args.read_timeout))
+            downloader.fsync = args.fsync
+            downloader.limiter = limiter
+            return downloader
+
+    if args.aria2_rpc is not None:
+        from .aria2_rpc import Aria2RpcDownloader, get_rpc_server
+
+        server = get_rpc_server(args.aria2 or 'aria2c', args.aria2_rpc,
+                                args.aria2_rpc_secret, args.jobs,
+                                args.max_per_host)
+        downloader = Aria2RpcDownloader(session, server)
+        downloader.fsync = args.fsync
+        downloader.limiter = limiter
+        return downloader
+
+    downloader = None
     for bin, class_ in iteritems(external):
         if getattr(args, bin):
-            return class_(session, bin=getattr(args, bin))
-
-    return NativeDownloader(session)
+            downloader = class_(session, bin=getattr(args, bin))
+            downloader.jobs = args.jobs
+            downloader.retry = retry
+            if args.batch:
+                if class_.supports_batch:
+                    downloader.batch = True
+                else:
+                    logging.warning('%s cannot download in batch, running '
+                                    'it once per file.', bin)
+            break
+    else:
+        downloader = NativeDownloader(
+            session, args.segments, args.segment_threshold * 1048576,
+            args.chunk_size * 1024, args.write_behind, retry,
+            args.stall_speed * 1024, args.stall_time,
+            None if args.digest == 'none' else args.digest)
+    downloader.fsync = args.fsync
+    downloader.limiter = limiter
+
+    # the batches run their own parallel transfers
+    if args.jobs > 1 and not getattr(downloader, 'batch', False):
+        downloader = ParallelDownloader(downloader, args.jobs,
+                                        args.max_per_host)
+
+    return downloader
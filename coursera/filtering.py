@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+
+"""
+Selection of the material to download.
+
+The filters given by the user are compiled once into a SelectionPlan, which
+can be checked both while the syllabus is parsed (to avoid resolving
+lectures that will not be downloaded) and while the lectures are
+downloaded.
+"""
+
+import re
+
+# Formats of the resources that the video API gives for a lecture
+ON_DEMAND_LECTURE_FORMATS = ('mp4', 'srt', 'txt')
+
+
+class SelectionPlan(object):
+    """
+    Compiled selection criteria of sections, lectures and file formats.
+
+    :param file_formats: List of file formats to download ('all' for all).
+    :param section_filter: Regex that the section names must contain.
+    :param lecture_filter: Regex that the lecture names must contain.
+    :param ignored_formats: List of file formats to never download.
+    """
+
+    def __init__(self, file_formats=None, section_filter=None,
+                 lecture_filter=None, ignored_formats=None):
+        self.file_formats = file_formats or ['all']
+        self.ignored_formats = ignored_formats or []
+        self.section_filter = section_filter
+        self.lecture_filter = lecture_filter
+
+        self._section_re = re.compile(section_filter) if section_filter else None
+        self._lecture_re = re.compile(lecture_filter) if lecture_filter else None
+
+    def wants_section(self, section):
+        return self._section_re is None or bool(self._section_re.search(section))
+
+    def wants_lecture(self, lecture):
+        return self._lecture_re is None or bool(self._lecture_re.search(lecture))
+
+    def wants_format(self, fmt):
+        """
+        Check a resource format, which may have a language prefix (as in
+        "en.srt").
+        """
+        fmt = fmt.rsplit('.', 1)[-1]
+
+        if fmt in self.ignored_formats:
+            return False
+
+        return fmt in self.file_formats or 'all' in self.file_formats
+
+    def wants(self, section, lecture, formats):
+        """
+        Check whether anything of the given lecture, whose resources can
+        have the given formats, is going to be downloaded.
+        """
+        return (self.wants_section(section) and
+                self.wants_lecture(lecture) and
+                any(self.wants_format(fmt) for fmt in formats))
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+
+"""
+Digests of the downloaded files.
+
+The native downloader feeds the bytes to a hasher as it writes them, so
+that the digest costs no extra read of the file. The digest is recorded in
+the manifest, and checked against the one announced by the server in a
+Repr-Digest or Digest header, if any.
+"""
+
+import base64
+import binascii
+import hashlib
+import re
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+# Algorithms that may be asked for on the command line
+DIGEST_ALGORITHMS = ('sha256', 'sha1', 'md5', 'xxhash')
+
+# Names of our algorithms in the Digest (RFC 3230) and Repr-Digest
+# (RFC 9530) headers
+_HEADER_NAMES = {
+    'sha256': 'sha-256',
+    'sha1': 'sha',
+    'md5': 'md5',
+}
+
+_DIGEST_ITEM_RE = re.compile(r'^\s*([\w-]+)\s*=\s*:?([A-Za-z0-9+/=]+):?\s*$')
+
+
+def new_hasher(algorithm):
+    """
+    Return a new hasher (with update and hexdigest methods) for the given
+    algorithm.
+
+    @raise ValueError: If the algorithm is not known or not available.
+    """
+    if algorithm == 'xxhash':
+        if xxhash is None:
+            raise ValueError('xxhash digests need the xxhash module')
+        return xxhash.xxh64()
+    if algorithm not in DIGEST_ALGORITHMS:
+        raise ValueError('Unknown digest algorithm: %r' % algorithm)
+    return hashlib.new(algorithm)
+
+
+def hash_file(filename, algorithm, chunk_size=1048576):
+    """
+    Return a hasher fed with the contents of the file, to carry on hashing
+    the bytes appended to it.
+    """
+    hasher = new_hasher(algorithm)
+    buf = bytearray(chunk_size)
+    view = memoryview(buf)
+    with open(filename, 'rb') as f:
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            hasher.update(view[:n])
+    return hasher
+
+
+def format_digest(algorithm, hasher):
+    """
+    Return the digest as recorded in the manifest, e.g. 'sha256:9f86...'.
+    """
+    return '{0}:{1}'.format(algorithm, hasher.hexdigest())
+
+
+def get_expected_digest(headers, algorithm):
+    """
+    Return the hex digest of the whole file that the server announces for
+    the algorithm in the Repr-Digest or Digest header, or None.
+    """
+    name = _HEADER_NAMES.get(algorithm)
+    if name is None:
+        return None
+
+    for header in ('repr-digest', 'digest'):
+        for item in (headers.get(header) or '').split(','):
+            match = _DIGEST_ITEM_RE.match(item)
+            if match is None or match.group(1).lower() != name:
+                continue
+            try:
+                digest = base64.b64decode(match.group(2))
+            except (TypeError, ValueError, binascii.Error):
+                continue
+            return binascii.hexlify(digest).decode('ascii')
+    return None
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+
+"""
+Manifest of the downloads of a class.
+
+The manifest is an SQLite database, kept in the directory of the class,
+that records for each downloaded file its source URL, the size announced by
+the server, its validators (ETag and Last-Modified), its digest and whether
+the download was completed. With it, we can tell a complete file from one
+that was truncated by an interrupted run.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from .define import PART_SUFFIX
+
+MANIFEST_NAME = '.coursera-dl.sqlite'
+
+# Status of the downloads in the manifest
+PENDING = 'pending'
+COMPLETE = 'complete'
+FAILED = 'failed'
+
+# States of the files, as given by DownloadManifest.get_state
+MISSING = 'missing'  # the file does not exist
+UNKNOWN = 'unknown'  # the file exists, but it is not in the manifest
+PARTIAL = 'partial'  # the download of the file was not completed
+COMPLETED = 'completed'  # the file was completely downloaded
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS resources (
+    path TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    expected_size INTEGER,
+    size INTEGER,
+    etag TEXT,
+    last_modified TEXT,
+    status TEXT NOT NULL,
+    updated REAL NOT NULL,
+    digest TEXT
+)
+'''
+
+_FIELDS = ('path', 'url', 'expected_size', 'size', 'etag', 'last_modified',
+           'status', 'updated', 'digest')
+
+
+class DownloadManifest(object):
+    """
+    Manifest of the files downloaded to the given directory.
+
+    The manifest may be shared by downloads running in several threads.
+
+    :param root: Directory of the class. The paths of the files are
+        recorded relative to it, and a partial file is recorded under the
+        name of its file, so the manifest holds the resume metadata of the
+        partial files.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.path = os.path.join(root, MANIFEST_NAME)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False,
+                                     isolation_level=None)
+        self._conn.execute(_SCHEMA)
+        self._upgrade()
+        logging.debug('Using download manifest %s', self.path)
+
+    def _upgrade(self):
+        """
+        Add the columns that manifests of older versions lack.
+        """
+        columns = [row[1] for row in
+                   self._conn.execute('PRAGMA table_info(resources)')]
+        if 'digest' not in columns:
+            self._conn.execute('ALTER TABLE resources ADD COLUMN digest TEXT')
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _key(self, filename):
+        if filename.endswith(PART_SUFFIX):
+            filename = filename[:-len(PART_SUFFIX)]
+        return os.path.relpath(filename, self.root)
+
+    def get(self, filename):
+        """
+        Return the entry of filename as a dict, or None if there is none.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT %s FROM resources WHERE path = ?' % ', '.join(_FIELDS),
+                (self._key(filename),)).fetchone()
+
+        return dict(zip(_FIELDS, row)) if row else None
+
+    def get_state(self, filename):
+        """
+        Tell whether filename is MISSING, UNKNOWN to the manifest, PARTIAL
+        or COMPLETED.
+
+        A file that only has a partial file, or that was completed but whose
+        size changed since then (e.g., truncated by another program), is
+        PARTIAL.
+        """
+        try:
+            size = os.path.getsize(filename)
+        except OSError:
+            if os.path.exists(filename + PART_SUFFIX):
+                return PARTIAL
+            return MISSING
+
+        entry = self.get(filename)
+        if entry is None:
+            return UNKNOWN
+        if entry['status'] == COMPLETE and entry['size'] == size:
+            return COMPLETED
+        return PARTIAL
+
+    def start(self, filename, url):
+        """
+        Record that the download of url to filename has started.
+        """
+        key = self._key(filename)
+        with self._lock:
+            cursor = self._conn.execute(
+                'UPDATE resources SET url = ?, status = ?, updated = ?, '
+                'digest = NULL WHERE path = ?', (url, PENDING, time.time(),
+                                                 key))
+            if cursor.rowcount == 0:
+                self._conn.execute(
+                    'INSERT INTO resources (path, url, status, updated) '
+                    'VALUES (?, ?, ?, ?)', (key, url, PENDING, time.time()))
+
+    def update(self, filename, expected_size=None, etag=None,
+               last_modified=None):
+        """
+        Record what the server told us about filename.
+        """
+        with self._lock:
+            self._conn.execute(
+                'UPDATE resources SET expected_size = ?, etag = ?, '
+                'last_modified = ? WHERE path = ?',
+                (expected_size, etag, last_modified, self._key(filename)))
+
+    def set_digest(self, filename, digest):
+        """
+        Record the digest of filename, e.g. 'sha256:9f86...'.
+        """
+        with self._lock:
+            self._conn.execute(
+                'UPDATE resources SET digest = ? WHERE path = ?',
+                (digest, self._key(filename)))
+
+    def finish(self, filename, ok):
+        """
+        Record the end of the download of filename.
+
+        The download is only marked as complete if it was successful and the
+        size of the file is the one announced by the server (if any).
+
+        Returns True if the download was marked as complete.
+        """
+        try:
+            size = os.path.getsize(filename)
+        except OSError:
+            size = None
+
+        entry = self.get(filename)
+        expected_size = entry['expected_size'] if entry else None
+
+        complete = ok and size is not None and (
+            expected_size is None or size == expected_size)
+        if ok and not complete:
+            logging.warning('%s has %s bytes instead of %s', filename, size,
+                            expected_size)
+
+        with self._lock:
+            self._conn.execute(
+                'UPDATE resources SET size = ?, status = ?, updated = ? '
+                'WHERE path = ?',
+                (size, COMPLETE if complete else FAILED, time.time(),
+                 self._key(filename)))
+
+        return complete
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+
+"""
+Data model of the material of a class.
+
+A class is a list of modules, each with its sections, each with its
+lectures, each with the resources (videos, subtitles, etc.) to download.
+The classes below use __slots__ and share (intern) the format strings,
+since a catalog of classes may have tens of thousands of lectures.
+
+The sections of a module and the lectures of a section may also be given
+as iterators, when they are produced while the syllabus is still being
+resolved. Such modules and sections can be consumed only once.
+"""
+
+from six.moves import intern
+
+
+def _intern(s):
+    try:
+        return intern(s)
+    except TypeError:  # Python 2 does not intern unicode strings
+        return s
+
+
+class Resource(object):
+    """
+    A file to download.
+
+    :param fmt: Format of the resource, possibly with a language prefix
+        (e.g., "mp4" or "en.srt").
+    :param url: URL of the resource.
+    :param title: Title of the resource (may be empty).
+    """
+
+    __slots__ = ('fmt', 'url', 'title')
+
+    def __init__(self, fmt, url, title=''):
+        self.fmt = _intern(fmt)
+        self.url = url
+        self.title = title
+
+    @property
+    def extension(self):
+        """
+        Format of the resource without the language prefix.
+        """
+        return self.fmt.rsplit('.', 1)[-1]
+
+    def __repr__(self):
+        return 'Resource(%r, %r, %r)' % (self.fmt, self.url, self.title)
+
+
+class Lecture(object):
+    """
+    A lecture, with the list of its resources.
+    """
+
+    __slots__ = ('name', 'resources')
+
+    def __init__(self, name, resources=None):
+        self.name = name
+        self.resources = resources if resources is not None else []
+
+    def __repr__(self):
+        return 'Lecture(%r, %r)' % (self.name, self.resources)
+
+
+class Section(object):
+    """
+    A section of a module, with its lectures.
+    """
+
+    __slots__ = ('name', 'lectures')
+
+    def __init__(self, name, lectures=None):
+        self.name = name
+        self.lectures = lectures if lectures is not None else []
+
+    def __repr__(self):
+        return 'Section(%r, %r)' % (self.name, self.lectures)
+
+
+class Module(object):
+    """
+    A module of a class, with its sections.
+    """
+
+    __slots__ = ('name', 'sections')
+
+    def __init__(self, name, sections=None):
+        self.name = name
+        self.sections = sections if sections is not None else []
+
+    def __repr__(self):
+        return 'Module(%r, %r)' % (self.name, self.sections)
+
+
+def modules_to_json(modules):
+    """
+    Convert a list of modules to nested lists that can be serialized as JSON.
+    """
+    return [[module.name,
+             [[section.name,
+               [[lecture.name,
+                 [[r.fmt, r.url, r.title] for r in lecture.resources]]
+                for lecture in section.lectures]]
+              for section in module.sections]]
+            for module in modules]
+
+
+def modules_from_json(data):
+    """
+    Rebuild the list of modules converted by modules_to_json.
+    """
+    return [Module(module_name,
+                   [Section(section_name,
+                            [Lecture(lecture_name,
+                                     [Resource(fmt, url, title)
+                                      for fmt, url, title in resources])
+                             for lecture_name, resources in lectures])
+                    for section_name, lectures in sections])
+            for module_name, sections in data]
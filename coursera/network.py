@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+
+"""
+Helpers to cut the latency of the connections of the downloads.
+
+A DnsCache keeps the addresses of the hosts for the whole run, instead of
+resolving them again for every new connection, and a ConnectionPrewarmer
+opens the connections to the hosts of the resources (with their TLS
+handshakes) while the syllabus is still being resolved, so that the first
+downloads find them in the pool of the session.
+"""
+
+import logging
+import socket
+import threading
+import time
+
+from multiprocessing.pool import ThreadPool
+
+import requests
+
+from six.moves.urllib_parse import urlparse
+
+
+class DnsCache(object):
+    """
+    Cache of the results of socket.getaddrinfo.
+
+    Failed lookups are not cached.
+
+    :param ttl: Seconds during which a result is reused.
+    :param resolver: The getaddrinfo function to cache.
+    """
+
+    def __init__(self, ttl=300, resolver=None):
+        self.ttl = ttl
+        self.resolver = resolver or socket.getaddrinfo
+
+        self._lock = threading.Lock()
+        self._cache = {}
+
+    def getaddrinfo(self, host, port, *args, **kwargs):
+        key = (host, port, args, tuple(sorted(kwargs.items())))
+        now = time.time()
+        with self._lock:
+            entry = self._cache.get(key)
+        if entry is not None and entry[0] > now:
+            return list(entry[1])
+
+        result = self.resolver(host, port, *args, **kwargs)
+        with self._lock:
+            self._cache[key] = (now + self.ttl, result)
+        return list(result)
+
+    def install(self):
+        """
+        Make the cache answer the lookups of the whole process.
+        """
+        socket.getaddrinfo = self.getaddrinfo
+
+    def uninstall(self):
+        if socket.getaddrinfo == self.getaddrinfo:
+            socket.getaddrinfo = self.resolver
+
+
+class ConnectionPrewarmer(object):
+    """
+    Opens connections to the host of a URL the first time that the host is
+    seen, in background threads, and leaves them in the pool of the
+    session.
+
+    The connections are opened with HEAD requests of the URL, so the pool
+    of the session has to keep at least `connections` connections per host.
+
+    :param session: Requests session whose pools get the connections.
+    :param connections: Number of connections to open to each host.
+    """
+
+    def __init__(self, session, connections=1):
+        self.session = session
+        self.connections = connections
+
+        self._lock = threading.Lock()
+        self._hosts = set()
+        self._pool = ThreadPool(connections)
+
+    def warm(self, url):
+        """
+        Open the connections to the host of url, unless that was already
+        done. Returns at once.
+        """
+        parts = urlparse(url)
+        if parts.scheme not in ('http', 'https'):
+            return
+        host = (parts.scheme, parts.netloc)
+        with self._lock:
+            if host in self._hosts:
+                return
+            self._hosts.add(host)
+
+        logging.debug('Opening %d connections to %s', self.connections,
+                      parts.netloc)
+        for _ in range(self.connections):
+            self._pool.apply_async(self._open, (url,))
+
+    def _open(self, url):
+        try:
+            self.session.head(url, allow_redirects=False).close()
+        except requests.exceptions.RequestException as e:
+            logging.debug('Could not open a connection for %s: %s', url, e)
+
+    def close(self):
+        # the connections are only a head start, don't wait for them
+        self._pool.terminate()
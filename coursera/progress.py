@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+
+"""
+Rendering of the progress of the downloads.
+
+The downloads only update their byte counters; a ProgressRenderer gathers
+the counters of all the active downloads and draws them from a background
+thread at a fixed rate, so that the cost of the output doesn't grow with
+the throughput or the number of simultaneous downloads.
+"""
+
+from __future__ import print_function
+
+import math
+import os
+import sys
+import threading
+import time
+
+try:
+    from shutil import get_terminal_size
+except ImportError:
+    get_terminal_size = None
+
+
+def format_bytes(bytes):
+    """
+    Get human readable version of given bytes.
+    Ripped from https://github.com/rg3/youtube-dl
+    """
+    if bytes is None:
+        return 'N/A'
+    if type(bytes) is str:
+        bytes = float(bytes)
+    if bytes == 0.0:
+        exponent = 0
+    else:
+        exponent = int(math.log(bytes, 1024.0))
+    suffix = ['B', 'KB', 'MB', 'GB', 'TB', 'PB', 'EB', 'ZB', 'YB'][exponent]
+    converted = float(bytes) / float(1024 ** exponent)
+    return '{0:.2f}{1}'.format(converted, suffix)
+
+
+def format_speed(bytes, seconds):
+    """
+    Get human readable version of a throughput.
+    """
+    if bytes <= 0 or seconds < 0.001:  # One millisecond
+        return '---b/s'
+    return '{0}/s'.format(format_bytes(float(bytes) / seconds))
+
+
+def _terminal_width(stream):
+    if get_terminal_size is None:
+        return 80
+    try:
+        return os.get_terminal_size(stream.fileno()).columns
+    except (AttributeError, ValueError, OSError):
+        return get_terminal_size().columns
+
+
+class ProgressRenderer(object):
+    """
+    Draws the progress of all the active downloads every `interval`
+    seconds.
+
+    On a terminal, a single status line with the total throughput and the
+    progress and throughput of each file is redrawn in place. Otherwise, a
+    summary line is printed every `summary_interval` seconds. In both cases
+    a line is printed for each finished file.
+
+    The progress objects (see downloaders.DownloadProgress) are added when
+    their download starts and removed when it ends; the drawing thread runs
+    while there are active downloads.
+
+    :param interval: Seconds between two redraws of the status line.
+    :param summary_interval: Seconds between two summary lines when the
+        output is not a terminal.
+    :param stream: Where to draw (defaults to sys.stdout).
+    """
+
+    def __init__(self, interval=0.5, summary_interval=10, stream=None):
+        self.interval = interval
+        self.summary_interval = summary_interval
+        self.stream = stream or sys.stdout
+        self.is_tty = hasattr(self.stream, 'isatty') and self.stream.isatty()
+
+        self._lock = threading.Lock()
+        self._active = []
+        self._thread = None
+        self._stop = None
+
+        # bytes of the finished downloads, for the total throughput
+        self._done_bytes = 0
+        self._last_bytes = 0
+        self._last_time = None
+        self._last_summary = 0
+        self._line_width = 0
+
+    def add(self, name, progress):
+        """
+        Start drawing the progress of a download.
+        """
+        with self._lock:
+            self._active.append((name, progress))
+            if self._thread is None:
+                self._last_time = time.time()
+                self._last_bytes = self._done_bytes
+                self._last_summary = self._last_time
+                self._stop = threading.Event()
+                self._thread = threading.Thread(target=self._run,
+                                                args=(self._stop,))
+                self._thread.daemon = True
+                self._thread.start()
+
+    def remove(self, name, progress):
+        """
+        Stop drawing the progress of a finished download, and print its
+        final line.
+        """
+        with self._lock:
+            try:
+                self._active.remove((name, progress))
+            except ValueError:
+                return
+            self._done_bytes += progress.current
+            self._write_line(self.format_finished(name, progress))
+
+            if not self._active:
+                self._stop_thread()
+
+    def _stop_thread(self):
+        thread = self._thread
+        if thread is not None:
+            self._stop.set()
+            self._thread = self._stop = None
+        return thread
+
+    def close(self):
+        """
+        Stop drawing, even if some downloads are still active.
+        """
+        with self._lock:
+            self._active = []
+            thread = self._stop_thread()
+        if thread is not None:
+            thread.join()
+
+    def _run(self, stop):
+        while not stop.wait(self.interval):
+            with self._lock:
+                if stop.is_set():
+                    break
+                self._draw()
+
+    def _total_bytes(self):
+        return self._done_bytes + sum(progress.current
+                                      for _, progress in self._active)
+
+    @staticmethod
+    def format_file(name, progress):
+        """
+        Short description of the progress of a download.
+        """
+        if progress.total:
+            percent = '{0}%'.format(
+                int(float(progress.current) / progress.total * 100.0))
+        else:
+            percent = format_bytes(progress.current)
+        return '{0} {1} {2}'.format(os.path.basename(name), percent,
+                                    progress.calc_speed())
+
+    @staticmethod
+    def format_finished(name, progress):
+        """
+        Line printed when a download ends.
+        """
+        return '{0: <56} {1: >30}'.format(
+            os.path.basename(name), '{0} at {1}'.format(
+                format_bytes(progress.current), progress.calc_speed()))
+
+    def format_status(self, now=None):
+        """
+        Status line with the total throughput since the previous call and
+        the progress of each active download.
+        """
+        now = now or time.time()
+        total = self._total_bytes()
+        speed = format_speed(total - self._last_bytes, now - self._last_time)
+        self._last_bytes = total
+        self._last_time = now
+
+        files = ' | '.join(self.format_file(name, progress)
+                           for name, progress in self._active)
+        return '[{0} active] {1} at {2} | {3}'.format(
+            len(self._active), format_bytes(total), speed, files)
+
+    def _write_line(self, line):
+        if self.is_tty:
+            # erase the status line before writing over it
+            self.stream.write('\r' + ' ' * self._line_width + '\r')
+            self._line_width = 0
+        self.stream.write(line + '\n')
+        self.stream.flush()
+
+    def _draw(self):
+        now = time.time()
+        if self.is_tty:
+            width = _terminal_width(self.stream) - 1
+            line = self.format_status(now)[:width]
+            padding = ' ' * max(0, self._line_width - len(line))
+            self.stream.write('\r' + line + padding)
+            self._line_width = len(line)
+            self.stream.flush()
+        elif now - self._last_summary >= self.summary_interval:
+            self._last_summary = now
+            self._write_line(self.format_status(now))
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+
+"""
+Limits of the total download speed.
+
+A RateSchedule tells the limit at a given time of the day, and a
+TokenBucket shared by all the downloads makes them stay under it
+together.
+"""
+
+import datetime
+import re
+import threading
+import time
+
+_RATE_RE = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*([kmg]?)b?\s*$', re.IGNORECASE)
+_WINDOW_RE = re.compile(r'^\s*(\d{1,2}):(\d{2})\s*-\s*(\d{1,2}):(\d{2})\s*$')
+_UNITS = {'': 1, 'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3}
+
+
+def parse_rate(text):
+    """
+    Parse a speed in bytes per second, like 500K or 20M. Returns None for
+    no limit (0 or 'unlimited').
+
+    @raise ValueError: If the speed is not valid.
+    """
+    if text.strip().lower() in ('unlimited', 'none'):
+        return None
+    match = _RATE_RE.match(text)
+    if match is None:
+        raise ValueError('Invalid speed: %r' % text)
+    rate = int(float(match.group(1)) * _UNITS[match.group(2).lower()])
+    return rate or None
+
+
+def _parse_window(text):
+    match = _WINDOW_RE.match(text)
+    if match is None:
+        raise ValueError('Invalid time window: %r' % text)
+    start_h, start_m, end_h, end_m = [int(g) for g in match.groups()]
+    if start_h > 23 or end_h > 24 or start_m > 59 or end_m > 59:
+        raise ValueError('Invalid time window: %r' % text)
+    return start_h * 60 + start_m, end_h * 60 + end_m
+
+
+class RateSchedule(object):
+    """
+    Speed limits that change with the time of the day.
+
+    :param default: Limit in bytes per second outside of the windows, or
+        None for no limit.
+    :param windows: List of (start, end, rate), where start and end are
+        minutes since midnight and rate is the limit in bytes per second
+        (or None) from start to end. A window with start > end goes past
+        midnight. The first matching window wins.
+    """
+
+    def __init__(self, default=None, windows=None):
+        self.default = default
+        self.windows = windows or []
+
+    @classmethod
+    def parse(cls, default, schedule=None):
+        """
+        Build a schedule from the texts of the command line: a default
+        speed and a comma separated list of HH:MM-HH:MM=SPEED windows, like
+        '09:00-18:00=20M,18:00-23:00=50M'.
+
+        @raise ValueError: If a speed or a window is not valid.
+        """
+        windows = []
+        for item in (schedule or '').split(','):
+            if not item.strip():
+                continue
+            window, sep, rate = item.partition('=')
+            if not sep:
+                raise ValueError('Invalid schedule entry: %r' % item)
+            start, end = _parse_window(window)
+            windows.append((start, end, parse_rate(rate)))
+        return cls(parse_rate(default) if default else None, windows)
+
+    def get_rate(self, now=None):
+        """
+        Return the limit in bytes per second at the given datetime (or now),
+        or None if there is none.
+        """
+        now = now or datetime.datetime.now()
+        minute = now.hour * 60 + now.minute
+        for start, end, rate in self.windows:
+            if start <= end:
+                if start <= minute < end:
+                    return rate
+            elif minute >= start or minute < end:
+                return rate
+        return self.default
+
+    def is_limited(self):
+        """
+        Tell whether there is a limit at some time of the day.
+        """
+        return (self.default is not None or
+                any(rate is not None for _, _, rate in self.windows))
+
+
+class TokenBucket(object):
+    """
+    Token bucket shared by the downloads to keep their total speed under
+    the limit of a RateSchedule.
+
+    Every byte read takes a token; tokens come back at the current rate, up
+    to `burst` seconds worth of them. A download that takes more tokens
+    than there are has to wait until the bucket is back to zero, so the
+    downloads running at once share the limit.
+
+    :param schedule: RateSchedule with the limits.
+    :param burst: Seconds of unused limit that may be spent at once.
+    """
+
+    def __init__(self, schedule, burst=1.0):
+        self.schedule = schedule
+        self.burst = burst
+
+        self._lock = threading.Lock()
+        self._tokens = 0.0
+        self._last = time.time()
+        self._rate = None
+        self._rate_checked = 0
+
+    def get_rate(self):
+        """
+        Return the current limit in bytes per second, or None.
+        """
+        now = time.time()
+        # the schedule works with minutes, don't look at it for every read
+        if now - self._rate_checked >= 1:
+            self._rate = self.schedule.get_rate()
+            self._rate_checked = now
+        return self._rate
+
+    def reserve(self, n):
+        """
+        Take n tokens, and return the seconds to wait before using them.
+        """
+        with self._lock:
+            now = time.time()
+            rate = self.get_rate()
+            if rate is None:
+                self._tokens = 0.0
+                self._last = now
+                return 0
+
+            self._tokens = min(rate * self.burst,
+                               self._tokens + (now - self._last) * rate)
+            self._last = now
+            self._tokens -= n
+            if self._tokens >= 0:
+                return 0
+            return -self._tokens / rate
+
+    def consume(self, n):
+        """
+        Take n tokens, waiting until they are available.
+        """
+        delay = self.reserve(n)
+        if delay > 0:
+            time.sleep(delay)
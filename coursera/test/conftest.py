@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+
+"""
+Fixtures shared by the tests.
+"""
+
+import gzip
+import io
+import socket
+import threading
+import time
+
+import pytest
+
+from six.moves import BaseHTTPServer, socketserver
+
+
+class _FileHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    Serves the files of the server, honouring Range requests unless the
+    server is told to ignore them, and dropping the connection or hanging
+    after the given numbers of bytes of the body, or corrupting it. Files
+    may be sent gzip-encoded.
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        self.server.connections.append(self.client_address)
+
+    def do_HEAD(self):
+        self.do_GET(send_body=False)
+
+    def do_GET(self, send_body=True):
+        server = self.server
+        server.requests.append((self.path, dict(self.headers)))
+
+        data = server.files.get(self.path)
+        if data is None:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        if self.path in server.gzip:
+            buf = io.BytesIO()
+            with gzip.GzipFile(fileobj=buf, mode='wb') as f:
+                f.write(data)
+            data = buf.getvalue()
+
+        start, end = 0, len(data) - 1
+        status = 200
+        range_header = self.headers.get('Range')
+        if range_header and server.accept_ranges:
+            first, _, last = range_header.split('=', 1)[1].partition('-')
+            start = int(first)
+            if last:
+                end = min(int(last), end)
+            if start >= len(data):
+                self.send_response(416)
+                self.send_header('Content-Range', 'bytes */%d' % len(data))
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            status = 206
+
+        body = data[start:end + 1]
+        if server.corruptions.get(self.path) and body:
+            server.corruptions[self.path] -= 1
+            body = b'\0' + body[1:] if body[:1] != b'\0' else b'\1' + body[1:]
+
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', '"%d"' % len(data))
+        if self.path in server.gzip:
+            self.send_header('Content-Encoding', 'gzip')
+        if server.accept_ranges:
+            self.send_header('Accept-Ranges', 'bytes')
+        if status == 206:
+            self.send_header('Content-Range',
+                             'bytes %d-%d/%d' % (start, end, len(data)))
+        for name, value in server.headers.get(self.path, {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+
+        if send_body:
+            cuts = server.interruptions.get(self.path)
+            if cuts:
+                # drop the connection in the middle of the body
+                self.wfile.write(body[:cuts.pop(0)])
+                self.close_connection = True
+                return
+            stalls = server.stalls.get(self.path)
+            if stalls:
+                # hang in the middle of the body
+                sent, seconds = stalls.pop(0)
+                self.wfile.write(body[:sent])
+                self.wfile.flush()
+                time.sleep(seconds)
+                try:
+                    self.wfile.write(body[sent:])
+                except socket.error:
+                    self.close_connection = True
+                return
+            self.wfile.write(body)
+
+
+class _Server(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+@pytest.fixture
+def http_server():
+    """
+    A local HTTP server. Add files to its `files` dict (path -> bytes) and
+    look at the requests that it got in its `requests` list, and at the
+    connections that were opened to it in its `connections` list.
+
+    Add a list of sizes to its `interruptions` dict (path -> [bytes, ...])
+    to drop the connection of the next requests of path after that many
+    bytes of the body. Add a list of (bytes, seconds) to its `stalls` dict
+    to hang for that many seconds after that many bytes instead.
+
+    Add extra headers to its `headers` dict (path -> {name: value}), and a
+    count to its `corruptions` dict (path -> n) to change the first byte of
+    the body of the next n requests of path. Add a path to its `gzip` set
+    to send that file gzip-encoded.
+    """
+    server = _Server(('127.0.0.1', 0), _FileHandler)
+    server.files = {}
+    server.requests = []
+    server.connections = []
+    server.interruptions = {}
+    server.stalls = {}
+    server.headers = {}
+    server.corruptions = {}
+    server.gzip = set()
+    server.accept_ranges = True
+    server.url = 'http://127.0.0.1:%d' % server.server_address[1]
+
+    thread = threading.Thread(target=server.serve_forever,
+                              kwargs={'poll_interval': 0.05})
+    thread.daemon = True
+    thread.start()
+
+    yield server
+
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+
+"""
+Test the aria2 RPC downloader against a fake aria2.
+"""
+
+import json
+import os
+import threading
+
+import pytest
+import requests
+
+from six.moves import BaseHTTPServer, socketserver
+
+from coursera import aria2_rpc
+
+
+class _Aria2Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    Answers the calls like aria2 would: the downloads are 'active' for the
+    first tellActive after they are added, then 'complete' (after writing
+    their file) unless their URL has 'missing' in it.
+    """
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        server = self.server
+        request = json.loads(self.rfile.read(
+            int(self.headers['Content-Length'])).decode('utf-8'))
+        params = request['params']
+        server.calls.append((request['method'], params))
+
+        if params[:1] != ['token:secret']:
+            reply = {'error': {'code': 1, 'message': 'Unauthorized'}}
+        else:
+            reply = {'result': self._call(request['method'], params[1:])}
+        reply.update({'jsonrpc': '2.0', 'id': request['id']})
+
+        body = json.dumps(reply).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _call(self, method, params):
+        downloads = self.server.downloads
+        if method == 'aria2.addUri':
+            gid = '%016d' % len(downloads)
+            downloads[gid] = {'gid': gid, 'status': 'active',
+                              'totalLength': '0', 'completedLength': '0',
+                              'uris': params[0], 'options': params[1]}
+            return gid
+        if method == 'aria2.tellActive':
+            active = [d for d in downloads.values()
+                      if d['status'] == 'active']
+            for d in active:
+                self._finish(d)
+            return active
+        if method == 'aria2.tellWaiting':
+            return []
+        if method == 'aria2.tellStopped':
+            return [d for d in downloads.values() if d['status'] != 'active']
+        if method == 'aria2.removeDownloadResult':
+            del downloads[params[0]]
+            return 'OK'
+        return 'OK'
+
+    def _finish(self, d):
+        if 'missing' in d['uris'][0]:
+            d.update(status='error', errorMessage='Not Found')
+            return
+        path = os.path.join(d['options']['dir'], d['options']['out'])
+        with open(path, 'w') as f:
+            f.write('data')
+        d.update(status='complete', totalLength='4', completedLength='4')
+
+
+@pytest.fixture
+def aria2():
+    server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), _Aria2Handler)
+    server.calls = []
+    server.downloads = {}
+    thread = threading.Thread(target=server.serve_forever,
+                              kwargs={'poll_interval': 0.05})
+    thread.daemon = True
+    thread.start()
+
+    yield server
+
+    server.shutdown()
+    server.server_close()
+
+
+def _downloader(aria2):
+    session = requests.Session()
+    session.cookies.set('CAUTH', 'cookie', domain='.coursera.org')
+    url = 'http://127.0.0.1:%d/jsonrpc' % aria2.server_address[1]
+    server = aria2_rpc.get_rpc_server(url=url, secret='secret')
+    return aria2_rpc.Aria2RpcDownloader(session, server, poll_interval=0.01)
+
+
+def test_downloads(aria2, tmpdir):
+    d = _downloader(aria2)
+    d.download('https://www.coursera.org/a.mp4', str(tmpdir.join('a.mp4')))
+    d.download('https://www.coursera.org/missing.srt',
+               str(tmpdir.join('b.srt')), resume=True)
+    assert tmpdir.listdir() == []
+
+    assert d.join() == 1
+    d.close()
+
+    assert tmpdir.join('a.mp4').read() == 'data'
+    # the results were removed from aria2
+    assert aria2.downloads == {}
+
+    add_a, add_b = [params for method, params in aria2.calls
+                    if method == 'aria2.addUri']
+    assert add_a[1:] == [['https://www.coursera.org/a.mp4'], {
+        'dir': str(tmpdir), 'out': 'a.mp4.part', 'allow-overwrite': 'true',
+        'header': ['Cookie: CAUTH=cookie']}]
+    assert add_b[2]['continue'] == 'true'
+
+
+def test_rate_limit_follows_limiter(aria2, tmpdir):
+    from coursera.ratelimit import RateSchedule, TokenBucket
+
+    d = _downloader(aria2)
+    d.limiter = TokenBucket(RateSchedule(1000))
+    d.download('https://www.coursera.org/a.mp4', str(tmpdir.join('a.mp4')))
+    assert d.join() == 0
+
+    assert ('aria2.changeGlobalOption',
+            ['token:secret', {'max-overall-download-limit': '1000'}]
+            ) in aria2.calls
+
+
+def test_wrong_secret(aria2):
+    url = 'http://127.0.0.1:%d/jsonrpc' % aria2.server_address[1]
+    server = aria2_rpc.Aria2RpcServer(url, 'wrong')
+    with pytest.raises(aria2_rpc.Aria2RpcError):
+        server.call('getVersion')
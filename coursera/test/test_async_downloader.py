@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+
+"""
+Test the asyncio downloader.
+"""
+
+import os
+
+import pytest
+import requests
+
+pytest.importorskip('aiohttp')
+
+from coursera.async_downloader import AsyncioDownloader  # noqa: E402
+from coursera.downloaders import RetryPolicy  # noqa: E402
+from coursera.manifest import DownloadManifest, COMPLETED  # noqa: E402
+
+
+@pytest.fixture
+def downloader():
+    session = requests.Session()
+    session.cookies.set('CAUTH', 'secret', domain='127.0.0.1')
+    d = AsyncioDownloader(session, jobs=8, max_per_host=4)
+    yield d
+    d.close()
+
+
+def test_many_concurrent_downloads(http_server, downloader, tmpdir):
+    for n in range(50):
+        http_server.files['/%d.srt' % n] = ('subtitle %d' % n).encode('ascii')
+
+    for n in range(50):
+        downloader.download(http_server.url + '/%d.srt' % n,
+                            str(tmpdir.join('%d.srt' % n)))
+    assert downloader.join() == 0
+
+    for n in range(50):
+        assert tmpdir.join('%d.srt' % n).read() == 'subtitle %d' % n
+
+    # the cookies of the requests session are sent
+    assert all('CAUTH=secret' in headers.get('Cookie', '')
+               for _, headers in http_server.requests)
+
+
+def test_resume(http_server, downloader, tmpdir):
+    http_server.files['/video.mp4'] = b'0123456789'
+    filename = str(tmpdir.join('video.mp4'))
+    with open(filename, 'wb') as f:
+        f.write(b'0123')
+
+    downloader.download(http_server.url + '/video.mp4', filename, resume=True)
+    assert downloader.join() == 0
+
+    assert tmpdir.join('video.mp4').read() == '0123456789'
+    assert http_server.requests[-1][1]['Range'] == 'bytes=4-'
+
+    # 416: nothing left to download
+    downloader.download(http_server.url + '/video.mp4', filename, resume=True)
+    assert downloader.join() == 0
+    assert tmpdir.join('video.mp4').read() == '0123456789'
+
+
+def test_manifest_and_failures(http_server, downloader, tmpdir):
+    # retry at once
+    downloader.retry = RetryPolicy(base_delay=0)
+
+    http_server.files['/video.mp4'] = b'0123456789'
+    manifest = DownloadManifest(str(tmpdir))
+    downloader.manifest = manifest
+
+    ok = str(tmpdir.join('video.mp4'))
+    missing = str(tmpdir.join('missing.mp4'))
+    downloader.download(http_server.url + '/video.mp4', ok)
+    downloader.download(http_server.url + '/missing.mp4', missing)
+
+    assert downloader.join() == 1
+    assert manifest.get_state(ok) == COMPLETED
+    assert manifest.get(ok)['expected_size'] == 10
+    assert manifest.get(ok)['etag'] == '"10"'
+    assert not os.path.exists(missing)
+    manifest.close()
+
+
+def test_encoded_download_is_complete(http_server, downloader, tmpdir):
+    http_server.files['/subtitles.srt'] = b'subtitle ' * 300
+    http_server.gzip.add('/subtitles.srt')
+    manifest = DownloadManifest(str(tmpdir))
+    downloader.manifest = manifest
+
+    filename = str(tmpdir.join('subtitles.srt'))
+    downloader.download(http_server.url + '/subtitles.srt', filename)
+    assert downloader.join() == 0
+
+    # aiohttp decodes the body, whose size is not the Content-Length
+    assert tmpdir.join('subtitles.srt').read_binary() == b'subtitle ' * 300
+    assert manifest.get_state(filename) == COMPLETED
+    assert manifest.get(filename)['expected_size'] is None
+    manifest.close()
+
+
+def test_close_cancels_running_downloads(tmpdir):
+    import asyncio
+    import time
+
+    d = AsyncioDownloader(requests.Session(), jobs=2)
+    d._fetch = lambda url, filename, resume: asyncio.sleep(60)
+    finished = []
+    d._finish = lambda filename, ok: finished.append(filename)
+
+    for n in range(4):
+        d.download('http://example.org/%d.mp4' % n,
+                   str(tmpdir.join('%d.mp4' % n)))
+    time.sleep(0.1)
+    assert len(d._tasks) == 4
+
+    start = time.time()
+    d.close()
+    # the downloads are over before close returns
+    assert time.time() - start < 5
+    assert not d._tasks
+    assert finished == []
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+
+"""
+Test the metadata cache.
+"""
+
+import json
+import os
+import time
+
+import pytest
+
+from mock import Mock
+
+from coursera import cache
+from coursera import coursera_dl
+
+
+@pytest.fixture
+def metadata_path(monkeypatch, tmpdir):
+    path = str(tmpdir.join('metadata'))
+    monkeypatch.setattr(cache, 'PATH_METADATA', path)
+    return path
+
+
+def test_read_missing_entry(metadata_path):
+    assert cache.read_cache('video', 'nothing') is None
+
+
+def test_write_and_read_entry(metadata_path):
+    cache.write_cache('video', 'abc', {'mp4': 'http://example.org/a.mp4'})
+
+    assert os.path.exists(os.path.join(metadata_path, 'video', 'abc.json'))
+    assert cache.read_cache('video', 'abc') == {
+        'mp4': 'http://example.org/a.mp4'}
+
+
+def test_overwrite_entry(metadata_path):
+    cache.write_cache('video', 'abc', {'mp4': 'old'})
+    cache.write_cache('video', 'abc', {'mp4': 'new'})
+
+    assert cache.read_cache('video', 'abc') == {'mp4': 'new'}
+    assert os.listdir(os.path.join(metadata_path, 'video')) == ['abc.json']
+
+
+def test_expired_entry_is_ignored(metadata_path):
+    cache.write_cache('video', 'abc', {'mp4': 'url'})
+    old = time.time() - 3600
+    os.utime(cache.get_cache_path('video', 'abc'), (old, old))
+
+    assert cache.read_cache('video', 'abc', ttl=60) is None
+    assert cache.read_cache('video', 'abc', ttl=7200) == {'mp4': 'url'}
+
+
+def test_corrupt_entry_is_ignored(metadata_path):
+    cache.write_cache('video', 'abc', {'mp4': 'url'})
+    with open(cache.get_cache_path('video', 'abc'), 'w') as f:
+        f.write('{"mp4": ')
+
+    assert cache.read_cache('video', 'abc') is None
+
+
+VIDEO_JSON = json.dumps({
+    'sources': [
+        {'resolution': '720p',
+         'formatSources': {'video/mp4': 'https://cdn.example.org/720.mp4'}},
+        {'resolution': '360p',
+         'formatSources': {'video/mp4': 'https://cdn.example.org/360.mp4'}},
+    ],
+    'subtitles': {'en': '/api/subtitles/en'},
+})
+
+
+def test_video_url_is_cached(metadata_path, monkeypatch):
+    get_page_json = Mock(return_value=json.loads(VIDEO_JSON))
+    monkeypatch.setattr(coursera_dl, 'get_page_json', get_page_json)
+
+    first = coursera_dl.get_on_demand_video_url(None, 'v1', 'en', '720p',
+                                                cache_ttl=60)
+    second = coursera_dl.get_on_demand_video_url(None, 'v1', 'en', '720p',
+                                                 cache_ttl=60)
+
+    assert first == second
+    assert first['mp4'] == 'https://cdn.example.org/720.mp4'
+    assert get_page_json.call_count == 1
+
+    # a different resolution is a different entry
+    coursera_dl.get_on_demand_video_url(None, 'v1', 'en', '360p',
+                                        cache_ttl=60)
+    assert get_page_json.call_count == 2
+
+
+def test_video_url_cache_refresh(metadata_path, monkeypatch):
+    get_page_json = Mock(return_value=json.loads(VIDEO_JSON))
+    monkeypatch.setattr(coursera_dl, 'get_page_json', get_page_json)
+
+    coursera_dl.get_on_demand_video_url(None, 'v1', 'en', '720p',
+                                        cache_ttl=60)
+    coursera_dl.get_on_demand_video_url(None, 'v1', 'en', '720p',
+                                        cache_ttl=60, refresh_cache=True)
+    assert get_page_json.call_count == 2
+
+
+@pytest.mark.parametrize("expires_in,call_count", [
+    (60, 2),
+    (24 * 60 * 60, 1),
+])
+def test_video_url_cache_expiry(metadata_path, monkeypatch, expires_in,
+                                call_count):
+    dom = json.loads(VIDEO_JSON)
+    dom['sources'][0]['formatSources']['video/mp4'] += (
+        '?Expires=%d&Signature=abc' % (time.time() + expires_in))
+    get_page_json = Mock(return_value=dom)
+    monkeypatch.setattr(coursera_dl, 'get_page_json', get_page_json)
+
+    coursera_dl.get_on_demand_video_url(None, 'v1', 'en', '720p',
+                                        cache_ttl=60)
+    coursera_dl.get_on_demand_video_url(None, 'v1', 'en', '720p',
+                                        cache_ttl=60)
+    # signed URLs that are about to expire are resolved again
+    assert get_page_json.call_count == call_count
+
+
+def test_video_url_without_cache(metadata_path, monkeypatch):
+    get_page_json = Mock(return_value=json.loads(VIDEO_JSON))
+    monkeypatch.setattr(coursera_dl, 'get_page_json', get_page_json)
+
+    coursera_dl.get_on_demand_video_url(None, 'v1', 'en', '720p')
+    coursera_dl.get_on_demand_video_url(None, 'v1', 'en', '720p')
+
+    assert get_page_json.call_count == 2
+    assert not os.path.exists(metadata_path)
+
+
+def _get_syllabus_session(status_code, text='', headers=None):
+    response = Mock()
+    response.status_code = status_code
+    response.text = text
+    response.headers = headers or {}
+    session = Mock()
+    session.get = Mock(return_value=response)
+    return session
+
+
+def test_syllabus_is_cached_with_validators(metadata_path):
+    session = _get_syllabus_session(
+        200, '{"syllabus": 1}', {'ETag': '"abc"',
+                                 'Last-Modified': 'Mon, 01 Jun 2015'})
+
+    page = coursera_dl.get_on_demand_syllabus(session, 'ml')
+
+    assert page == '{"syllabus": 1}'
+    assert session.get.call_args[1]['headers'] == {}
+    assert cache.read_cache('syllabus', 'ml') == {
+        'etag': '"abc"',
+        'last_modified': 'Mon, 01 Jun 2015',
+        'page': '{"syllabus": 1}',
+    }
+
+
+def test_syllabus_not_modified(metadata_path):
+    cache.write_cache('syllabus', 'ml', {
+        'etag': '"abc"', 'last_modified': None, 'page': '{"syllabus": 1}'})
+    session = _get_syllabus_session(304)
+
+    page = coursera_dl.get_on_demand_syllabus(session, 'ml')
+
+    assert page == '{"syllabus": 1}'
+    assert session.get.call_args[1]['headers'] == {'If-None-Match': '"abc"'}
+
+
+def test_syllabus_modified(metadata_path):
+    cache.write_cache('syllabus', 'ml', {
+        'etag': None, 'last_modified': 'Mon, 01 Jun 2015',
+        'page': '{"syllabus": 1}'})
+    session = _get_syllabus_session(
+        200, '{"syllabus": 2}', {'Last-Modified': 'Tue, 02 Jun 2015'})
+
+    page = coursera_dl.get_on_demand_syllabus(session, 'ml')
+
+    assert page == '{"syllabus": 2}'
+    assert session.get.call_args[1]['headers'] == {
+        'If-Modified-Since': 'Mon, 01 Jun 2015'}
+    assert cache.read_cache('syllabus', 'ml')['page'] == '{"syllabus": 2}'
+
+
+def test_syllabus_refresh(metadata_path):
+    cache.write_cache('syllabus', 'ml', {
+        'etag': '"abc"', 'last_modified': None, 'page': '{"syllabus": 1}'})
+    session = _get_syllabus_session(200, '{"syllabus": 2}')
+
+    page = coursera_dl.get_on_demand_syllabus(session, 'ml',
+                                              refresh_cache=True)
+
+    assert page == '{"syllabus": 2}'
+    assert session.get.call_args[1]['headers'] == {}
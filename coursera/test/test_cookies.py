@@ -6,6 +6,7 @@ Test syllabus parsing.
 """
 
 import os.path
+import pytest
 import requests
 from six.moves import http_cookiejar as cookielib
 
@@ -108,3 +109,86 @@ def test_make_cookie_values():
     values = 'csrf_token=csrfclass001; session=sessionclass1'
     cookie_values = cookies.make_cookie_values(cj, 'class-001')
     assert cookie_values == values
+
+
+def test_timeout_adapter_sets_default_timeout(http_server):
+    http_server.files['/page'] = b'page'
+    session = requests.Session()
+    session.mount('http://', cookies.TimeoutAdapter((1, 2)))
+
+    sent = []
+    send = cookies.HTTPAdapter.send
+
+    def spy(self, request, **kwargs):
+        sent.append(kwargs['timeout'])
+        return send(self, request, **kwargs)
+
+    cookies.HTTPAdapter.send = spy
+    try:
+        session.get(http_server.url + '/page')
+        session.get(http_server.url + '/page', timeout=5)
+    finally:
+        cookies.HTTPAdapter.send = send
+
+    assert sent == [(1, 2), 5]
+
+
+def test_timeout_adapter_times_out(http_server):
+    http_server.files['/page'] = b'page'
+    http_server.stalls['/page'] = [(2, 1)]
+    session = requests.Session()
+    session.mount('http://', cookies.TimeoutAdapter((1, 0.1)))
+
+    r = session.get(http_server.url + '/page', stream=True)
+    with pytest.raises(requests.exceptions.ConnectionError):
+        r.content
+
+
+def test_session_login_logs_in_once():
+    import threading
+
+    from mock import Mock
+
+    session = requests.Session()
+    posts = []
+
+    def post(url, **kwargs):
+        import time
+        time.sleep(0.02)
+        posts.append(url)
+        # the cookie set by the answer of the authenticator
+        session.cookies.set('CAUTH', 'cauth', domain='.coursera.org')
+        return Mock(raise_for_status=lambda: None)
+
+    session.post = post
+    session_login = cookies.SessionLogin(session, 'bob', 'bill')
+
+    threads = [threading.Thread(target=session_login.ensure_logged_in)
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    session_login.ensure_logged_in()
+
+    assert posts == [cookies.AUTH_URL_V3]
+
+    # another SessionLogin of the logged in session doesn't log in again
+    cookies.SessionLogin(session, 'bob', 'bill').ensure_logged_in()
+    assert len(posts) == 1
+
+
+def test_session_login_does_not_retry_failures(monkeypatch):
+    logins = []
+
+    def login(session, username, password, class_name=None):
+        logins.append(username)
+        raise cookies.AuthenticationFailed('Cannot login on coursera.org.')
+
+    monkeypatch.setattr(cookies, 'login', login)
+    session_login = cookies.SessionLogin(requests.Session(), 'bob', 'bill')
+
+    for _ in range(2):
+        with pytest.raises(cookies.AuthenticationFailed):
+            session_login.ensure_logged_in()
+    assert logins == ['bob']
@@ -6,40 +6,55 @@ Test the downloaders.
 
 from coursera import downloaders
 from coursera import coursera_dl
+from coursera.models import Lecture, Resource
 
 import pytest
 
 
 @pytest.fixture
 def sample_bag():
-    sample_bag = {
-        'mp4': [['h://url1/lc1.mp4', 'video']],
-        'pdf': [['h://url2/lc2.pdf', 'slides']],
-        'txt': [['h://url3/lc3.txt', 'subtitle']]
-    }
+    sample_bag = Lecture('lecture', [
+        Resource('mp4', 'h://url1/lc1.mp4', 'video'),
+        Resource('pdf', 'h://url2/lc2.pdf', 'slides'),
+        Resource('txt', 'h://url3/lc3.txt', 'subtitle'),
+        Resource('en.srt', 'h://url4/lc4.srt', ''),
+    ])
     return sample_bag
 
 
+def _as_tuples(resources):
+    return sorted((r.fmt, r.url, r.title) for r in resources)
+
+
 def test_collect_all_resources(sample_bag):
     res = coursera_dl.find_resources_to_get(sample_bag, 'all', None)
 
-    assert [('mp4', 'h://url1/lc1.mp4', 'video'),
+    assert [('en.srt', 'h://url4/lc4.srt', ''),
+            ('mp4', 'h://url1/lc1.mp4', 'video'),
             ('pdf', 'h://url2/lc2.pdf', 'slides'),
-            ('txt', 'h://url3/lc3.txt', 'subtitle')] == sorted(res)
+            ('txt', 'h://url3/lc3.txt', 'subtitle')] == _as_tuples(res)
 
 
 def test_collect_only_pdfs(sample_bag):
     res = coursera_dl.find_resources_to_get(sample_bag, 'pdf', None)
 
-    assert [('pdf', 'h://url2/lc2.pdf', 'slides')] == sorted(res)
+    assert [('pdf', 'h://url2/lc2.pdf', 'slides')] == _as_tuples(res)
 
 
 def test_collect_with_filtering(sample_bag):
     res = coursera_dl.find_resources_to_get(sample_bag, 'all', 'de')
-    res = sorted(res)
 
-    assert [('mp4', 'h://url1/lc1.mp4', 'video'),
-            ('pdf', 'h://url2/lc2.pdf', 'slides')] == res
+    assert [('en.srt', 'h://url4/lc4.srt', ''),
+            ('mp4', 'h://url1/lc1.mp4', 'video'),
+            ('pdf', 'h://url2/lc2.pdf', 'slides')] == _as_tuples(res)
+
+
+def test_collect_ignoring_formats(sample_bag):
+    res = coursera_dl.find_resources_to_get(sample_bag, ['all'], None,
+                                            ['srt', 'mp4'])
+
+    assert [('pdf', 'h://url2/lc2.pdf', 'slides'),
+            ('txt', 'h://url3/lc3.txt', 'subtitle')] == _as_tuples(res)
 
 
 # External Downloader
@@ -156,6 +171,7 @@ def test_aria2():
     assert command[0] == 'aria2c'
     assert 'download_url' in command
     assert 'save_to' in command
+    assert '--allow-overwrite=true' in command
 
     d._prepare_cookies(command, 'http://www.coursera.org')
     assert any("Cookie: " in e for e in command)
@@ -184,7 +200,8 @@ def test_all_attempts_have_failed():
     import time
 
     class IObject(object):
-        pass
+        def close(self):
+            pass
 
     class MockSession(object):
 
@@ -192,6 +209,7 @@ def test_all_attempts_have_failed():
             object_ = IObject()
             object_.status_code = 400
             object_.reason = None
+            object_.headers = {}
             return object_
 
     _sleep = time.sleep
@@ -258,3 +276,804 @@ def test_calc_speed_ifread():
     p.read(2000)
     p._now = p._start + 1000
     assert p.calc_speed() == '2.00B/s'
+
+
+# Parallel Downloader
+
+class SlowDownloader(downloaders.Downloader):
+    """
+    Fake downloader that keeps track of the simultaneous downloads.
+    """
+
+    def __init__(self):
+        import threading
+
+        self.lock = threading.Lock()
+        self.active = {}
+        self.max_active = {}
+        self.downloaded = []
+
+    def _start_download(self, url, filename, resume):
+        import time
+
+        host = url.split('/')[2]
+        with self.lock:
+            self.active[host] = self.active.get(host, 0) + 1
+            self.max_active[host] = max(self.max_active.get(host, 0),
+                                        self.active[host])
+        time.sleep(0.02)
+        with self.lock:
+            self.active[host] -= 1
+            self.downloaded.append(filename)
+
+        if filename.startswith('fail'):
+            return False
+        if filename.startswith('error'):
+            raise IOError('connection reset')
+
+    def _finish(self, filename, ok):
+        # there are no files to move into place
+        return ok
+
+
+def test_parallel_downloader_limits_per_host():
+    inner = SlowDownloader()
+    d = downloaders.ParallelDownloader(inner, 6, max_per_host=2)
+
+    for n in range(6):
+        d.download('http://a.example.org/%d' % n, 'a%d' % n)
+        d.download('http://b.example.org/%d' % n, 'b%d' % n)
+    assert d.join() == 0
+
+    assert len(inner.downloaded) == 12
+    assert inner.max_active == {'a.example.org': 2, 'b.example.org': 2}
+
+
+def test_parallel_downloader_reports_in_order(monkeypatch):
+    import logging
+
+    messages = []
+    monkeypatch.setattr(logging, 'info',
+                        lambda msg, *args: messages.append(msg % args))
+    monkeypatch.setattr(logging, 'error',
+                        lambda msg, *args: messages.append(msg % args))
+
+    d = downloaders.ParallelDownloader(SlowDownloader(), 4)
+    for filename in ['ok1', 'fail2', 'error3', 'ok4']:
+        d.download('http://example.org/' + filename, filename)
+
+    assert d.join() == 2
+    assert [m for m in messages if not m.startswith('Error')] == [
+        'Finished: ok1', 'Failed: fail2', 'Failed: error3', 'Finished: ok4']
+
+    # nothing left to wait for
+    assert d.join() == 0
+
+
+def test_parallel_downloader_shares_manifest():
+    inner = SlowDownloader()
+    d = downloaders.ParallelDownloader(inner, 2)
+
+    manifest = object()
+    d.manifest = manifest
+    assert inner.manifest is manifest
+    assert d.manifest is manifest
+
+
+def test_parallel_downloader_close_waits_for_running_downloads():
+    import time
+
+    inner = SlowDownloader()
+    d = downloaders.ParallelDownloader(inner, 2)
+    for n in range(20):
+        d.download('http://example.org/%d' % n, 'ok%d' % n)
+    time.sleep(0.01)
+
+    d.close()
+    downloaded = list(inner.downloaded)
+    # the running downloads are over, the rest were dropped
+    assert inner.active == {'example.org': 0}
+    assert 0 < len(downloaded) < 20
+    time.sleep(0.05)
+    assert inner.downloaded == downloaded
+
+
+# Segmented downloads
+
+def _segmented_downloader(segments=4, threshold=100):
+    import requests
+
+    d = downloaders.NativeDownloader(requests.Session(), segments, threshold)
+    return d
+
+
+def _range_requests(http_server):
+    return sorted(headers['Range'] for path, headers in http_server.requests
+                  if 'Range' in headers)
+
+
+def test_segmented_download(http_server, tmpdir):
+    data = bytes(bytearray(range(256))) * 4
+    http_server.files['/video.mp4'] = data
+    filename = str(tmpdir.join('video.mp4'))
+
+    d = _segmented_downloader()
+    assert d._start_download(http_server.url + '/video.mp4', filename) is True
+
+    assert tmpdir.join('video.mp4').read_binary() == data
+    assert _range_requests(http_server) == [
+        'bytes=0-0', 'bytes=0-255', 'bytes=256-511', 'bytes=512-767',
+        'bytes=768-1023']
+
+
+def test_segmented_download_uneven_size(http_server, tmpdir):
+    data = b'0123456789' * 103
+    http_server.files['/video.mp4'] = data
+    filename = str(tmpdir.join('video.mp4'))
+
+    d = _segmented_downloader(segments=3)
+    assert d._start_download(http_server.url + '/video.mp4', filename) is True
+    assert tmpdir.join('video.mp4').read_binary() == data
+
+
+def test_segmented_download_without_range_support(http_server, tmpdir):
+    data = b'x' * 1000
+    http_server.files['/video.mp4'] = data
+    http_server.accept_ranges = False
+    filename = str(tmpdir.join('video.mp4'))
+
+    d = _segmented_downloader()
+    assert d._start_download(http_server.url + '/video.mp4', filename) is True
+
+    assert tmpdir.join('video.mp4').read_binary() == data
+    # only the probe asked for a range
+    assert len(http_server.requests) == 2
+
+
+def test_segmented_download_probe_error(http_server, tmpdir, monkeypatch):
+    import requests
+
+    data = b'x' * 1000
+    http_server.files['/video.mp4'] = data
+    filename = str(tmpdir.join('video.mp4'))
+
+    d = _segmented_downloader()
+    d.retry = downloaders.RetryPolicy(base_delay=0)
+    get = d.session.get
+    errors = [requests.exceptions.ConnectionError('connection reset')]
+
+    def flaky_get(url, **kwargs):
+        if errors:
+            raise errors.pop()
+        return get(url, **kwargs)
+
+    monkeypatch.setattr(d.session, 'get', flaky_get)
+    assert d.download(http_server.url + '/video.mp4', filename) is True
+    assert tmpdir.join('video.mp4').read_binary() == data
+
+
+def test_small_files_are_not_segmented(http_server, tmpdir):
+    http_server.files['/sub.srt'] = b'x' * 99
+    filename = str(tmpdir.join('sub.srt'))
+
+    d = _segmented_downloader()
+    assert d._start_download(http_server.url + '/sub.srt', filename) is True
+
+    assert tmpdir.join('sub.srt').read_binary() == b'x' * 99
+    assert _range_requests(http_server) == ['bytes=0-0']
+
+
+# Buffered copy
+
+def test_native_download_with_small_chunks(http_server, tmpdir):
+    data = b'0123456789' * 1000
+    http_server.files['/video.mp4'] = data
+    filename = str(tmpdir.join('video.mp4'))
+
+    import requests
+    d = downloaders.NativeDownloader(requests.Session(), chunk_size=333)
+    assert d._start_download(http_server.url + '/video.mp4', filename) is True
+    assert tmpdir.join('video.mp4').read_binary() == data
+
+
+def test_native_download_decodes_content(http_server, tmpdir):
+    import requests
+
+    data = b'subtitle ' * 300
+    http_server.files['/subtitles.srt'] = data
+    http_server.gzip.add('/subtitles.srt')
+
+    d = downloaders.NativeDownloader(requests.Session(), chunk_size=100)
+    filename = str(tmpdir.join('subtitles.srt'))
+    assert d.download(http_server.url + '/subtitles.srt', filename)
+    assert tmpdir.join('subtitles.srt').read_binary() == data
+
+
+@pytest.mark.parametrize("encoded", [False, True])
+def test_native_downloads_reuse_connection(http_server, tmpdir, encoded):
+    import requests
+
+    for n in range(5):
+        http_server.files['/%d.srt' % n] = b'subtitle' * 100
+        if encoded:
+            http_server.gzip.add('/%d.srt' % n)
+
+    d = downloaders.NativeDownloader(requests.Session())
+    for n in range(5):
+        assert d.download(http_server.url + '/%d.srt' % n,
+                          str(tmpdir.join('%d.srt' % n)))
+    assert len(http_server.connections) == 1
+
+
+def test_copy_stream_reports_all_bytes(tmpdir):
+    import io
+    from mock import Mock
+
+    data = b'x' * 2500
+    r = Mock()
+    r.headers = {}
+    r.raw = io.BytesIO(data)
+
+    reported = []
+    d = downloaders.NativeDownloader(None, chunk_size=1000)
+    d.progress_interval = 0
+    with open(str(tmpdir.join('video.mp4')), 'wb') as f:
+        assert d._copy_stream(r, f, reported.append) == 2500
+
+    assert tmpdir.join('video.mp4').read_binary() == data
+    assert sum(reported) == 2500
+    assert reported[:3] == [1000, 1000, 500]
+
+
+def test_native_download_with_write_behind(http_server, tmpdir):
+    data = bytes(bytearray(range(256))) * 40
+    http_server.files['/video.mp4'] = data
+    filename = str(tmpdir.join('video.mp4'))
+
+    import requests
+    d = downloaders.NativeDownloader(requests.Session(), chunk_size=100,
+                                     write_behind=2)
+    assert d._start_download(http_server.url + '/video.mp4', filename) is True
+    assert tmpdir.join('video.mp4').read_binary() == data
+
+
+def test_write_behind_raises_write_errors():
+    class BrokenFile(object):
+        def write(self, data):
+            raise IOError('disk full')
+
+    writer = downloaders.WriteBehind(BrokenFile(),
+                                     [memoryview(bytearray(10))])
+    buf = writer.get_buffer()
+    writer.write(buf, 10)
+    with pytest.raises(IOError):
+        writer.close()
+
+
+# fsync policies
+
+class TouchDownloader(downloaders.Downloader):
+    def _start_download(self, url, filename, resume):
+        with open(filename, 'wb') as f:
+            f.write(b'x')
+
+
+@pytest.mark.parametrize(
+    "policy,synced_after_download,synced_after_close", [
+        (downloaders.FSYNC_NONE, 0, 0),
+        (downloaders.FSYNC_FILE, 2, 2),
+        (downloaders.FSYNC_COURSE, 0, 2),
+    ]
+)
+def test_fsync_policies(monkeypatch, tmpdir, policy, synced_after_download,
+                        synced_after_close):
+    synced = []
+    monkeypatch.setattr(downloaders, 'fsync_file', synced.append)
+
+    d = TouchDownloader()
+    d.fsync = policy
+    d.download('http://example.com/a', str(tmpdir.join('a')))
+    d.download('http://example.com/b', str(tmpdir.join('b')))
+    assert len(synced) == synced_after_download
+
+    d.close()
+    assert len(synced) == synced_after_close
+
+
+def test_fsync_failure_fails_download(monkeypatch, tmpdir):
+    def fsync_file(filename):
+        raise OSError('I/O error')
+    monkeypatch.setattr(downloaders, 'fsync_file', fsync_file)
+
+    d = TouchDownloader()
+    d.fsync = downloaders.FSYNC_FILE
+    assert d.download('http://example.com/a', str(tmpdir.join('a'))) is False
+
+
+# Retries
+
+def _retrying_downloader(**kwargs):
+    import requests
+
+    return downloaders.NativeDownloader(
+        requests.Session(), retry=downloaders.RetryPolicy(base_delay=0),
+        **kwargs)
+
+
+def test_interrupted_download_resumes(http_server, tmpdir):
+    data = b'0123456789' * 1000
+    http_server.files['/video.mp4'] = data
+    http_server.interruptions['/video.mp4'] = [3000]
+    filename = str(tmpdir.join('video.mp4'))
+
+    d = _retrying_downloader()
+    assert d._start_download(http_server.url + '/video.mp4', filename) is True
+
+    assert tmpdir.join('video.mp4').read_binary() == data
+    headers = http_server.requests[-1][1]
+    assert headers['Range'] == 'bytes=3000-'
+    assert headers['If-Range'] == '"10000"'
+
+
+def test_interrupted_segment_resumes(http_server, tmpdir):
+    data = bytes(bytearray(range(256))) * 4
+    http_server.files['/video.mp4'] = data
+    http_server.interruptions['/video.mp4'] = [0, 100]
+    filename = str(tmpdir.join('video.mp4'))
+
+    d = _retrying_downloader(segments=2, segment_threshold=100)
+    assert d._start_download(http_server.url + '/video.mp4', filename) is True
+
+    assert tmpdir.join('video.mp4').read_binary() == data
+    # the probe is sent no body, then one of the segments got interrupted
+    ranges = _range_requests(http_server)
+    assert 'bytes=100-511' in ranges or 'bytes=612-1023' in ranges
+
+
+def test_interrupted_download_gives_up(http_server, tmpdir):
+    http_server.files['/video.mp4'] = b'x' * 1000
+    http_server.interruptions['/video.mp4'] = [100, 100, 100]
+    filename = str(tmpdir.join('video.mp4'))
+
+    import requests
+    d = downloaders.NativeDownloader(
+        requests.Session(),
+        retry=downloaders.RetryPolicy(attempts=2, base_delay=0))
+    assert d._start_download(http_server.url + '/video.mp4', filename) is False
+    assert len(http_server.requests) == 3
+
+
+def _repr_digest(data):
+    import base64
+    import hashlib
+    return 'sha-256=:{0}:'.format(
+        base64.b64encode(hashlib.sha256(data).digest()).decode('ascii'))
+
+
+def test_download_records_digest(http_server, tmpdir):
+    import hashlib
+    from coursera.manifest import DownloadManifest
+
+    data = b'0123456789' * 1000
+    http_server.files['/video.mp4'] = data
+    http_server.interruptions['/video.mp4'] = [3000]
+    filename = str(tmpdir.join('video.mp4'))
+
+    d = _retrying_downloader(digest='sha256', write_behind=1, chunk_size=1024)
+    d.manifest = DownloadManifest(str(tmpdir))
+    try:
+        assert d.download(http_server.url + '/video.mp4', filename) is True
+        # the digest covers the part before the interruption too
+        assert d.manifest.get(filename)['digest'] == (
+            'sha256:' + hashlib.sha256(data).hexdigest())
+    finally:
+        d.manifest.close()
+
+
+def test_resumed_download_hashes_previous_part(http_server, tmpdir):
+    data = b'0123456789' * 1000
+    http_server.files['/video.mp4'] = data
+    http_server.headers['/video.mp4'] = {'Repr-Digest': _repr_digest(data)}
+    tmpdir.join('video.mp4').write_binary(data[:4000])
+    filename = str(tmpdir.join('video.mp4'))
+
+    d = _retrying_downloader(digest='sha256')
+    assert d._start_download(http_server.url + '/video.mp4', filename,
+                             resume=True) is True
+    assert len(http_server.requests) == 1
+    assert tmpdir.join('video.mp4').read_binary() == data
+
+
+def test_encoded_download_is_not_corrupt(http_server, tmpdir):
+    import hashlib
+    from coursera.manifest import DownloadManifest
+
+    data = b'subtitle ' * 300
+    http_server.files['/subtitles.srt'] = data
+    http_server.gzip.add('/subtitles.srt')
+    # the digest of the encoded body, which we don't keep
+    http_server.headers['/subtitles.srt'] = {
+        'Repr-Digest': _repr_digest(b'encoded')}
+    filename = str(tmpdir.join('subtitles.srt'))
+
+    d = _retrying_downloader(digest='sha256')
+    d.manifest = DownloadManifest(str(tmpdir))
+    try:
+        assert d.download(http_server.url + '/subtitles.srt', filename)
+        assert len(http_server.requests) == 1
+        assert d.manifest.get(filename)['digest'] == (
+            'sha256:' + hashlib.sha256(data).hexdigest())
+    finally:
+        d.manifest.close()
+
+
+def test_corrupt_download_is_retried(http_server, tmpdir):
+    data = b'0123456789' * 1000
+    http_server.files['/video.mp4'] = data
+    http_server.headers['/video.mp4'] = {'Repr-Digest': _repr_digest(data)}
+    http_server.corruptions['/video.mp4'] = 1
+    filename = str(tmpdir.join('video.mp4'))
+
+    d = _retrying_downloader(digest='sha256')
+    assert d._start_download(http_server.url + '/video.mp4', filename) is True
+    assert len(http_server.requests) == 2
+    # downloaded again from scratch
+    assert 'Range' not in http_server.requests[-1][1]
+    assert tmpdir.join('video.mp4').read_binary() == data
+
+    http_server.corruptions['/video.mp4'] = 10
+    d.retry = downloaders.RetryPolicy(attempts=2, base_delay=0)
+    assert d._start_download(http_server.url + '/video.mp4', filename) is False
+
+
+def test_corrupt_segmented_download_is_retried(http_server, tmpdir):
+    data = b'0123456789' * 1000
+    http_server.files['/video.mp4'] = data
+    http_server.headers['/video.mp4'] = {'Repr-Digest': _repr_digest(data)}
+    # the first segment
+    http_server.corruptions['/video.mp4'] = 2
+    filename = str(tmpdir.join('video.mp4'))
+
+    d = _retrying_downloader(segments=2, segment_threshold=1000,
+                             digest='sha256')
+    assert d._start_download(http_server.url + '/video.mp4', filename) is True
+    assert tmpdir.join('video.mp4').read_binary() == data
+    # the progress of the failed segmented download is not drawn anymore
+    assert d.renderer._active == []
+
+
+def test_download_goes_through_part_file(http_server, tmpdir):
+    http_server.files['/video.mp4'] = b'0123456789'
+    http_server.interruptions['/cut.mp4'] = [5]
+    http_server.files['/cut.mp4'] = b'0123456789'
+    d = _retrying_downloader()
+    d.retry = downloaders.RetryPolicy(attempts=0)
+
+    assert d.download(http_server.url + '/video.mp4',
+                      str(tmpdir.join('video.mp4'))) is True
+    assert d.download(http_server.url + '/cut.mp4',
+                      str(tmpdir.join('cut.mp4'))) is False
+    assert sorted(p.basename for p in tmpdir.listdir()) == [
+        'cut.mp4.part', 'video.mp4']
+    assert tmpdir.join('cut.mp4.part').read_binary() == b'01234'
+
+
+def test_interrupted_download_keeps_part_file(tmpdir, monkeypatch):
+    filename = str(tmpdir.join('video.mp4'))
+    d = _retrying_downloader()
+
+    def start_download(url, part, resume):
+        with open(part, 'wb') as f:
+            f.write(b'01234')
+        raise KeyboardInterrupt()
+
+    monkeypatch.setattr(d, '_start_download', start_download)
+    with pytest.raises(KeyboardInterrupt):
+        d.download('http://example.org/video.mp4', filename)
+    assert tmpdir.join('video.mp4.part').read_binary() == b'01234'
+    assert not tmpdir.join('video.mp4').exists()
+
+
+def test_resume_of_file_written_in_place(http_server, tmpdir):
+    data = b'0123456789' * 1000
+    http_server.files['/video.mp4'] = data
+    # left by a version that wrote straight into place
+    tmpdir.join('video.mp4').write_binary(data[:4000])
+
+    d = _retrying_downloader()
+    assert d.download(http_server.url + '/video.mp4',
+                      str(tmpdir.join('video.mp4')), resume=True) is True
+    assert http_server.requests[-1][1]['Range'] == 'bytes=4000-'
+    assert tmpdir.join('video.mp4').read_binary() == data
+    assert not tmpdir.join('video.mp4.part').exists()
+
+
+def test_retry_policy_budget():
+    policy = downloaders.RetryPolicy(attempts=3, budget=2)
+    assert policy.consume(0) is True
+    assert policy.consume(3) is False
+    assert policy.consume(1) is True
+    assert policy.consume(0) is False
+
+
+def test_retry_policy_delays():
+    policy = downloaders.RetryPolicy(base_delay=2, max_delay=10)
+    for attempt, low, high in [(0, 1, 2), (1, 2, 4), (2, 4, 8), (5, 10, 10)]:
+        assert low <= policy.get_delay(attempt) <= high
+
+    assert policy.get_delay(0, '7') == 7
+    assert policy.get_delay(0, '3600') == 10
+
+
+@pytest.mark.parametrize(
+    "value,expected", [
+        (None, None),
+        ('', None),
+        ('120', 120),
+        ('-5', 0),
+        ('soon', None),
+        ('Wed, 21 Oct 2015 07:28:00 GMT', 0),
+    ]
+)
+def test_parse_retry_after(value, expected):
+    assert downloaders.parse_retry_after(value) == expected
+
+
+def test_get_validator():
+    assert downloaders.get_validator({'etag': '"abc"'}) == '"abc"'
+    assert downloaders.get_validator(
+        {'etag': 'W/"abc"', 'last-modified': 'Mon'}) == 'Mon'
+    assert downloaders.get_validator({}) is None
+
+
+def test_get_total_size():
+    assert downloaders.get_total_size(200, {'content-length': '10'}) == 10
+    assert downloaders.get_total_size(
+        206, {'content-range': 'bytes 5-9/10'}) == 10
+    assert downloaders.get_total_size(200, {}) is None
+    # the size of an encoded body is not the size of the file
+    assert downloaders.get_total_size(
+        200, {'content-length': '10', 'content-encoding': 'gzip'}) is None
+
+
+# Stall watchdog
+
+def test_stalled_download_resumes(http_server, tmpdir):
+    data = b'0123456789' * 1000
+    http_server.files['/video.mp4'] = data
+    http_server.stalls['/video.mp4'] = [(3000, 2)]
+    filename = str(tmpdir.join('video.mp4'))
+
+    d = _retrying_downloader(stall_speed=1000, stall_time=0.2)
+    d.watchdog.interval = 0.05
+    try:
+        assert d._start_download(http_server.url + '/video.mp4',
+                                 filename) is True
+    finally:
+        d.close()
+
+    assert tmpdir.join('video.mp4').read_binary() == data
+    assert http_server.requests[-1][1]['Range'] == 'bytes=3000-'
+
+
+def test_watchdog_read_size():
+    watchdog = downloaders.StallWatchdog(10240, 60)
+    assert watchdog.get_read_size(1048576) == 614400
+    assert watchdog.get_read_size(65536) == 65536
+    assert downloaders.StallWatchdog(1, 1).get_read_size(65536) == 4096
+
+
+# Speed limits
+
+@pytest.mark.parametrize(
+    "class_,expected", [
+        (downloaders.WgetDownloader, ['--limit-rate=5000']),
+        (downloaders.CurlDownloader, ['--limit-rate', '5000']),
+        (downloaders.Aria2Downloader, ['--max-overall-download-limit=5000']),
+        (downloaders.AxelDownloader, ['-s', '5000']),
+    ]
+)
+def test_external_rate_limit(class_, expected):
+    from coursera.ratelimit import RateSchedule, TokenBucket
+
+    d = class_(None)
+    d.limiter = TokenBucket(RateSchedule(10000))
+    d.jobs = 2
+    command = []
+    d._prepare_rate_limit(command)
+    assert command == expected
+
+
+def test_native_download_is_limited(http_server, tmpdir, monkeypatch):
+    from coursera.ratelimit import RateSchedule, TokenBucket
+
+    http_server.files['/video.mp4'] = b'x' * 4096
+    filename = str(tmpdir.join('video.mp4'))
+
+    delays = []
+    d = _retrying_downloader(chunk_size=1024)
+    d.limiter = TokenBucket(RateSchedule(1024), burst=0)
+    monkeypatch.setattr(d.limiter, 'consume',
+                        lambda n: delays.append(d.limiter.reserve(n)))
+
+    assert d._start_download(http_server.url + '/video.mp4', filename) is True
+    assert len(delays) == 4
+    assert delays[-1] > 3
+
+
+# Processes of the external downloaders
+
+class _ScriptDownloader(downloaders.ExternalDownloader):
+    """
+    Runs a python script that writes the file a byte at a time and fails
+    the next `failures` times.
+    """
+
+    bin = 'python'
+    failures = 0
+
+    def _create_command(self, url, filename):
+        import sys
+        script = (
+            'import os, sys\n'
+            'data, path, failures = sys.argv[1:4]\n'
+            'start = 0\n'
+            'if "--resume" in sys.argv and os.path.exists(path):\n'
+            '    start = os.path.getsize(path)\n'
+            'with open(path, "a" if start else "w") as f:\n'
+            '    f.write(data[start])\n'
+            '    f.flush()\n'
+            '    sys.stdout.write("50% of the file\\r")\n'
+            '    sys.stdout.flush()\n'
+            '    if int(failures):\n'
+            '        sys.stdout.write("\\nconnection reset\\n")\n'
+            '        sys.exit(4)\n'
+            '    f.write(data[start + 1:])\n'
+            '    sys.stdout.write("100% of the file\\n")\n')
+        failures, self.failures = self.failures, max(0, self.failures - 1)
+        return [sys.executable, '-c', script, url, filename, str(failures)]
+
+    def _prepare_cookies(self, command, url):
+        pass
+
+    def _enable_resume(self, command):
+        command.append('--resume')
+
+
+def test_external_download_succeeds(tmpdir):
+    filename = str(tmpdir.join('video.mp4'))
+    d = _ScriptDownloader(None)
+
+    code, output = d._run(d._create_command('abcd', filename), filename)
+    assert code == 0
+    assert output == ['50% of the file', '100% of the file']
+    assert d.download('abcd', filename) is True
+    assert tmpdir.join('video.mp4').read() == 'abcd'
+
+
+def test_external_download_fails_on_exit_code(tmpdir):
+    filename = str(tmpdir.join('video.mp4'))
+    d = _ScriptDownloader(None)
+    d.failures = 2
+
+    code, output = d._run(d._create_command('abcd', filename), filename)
+    assert code == 4
+    assert output[-1] == 'connection reset'
+    assert d.download('abcd', filename) is False
+
+
+def test_external_download_is_retried(tmpdir, monkeypatch):
+    monkeypatch.setattr(downloaders.time, 'sleep', lambda seconds: None)
+    filename = str(tmpdir.join('video.mp4'))
+    d = _ScriptDownloader(None)
+    d.failures = 2
+    d.retry = downloaders.RetryPolicy(attempts=3)
+
+    assert d.download('abcd', filename) is True
+    # the retries resume the file
+    assert tmpdir.join('video.mp4').read() == 'abcd'
+
+    d.failures = 4
+    assert d.download('abcd', filename) is False
+
+
+def test_external_progress_is_parsed(tmpdir):
+    filename = str(tmpdir.join('video.mp4'))
+    tmpdir.join('video.mp4').write('x' * 250)
+    d = _ScriptDownloader(None)
+    progress = downloaders.DownloadProgress(None)
+
+    d._parse_progress('no progress here', filename, progress)
+    assert (progress.current, progress.total) == (0, None)
+    d._parse_progress('[#1 250B/1000B(25%)] 12.5% ... 25%', filename,
+                      progress)
+    assert (progress.current, progress.total) == (250, 1000)
+
+
+def test_iter_output_lines():
+    import os
+    read_fd, write_fd = os.pipe()
+    os.write(write_fd, b'10%\r20%\r\r30%\nlast')
+    os.close(write_fd)
+    with os.fdopen(read_fd, 'rb') as stream:
+        assert list(downloaders.iter_output_lines(stream)) == [
+            '10%', '20%', '30%', 'last']
+
+
+# Batches of external downloads
+
+def _which(bin):
+    try:
+        from shutil import which
+    except ImportError:
+        from distutils.spawn import find_executable as which
+    return which(bin)
+
+
+@pytest.mark.skipif(not _which('curl'), reason='needs curl')
+def test_curl_batch(http_server, tmpdir):
+    import requests
+    http_server.files['/a.mp4'] = b'a' * 1000
+    http_server.files['/b.srt'] = b'b' * 10
+
+    d = downloaders.CurlDownloader(requests.Session())
+    d.batch = True
+    d.jobs = 2
+    for path, name in [('/a.mp4', 'a.mp4'), ('/b.srt', 'b "c".srt'),
+                       ('/missing.txt', 'missing.txt')]:
+        assert d.download(http_server.url + path,
+                          str(tmpdir.join(name))) is None
+    assert http_server.requests == []
+
+    assert d.join() == 1
+    assert tmpdir.join('a.mp4').read_binary() == b'a' * 1000
+    assert tmpdir.join('b "c".srt').read_binary() == b'b' * 10
+    # no error page is left behind
+    assert not tmpdir.join('missing.txt').exists()
+    assert not tmpdir.join('missing.txt.part').exists()
+    assert d.join() == 0
+
+
+def test_aria2_batch(tmpdir, monkeypatch):
+    import requests
+    session = requests.Session()
+    session.cookies.set('CAUTH', 'secret', domain='.coursera.org')
+
+    d = downloaders.Aria2Downloader(session)
+    d.batch = True
+    d.jobs = 3
+    d.download('http://example.com/a.mp4', str(tmpdir.join('a.mp4')))
+    d.download('http://example.com/b.srt', str(tmpdir.join('b.srt')),
+               resume=True)
+
+    calls = []
+
+    def call(command, capture=False):
+        input_file = [arg for arg in command if arg.startswith('/')][0]
+        cookie_file = command[3].split('=', 1)[1]
+        calls.append((command, open(input_file).read(),
+                      open(cookie_file).read()))
+        # a finished download and an unfinished one
+        tmpdir.join('a.mp4.part').write('a')
+        tmpdir.join('b.srt.part').write('b')
+        tmpdir.join('b.srt.part.aria2').write('')
+
+    monkeypatch.setattr(d, '_call', call)
+    assert d.join() == 1
+
+    command, input_file, cookies = calls[0]
+    assert command[:2] == ['aria2c', '-i']
+    assert '--max-concurrent-downloads=3' in command
+    assert input_file == (
+        'http://example.com/a.mp4\n'
+        '  dir={0}\n'
+        '  out=a.mp4.part\n'
+        '  allow-overwrite=true\n'
+        'http://example.com/b.srt\n'
+        '  dir={0}\n'
+        '  out=b.srt.part\n'
+        '  continue=true\n').format(str(tmpdir))
+    assert 'CAUTH\tsecret' in cookies
+    assert tmpdir.join('a.mp4').read() == 'a'
+    assert not tmpdir.join('b.srt').exists()
+    assert tmpdir.join('b.srt.part').exists()
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+
+"""
+Test the selection of the material to download.
+"""
+
+import pytest
+
+from coursera.filtering import SelectionPlan, ON_DEMAND_LECTURE_FORMATS
+
+
+def test_everything_is_selected_by_default():
+    plan = SelectionPlan()
+
+    assert plan.wants_section('week-1')
+    assert plan.wants_lecture('intro')
+    assert plan.wants_format('mp4')
+    assert plan.wants_format('en.srt')
+    assert plan.wants('week-1', 'intro', ON_DEMAND_LECTURE_FORMATS)
+
+
+def test_section_and_lecture_filters():
+    plan = SelectionPlan(section_filter='week-[12]$', lecture_filter='^intro')
+
+    assert plan.wants_section('week-1')
+    assert not plan.wants_section('week-3')
+    assert plan.wants_lecture('introduction')
+    assert not plan.wants_lecture('an-intro')
+
+    assert plan.wants('week-2', 'intro', ['mp4'])
+    assert not plan.wants('week-3', 'intro', ['mp4'])
+    assert not plan.wants('week-2', 'outro', ['mp4'])
+
+
+@pytest.mark.parametrize(
+    "file_formats,ignored_formats,fmt,wanted", [
+        (['all'], [], 'mp4', True),
+        (['all'], ['mp4'], 'mp4', False),
+        (['mp4', 'pdf'], [], 'mp4', True),
+        (['pdf'], [], 'mp4', False),
+        (['srt'], [], 'pt-BR.srt', True),
+        (['all'], ['srt'], 'en.srt', False),
+    ]
+)
+def test_formats(file_formats, ignored_formats, fmt, wanted):
+    plan = SelectionPlan(file_formats, ignored_formats=ignored_formats)
+    assert plan.wants_format(fmt) is wanted
+
+
+def test_lecture_without_wanted_formats():
+    plan = SelectionPlan(['pdf'])
+    assert not plan.wants('week-1', 'intro', ON_DEMAND_LECTURE_FORMATS)
+
+    plan = SelectionPlan(ignored_formats=['mp4', 'srt', 'txt'])
+    assert not plan.wants('week-1', 'intro', ON_DEMAND_LECTURE_FORMATS)
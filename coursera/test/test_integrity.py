@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+
+"""
+Test the digests of the downloaded files.
+"""
+
+import hashlib
+
+import pytest
+
+from coursera import integrity
+
+
+def test_new_hasher():
+    hasher = integrity.new_hasher('sha256')
+    hasher.update(b'abc')
+    assert hasher.hexdigest() == hashlib.sha256(b'abc').hexdigest()
+    assert integrity.format_digest('sha256', hasher) == (
+        'sha256:' + hashlib.sha256(b'abc').hexdigest())
+
+    pytest.raises(ValueError, integrity.new_hasher, 'crc32')
+
+
+def test_xxhash_needs_module(monkeypatch):
+    monkeypatch.setattr(integrity, 'xxhash', None)
+    pytest.raises(ValueError, integrity.new_hasher, 'xxhash')
+
+
+def test_hash_file(tmpdir):
+    tmpdir.join('video.mp4').write_binary(b'0123456789' * 1000)
+
+    hasher = integrity.hash_file(str(tmpdir.join('video.mp4')), 'md5',
+                                 chunk_size=3000)
+    hasher.update(b'more')
+    assert hasher.hexdigest() == hashlib.md5(
+        b'0123456789' * 1000 + b'more').hexdigest()
+
+
+@pytest.mark.parametrize(
+    "headers,algorithm,expected", [
+        ({'repr-digest': 'sha-256=:ungWv48Bz+pBQUDeXa4iI7ADYaOWF3qctBD/'
+                         'YfIAFa0=:'}, 'sha256',
+         hashlib.sha256(b'abc').hexdigest()),
+        ({'digest': 'MD5=kAFQmDzST7DWlj99KOF/cg==, '
+                    'SHA-256=ungWv48Bz+pBQUDeXa4iI7ADYaOWF3qctBD/YfIAFa0='},
+         'md5', hashlib.md5(b'abc').hexdigest()),
+        ({'digest': 'MD5=kAFQmDzST7DWlj99KOF/cg=='}, 'sha256', None),
+        ({'digest': 'SHA-256=not base64!'}, 'sha256', None),
+        ({}, 'sha256', None),
+        ({'digest': 'MD5=kAFQmDzST7DWlj99KOF/cg=='}, 'xxhash', None),
+    ]
+)
+def test_get_expected_digest(headers, algorithm, expected):
+    assert integrity.get_expected_digest(headers, algorithm) == expected
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+
+"""
+Test the download manifest.
+"""
+
+import os
+
+import pytest
+
+from coursera import coursera_dl
+from coursera import downloaders
+from coursera import manifest
+from coursera.models import Section, Lecture, Resource
+
+
+@pytest.fixture
+def class_path(tmpdir):
+    return str(tmpdir)
+
+
+@pytest.fixture
+def dl_manifest(class_path):
+    m = manifest.DownloadManifest(class_path)
+    yield m
+    m.close()
+
+
+def _write(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def test_states(class_path, dl_manifest):
+    filename = os.path.join(class_path, 'video.mp4')
+    assert dl_manifest.get_state(filename) == manifest.MISSING
+
+    _write(filename, b'12345')
+    assert dl_manifest.get_state(filename) == manifest.UNKNOWN
+
+    dl_manifest.start(filename, 'http://example.org/video.mp4')
+    assert dl_manifest.get_state(filename) == manifest.PARTIAL
+
+    dl_manifest.update(filename, 5, '"etag"', 'Mon, 01 Jun 2015')
+    assert dl_manifest.finish(filename, True) is True
+    assert dl_manifest.get_state(filename) == manifest.COMPLETED
+
+    entry = dl_manifest.get(filename)
+    assert entry['path'] == 'video.mp4'
+    assert entry['url'] == 'http://example.org/video.mp4'
+    assert entry['size'] == entry['expected_size'] == 5
+    assert entry['etag'] == '"etag"'
+    assert entry['status'] == manifest.COMPLETE
+
+    # truncated after being completed
+    _write(filename, b'123')
+    assert dl_manifest.get_state(filename) == manifest.PARTIAL
+
+
+def test_part_file_is_partial(class_path, dl_manifest):
+    filename = os.path.join(class_path, 'video.mp4')
+    _write(filename + '.part', b'123')
+    assert dl_manifest.get_state(filename) == manifest.PARTIAL
+
+    # the partial file is recorded under the name of the file
+    dl_manifest.start(filename, 'http://example.org/video.mp4')
+    dl_manifest.update(filename + '.part', 5, '"etag"')
+    assert dl_manifest.get(filename)['etag'] == '"etag"'
+
+
+def test_truncated_download_is_not_complete(class_path, dl_manifest):
+    filename = os.path.join(class_path, 'video.mp4')
+    dl_manifest.start(filename, 'http://example.org/video.mp4')
+    dl_manifest.update(filename, expected_size=10)
+    _write(filename, b'12345')
+
+    assert dl_manifest.finish(filename, True) is False
+    assert dl_manifest.get(filename)['status'] == manifest.FAILED
+    assert dl_manifest.get_state(filename) == manifest.PARTIAL
+
+
+def test_manifest_is_persistent(class_path, dl_manifest):
+    filename = os.path.join(class_path, 'video.mp4')
+    _write(filename, b'12345')
+    dl_manifest.start(filename, 'http://example.org/video.mp4')
+    dl_manifest.finish(filename, True)
+
+    other = manifest.DownloadManifest(class_path)
+    assert other.get_state(filename) == manifest.COMPLETED
+    other.close()
+
+
+class FakeDownloader(downloaders.Downloader):
+    def __init__(self, data=b'data', ok=True):
+        self.data = data
+        self.ok = ok
+        self.calls = []
+
+    def _start_download(self, url, filename, resume):
+        self.calls.append((url, filename, resume))
+        _write(filename, self.data)
+        return None if self.ok else False
+
+
+def test_old_manifest_is_upgraded(class_path):
+    import sqlite3
+
+    conn = sqlite3.connect(os.path.join(class_path, manifest.MANIFEST_NAME))
+    conn.execute('''CREATE TABLE resources (
+        path TEXT PRIMARY KEY, url TEXT NOT NULL, expected_size INTEGER,
+        size INTEGER, etag TEXT, last_modified TEXT, status TEXT NOT NULL,
+        updated REAL NOT NULL)''')
+    conn.execute("INSERT INTO resources VALUES "
+                 "('video.mp4', 'http://example.org/video.mp4', 5, 5, NULL,"
+                 " NULL, 'complete', 0)")
+    conn.commit()
+    conn.close()
+
+    m = manifest.DownloadManifest(class_path)
+    try:
+        filename = os.path.join(class_path, 'video.mp4')
+        assert m.get(filename)['digest'] is None
+        m.set_digest(filename, 'sha256:abc')
+        assert m.get(filename)['digest'] == 'sha256:abc'
+        # a new download forgets the digest of the previous one
+        m.start(filename, 'http://example.org/video.mp4')
+        assert m.get(filename)['digest'] is None
+    finally:
+        m.close()
+
+
+def test_downloader_records_in_manifest(class_path, dl_manifest):
+    filename = os.path.join(class_path, 'video.mp4')
+    d = FakeDownloader(ok=False)
+    d.manifest = dl_manifest
+
+    assert d.download('http://example.org/video.mp4', filename) is False
+    assert dl_manifest.get(filename)['status'] == manifest.FAILED
+
+    d.ok = True
+    assert d.download('http://example.org/video.mp4', filename) is not False
+    assert dl_manifest.get(filename)['status'] == manifest.COMPLETE
+
+
+def _sections(class_path):
+    lectures = [Lecture('lecture-%d' % n,
+                        [Resource('mp4', 'http://example.org/%d.mp4' % n)])
+                for n in range(3)]
+    return [Section('week-1', lectures)]
+
+
+def test_download_lectures_uses_manifest(class_path, dl_manifest):
+    d = FakeDownloader()
+    d.manifest = dl_manifest
+
+    coursera_dl.download_lectures(d, 'module', _sections(class_path), ['all'],
+                                  path=class_path)
+    assert [c[2] for c in d.calls] == [False, False, False]
+
+    section = os.path.join(class_path, 'module', '01_week-1')
+    # 1st: left complete, 2nd: truncated, 3rd: interrupted
+    _write(os.path.join(section, '02_lecture-1.mp4'), b'da')
+    dl_manifest.start(os.path.join(section, '03_lecture-2.mp4'),
+                      'http://example.org/2.mp4')
+
+    d.calls = []
+    coursera_dl.download_lectures(d, 'module', _sections(class_path), ['all'],
+                                  path=class_path)
+    assert [(c[1], c[2]) for c in d.calls] == [
+        (os.path.join(section, '02_lecture-1.mp4.part'), True),
+        (os.path.join(section, '03_lecture-2.mp4.part'), True),
+    ]
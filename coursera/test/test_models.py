@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+
+"""
+Test the data model of the class material.
+"""
+
+import json
+
+import pytest
+
+from coursera.models import (Module, Section, Lecture, Resource,
+                             modules_to_json, modules_from_json)
+
+
+def _sample_modules():
+    return [
+        Module('week-1', [
+            Section('intro', [
+                Lecture('welcome', [
+                    Resource('mp4', 'https://example.org/welcome.mp4'),
+                    Resource('en.srt', 'https://example.org/welcome.srt'),
+                ]),
+                Lecture('filtered-out'),
+            ]),
+        ]),
+        Module('week-2', []),
+    ]
+
+
+def test_resource_extension():
+    assert Resource('mp4', 'url').extension == 'mp4'
+    assert Resource('en.srt', 'url').extension == 'srt'
+    assert Resource('zh-CN.txt', 'url').extension == 'txt'
+
+
+def test_formats_are_interned():
+    fmt = ''.join(['e', 'n', '.', 's', 'r', 't'])
+    assert Resource(fmt, 'url1').fmt is Resource('en.srt', 'url2').fmt
+
+
+@pytest.mark.parametrize("obj", [
+    Resource('mp4', 'url'), Lecture('l'), Section('s'), Module('m')])
+def test_objects_have_no_dict(obj):
+    assert not hasattr(obj, '__dict__')
+    with pytest.raises(AttributeError):
+        obj.unknown = 1
+
+
+def test_json_round_trip():
+    data = modules_to_json(_sample_modules())
+    modules = modules_from_json(json.loads(json.dumps(data)))
+
+    assert [m.name for m in modules] == ['week-1', 'week-2']
+    lectures = modules[0].sections[0].lectures
+    assert [l.name for l in lectures] == ['welcome', 'filtered-out']
+    assert [(r.fmt, r.url, r.title) for r in lectures[0].resources] == [
+        ('mp4', 'https://example.org/welcome.mp4', ''),
+        ('en.srt', 'https://example.org/welcome.srt', ''),
+    ]
+    assert lectures[1].resources == []
+    assert modules_to_json(modules) == data
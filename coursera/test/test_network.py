@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+
+"""
+Test the helpers of the connections.
+"""
+
+import socket
+import time
+
+import pytest
+import requests
+
+from coursera import coursera_dl
+from coursera import network
+
+
+class FakeResolver(object):
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, host, port, *args, **kwargs):
+        self.calls.append((host, port))
+        if host == 'unknown.example.org':
+            raise socket.gaierror('Name or service not known')
+        return [(socket.AF_INET, socket.SOCK_STREAM, 6, '',
+                 ('192.0.2.%d' % len(self.calls), port))]
+
+
+def test_dns_cache():
+    resolver = FakeResolver()
+    cache = network.DnsCache(ttl=60, resolver=resolver)
+
+    first = cache.getaddrinfo('video.example.org', 443)
+    assert cache.getaddrinfo('video.example.org', 443) == first
+    assert cache.getaddrinfo('video.example.org', 80) != first
+    assert len(resolver.calls) == 2
+
+    # the failures are not cached
+    for _ in range(2):
+        with pytest.raises(socket.gaierror):
+            cache.getaddrinfo('unknown.example.org', 443)
+    assert len(resolver.calls) == 4
+
+
+def test_dns_cache_expires(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(network.time, 'time', lambda: now[0])
+    resolver = FakeResolver()
+    cache = network.DnsCache(ttl=60, resolver=resolver)
+
+    cache.getaddrinfo('video.example.org', 443)
+    now[0] += 59
+    cache.getaddrinfo('video.example.org', 443)
+    assert len(resolver.calls) == 1
+    now[0] += 2
+    cache.getaddrinfo('video.example.org', 443)
+    assert len(resolver.calls) == 2
+
+
+def test_dns_cache_install():
+    original = socket.getaddrinfo
+    cache = network.DnsCache()
+    cache.install()
+    try:
+        assert socket.getaddrinfo == cache.getaddrinfo
+    finally:
+        cache.uninstall()
+    assert socket.getaddrinfo is original
+
+
+def test_prewarmer_opens_connections_once_per_host(http_server):
+    http_server.files['/a.mp4'] = b'a'
+    http_server.files['/b.mp4'] = b'b'
+    session = coursera_dl.get_session(pool_maxsize=3)
+    prewarmer = network.ConnectionPrewarmer(session, connections=3)
+
+    prewarmer.warm(http_server.url + '/a.mp4')
+    prewarmer.warm(http_server.url + '/b.mp4')
+    prewarmer.warm('file:///a.mp4')
+
+    deadline = time.time() + 5
+    while len(http_server.requests) < 3 and time.time() < deadline:
+        time.sleep(0.01)
+    prewarmer.close()
+    assert [path for path, headers in http_server.requests] == ['/a.mp4'] * 3
+
+
+def test_get_session_pool_options():
+    session = coursera_dl.get_session(pool_connections=4, pool_maxsize=16,
+                                      pool_block=True)
+    for url in ('https://www.coursera.org', 'http://www.coursera.org'):
+        adapter = session.get_adapter(url)
+        assert adapter.poolmanager.connection_pool_kw['maxsize'] == 16
+        assert adapter.poolmanager.connection_pool_kw['block'] is True
+        assert adapter.poolmanager.pools._maxsize == 4
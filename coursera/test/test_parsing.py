@@ -13,6 +13,7 @@ from six import iteritems
 from mock import patch, Mock, mock_open
 
 from coursera import coursera_dl
+from coursera import cookies
 
 
 # JSon Handling
@@ -117,3 +118,254 @@ def test_parse(get_old_style_video, filename, num_sections, num_lectures,
 
         # mp4 count
         assert sum(r for f, r in resources if f == "mp4") == num_videos
+
+
+# Test On-Demand Syllabus Parsing
+
+def _make_on_demand_syllabus(num_modules, num_sections, num_lectures):
+    modules = []
+    for m in range(num_modules):
+        sections = []
+        for s in range(num_sections):
+            lectures = []
+            for l in range(num_lectures):
+                lectures.append({
+                    'slug': 'lecture-%d-%d-%d' % (m, s, l),
+                    'content': {
+                        'typeName': 'lecture',
+                        'definition': {'videoId': 'v%d-%d-%d' % (m, s, l)},
+                    },
+                })
+            lectures.append({
+                'slug': 'quiz-%d-%d' % (m, s),
+                'content': {'typeName': 'exam', 'definition': {}},
+            })
+            sections.append({'slug': 'section-%d-%d' % (m, s),
+                             'elements': lectures})
+        modules.append({'slug': 'module-%d' % m, 'elements': sections})
+
+    return json.dumps({'courseMaterial': {'elements': modules}})
+
+
+@pytest.fixture
+def on_demand_video_url(monkeypatch):
+    """
+    Mock the resolution of the videos, making the requests complete out of
+    order.
+    """
+    import random
+    import time
+
+    def get_on_demand_video_url(session, video_id, subtitle_language='all',
+                                resolution='720p', cache_ttl=None,
+                                refresh_cache=False):
+        time.sleep(random.random() / 100)
+        return {'mp4': 'https://video.example.org/%s.mp4' % video_id}
+
+    monkeypatch.setattr(coursera_dl, 'get_on_demand_video_url',
+                        get_on_demand_video_url)
+
+
+@pytest.mark.parametrize("resolve_jobs", [1, 4])
+def test_parse_on_demand_syllabus_keeps_order(on_demand_video_url,
+                                              resolve_jobs):
+    page = _make_on_demand_syllabus(3, 2, 4)
+
+    modules = coursera_dl.parse_on_demand_syllabus(
+        None, page, resolve_jobs=resolve_jobs)
+
+    assert [m.name for m in modules] == ['module-0', 'module-1', 'module-2']
+    for m, module in enumerate(modules):
+        assert [s.name for s in module.sections] == ['section-%d-0' % m,
+                                                     'section-%d-1' % m]
+        for s, section in enumerate(module.sections):
+            assert [l.name for l in section.lectures] == [
+                'lecture-%d-%d-%d' % (m, s, l) for l in range(4)]
+            for l, lecture in enumerate(section.lectures):
+                url = 'https://video.example.org/v%d-%d-%d.mp4' % (m, s, l)
+                assert [(r.fmt, r.url, r.title)
+                        for r in lecture.resources] == [('mp4', url, '')]
+
+
+def test_parse_on_demand_syllabus_reverse(on_demand_video_url):
+    page = _make_on_demand_syllabus(3, 1, 1)
+
+    modules = coursera_dl.parse_on_demand_syllabus(
+        None, page, reverse=True, resolve_jobs=2)
+
+    assert [m.name for m in modules] == ['module-2', 'module-1', 'module-0']
+
+
+def test_iter_on_demand_lectures_streams(monkeypatch):
+    import threading
+
+    release = threading.Event()
+
+    def get_on_demand_video_url(session, video_id, *args):
+        # only the first lecture can be resolved until we say so
+        if video_id != 'v0-0-0':
+            release.wait(5)
+        return {'mp4': 'https://video.example.org/%s.mp4' % video_id}
+
+    monkeypatch.setattr(coursera_dl, 'get_on_demand_video_url',
+                        get_on_demand_video_url)
+
+    page = _make_on_demand_syllabus(2, 2, 2)
+    lectures = coursera_dl.iter_on_demand_lectures(None, page, resolve_jobs=2)
+
+    module_slug, section_slug, lecture = next(lectures)
+    assert (module_slug, section_slug) == ('module-0', 'section-0-0')
+    assert lecture.name == 'lecture-0-0-0'
+    assert not release.is_set()
+
+    release.set()
+    assert len(list(lectures)) == 7
+
+
+def test_iter_on_demand_lectures_prewarms_hosts(on_demand_video_url):
+    class FakePrewarmer(object):
+        def __init__(self):
+            self.urls = []
+
+        def warm(self, url):
+            self.urls.append(url)
+
+    prewarmer = FakePrewarmer()
+    page = _make_on_demand_syllabus(1, 2, 2)
+    lectures = coursera_dl.iter_on_demand_lectures(None, page, resolve_jobs=2,
+                                                   prewarmer=prewarmer)
+    assert len(list(lectures)) == 4
+    assert sorted(prewarmer.urls) == [
+        'https://video.example.org/v0-%d-%d.mp4' % (s, l)
+        for s in range(2) for l in range(2)]
+
+
+def test_group_on_demand_lectures_skipping_sections(on_demand_video_url):
+    page = _make_on_demand_syllabus(2, 3, 2)
+    lectures = coursera_dl.iter_on_demand_lectures(None, page, resolve_jobs=2)
+
+    seen = []
+    for module in coursera_dl.group_on_demand_lectures(lectures):
+        for section in module.sections:
+            # leave the middle sections unconsumed, as download_lectures
+            # does for filtered sections
+            if section.name.endswith('-1'):
+                continue
+            seen.extend(lecture.name for lecture in section.lectures)
+
+    assert seen == ['lecture-0-0-0', 'lecture-0-0-1',
+                    'lecture-0-2-0', 'lecture-0-2-1',
+                    'lecture-1-0-0', 'lecture-1-0-1',
+                    'lecture-1-2-0', 'lecture-1-2-1']
+
+
+def test_filtered_lectures_are_not_resolved(monkeypatch):
+    from coursera.filtering import SelectionPlan
+
+    resolved = []
+
+    def get_on_demand_video_url(session, video_id, *args):
+        resolved.append(video_id)
+        return {'mp4': 'https://video.example.org/%s.mp4' % video_id}
+
+    monkeypatch.setattr(coursera_dl, 'get_on_demand_video_url',
+                        get_on_demand_video_url)
+
+    page = _make_on_demand_syllabus(2, 2, 3)
+    selection = SelectionPlan(section_filter='section-1-0',
+                              lecture_filter='-[02]$')
+    modules = coursera_dl.parse_on_demand_syllabus(None, page,
+                                                   resolve_jobs=2,
+                                                   selection=selection)
+
+    assert sorted(resolved) == ['v1-0-0', 'v1-0-2']
+
+    # the numbering of the lectures is kept
+    lectures = modules[1].sections[0].lectures
+    assert [l.name for l in lectures] == ['lecture-1-0-0', 'lecture-1-0-1',
+                                          'lecture-1-0-2']
+    assert lectures[1].resources == []
+    assert [r.url for r in lectures[2].resources] == [
+        'https://video.example.org/v1-0-2.mp4']
+
+    # nothing is resolved if no lecture format is wanted
+    del resolved[:]
+    coursera_dl.parse_on_demand_syllabus(None, page,
+                                         selection=SelectionPlan(['pdf']))
+    assert resolved == []
+
+
+# Test On-Demand Snapshots
+
+def test_on_demand_snapshot_round_trip(on_demand_video_url, tmpdir):
+    page = _make_on_demand_syllabus(2, 2, 2)
+    modules = coursera_dl.parse_on_demand_syllabus(None, page)
+    path = str(tmpdir.join('snapshot.json'))
+
+    coursera_dl.save_on_demand_snapshot(path, 'ml-001', page, modules)
+    loaded = coursera_dl.load_on_demand_snapshot(path, 'ml-001')
+
+    assert (coursera_dl.modules_to_json(loaded) ==
+            coursera_dl.modules_to_json(modules))
+    assert coursera_dl.load_on_demand_snapshot(path, 'ml-002') is None
+
+
+def test_on_demand_snapshot_with_expired_urls(monkeypatch, tmpdir):
+    from coursera.models import Module, Section, Lecture, Resource
+
+    url = 'https://cdn.example.org/v.mp4?Expires=1500000000&Signature=abc'
+    modules = [Module('module', [Section('section', [
+        Lecture('lecture', [Resource('mp4', url)])])])]
+    path = str(tmpdir.join('snapshot.json'))
+    coursera_dl.save_on_demand_snapshot(path, 'ml-001', '{}', modules)
+
+    warnings = []
+    monkeypatch.setattr(coursera_dl.logging, 'warning',
+                        lambda msg, *args: warnings.append(msg % args))
+    loaded = coursera_dl.load_on_demand_snapshot(path, 'ml-001')
+
+    assert loaded[0].sections[0].lectures[0].resources[0].url == url
+    assert len(warnings) == 1
+    assert 'expired' in warnings[0]
+
+
+def test_download_from_snapshot_without_api_calls(on_demand_video_url,
+                                                  monkeypatch, tmpdir):
+    page = _make_on_demand_syllabus(1, 1, 2)
+    modules = coursera_dl.parse_on_demand_syllabus(None, page)
+    path = str(tmpdir.join('{class_name}.json'))
+    coursera_dl.save_on_demand_snapshot(
+        coursera_dl.get_snapshot_path(path, 'ml-001'), 'ml-001', page, modules)
+
+    login = Mock()
+    monkeypatch.setattr(cookies, 'login', login)
+    monkeypatch.setattr(coursera_dl, 'get_on_demand_syllabus', Mock(
+        side_effect=AssertionError('syllabus should not be downloaded')))
+
+    args = coursera_dl.parse_args(['-u', 'bob', '-p', 'bill',
+                                   '--skip-download',
+                                   '--path', str(tmpdir.join('out')),
+                                   '-l', path, 'ml-001'])
+    coursera_dl.download_on_demand_class(args, 'ml-001')
+
+    assert login.called is False
+    section = tmpdir.join('out', 'ml-001', '01_module-0', '01_section-0-0')
+    assert section.join('01_lecture-0-0-0.mp4').check()
+    assert section.join('02_lecture-0-0-1.mp4').check()
+
+
+def test_main_shares_one_session(monkeypatch):
+    args = coursera_dl.parse_args(['-u', 'bob', '-p', 'bill',
+                                   '--dns-cache-ttl', '0',
+                                   'ml-001', 'ml-002', 'ml-003'])
+    monkeypatch.setattr(coursera_dl, 'parse_args', lambda: args)
+
+    calls = []
+    monkeypatch.setattr(coursera_dl, 'download_class',
+                        lambda args, class_name, session_login:
+                        calls.append((class_name, session_login)))
+    coursera_dl.main()
+
+    assert [class_name for class_name, _ in calls] == ['ml-001', 'ml-002',
+                                                       'ml-003']
+    assert len(set(id(session_login) for _, session_login in calls)) == 1
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+
+"""
+Test the rendering of the progress.
+"""
+
+import time
+
+from six import StringIO
+
+from coursera import progress
+from coursera.downloaders import DownloadProgress
+
+
+class FakeTTY(StringIO):
+    def isatty(self):
+        return True
+
+
+def _start(renderer, name, total):
+    p = DownloadProgress(total, name, renderer)
+    p.start()
+    return p
+
+
+def test_format_speed():
+    assert progress.format_speed(0, 1) == '---b/s'
+    assert progress.format_speed(100, 0) == '---b/s'
+    assert progress.format_speed(2048, 2) == '1.00KB/s'
+
+
+def test_updates_are_not_printed(capsys):
+    renderer = progress.ProgressRenderer(interval=60, stream=StringIO())
+    p = _start(renderer, 'a.mp4', 100)
+    p.read(50)
+    p.report(60)
+
+    assert capsys.readouterr()[0] == ''
+    assert renderer.stream.getvalue() == ''
+    renderer.close()
+
+
+def test_status_line_has_every_file_and_the_total():
+    renderer = progress.ProgressRenderer(interval=60, stream=StringIO())
+    a = _start(renderer, '/course/a.mp4', 100)
+    b = _start(renderer, '/course/b.srt', None)
+    a.read(25)
+    b.read(2048)
+
+    status = renderer.format_status(time.time() + 1)
+    assert status.startswith('[2 active] 2.02KB at 2.02KB/s | ')
+    assert 'a.mp4 25% ' in status
+    assert 'b.srt 2.00KB ' in status
+    renderer.close()
+
+
+def test_finished_files_are_printed_once():
+    renderer = progress.ProgressRenderer(interval=60, stream=StringIO())
+    p = _start(renderer, '/course/a.mp4', 100)
+    p.read(100)
+    p.stop()
+    renderer.remove('/course/a.mp4', p)
+
+    lines = renderer.stream.getvalue().splitlines()
+    assert len(lines) == 1
+    assert lines[0].startswith('a.mp4 ')
+    assert '100.00B at' in lines[0]
+    # the drawing thread stops with the last download
+    assert renderer._thread is None
+
+
+def test_summary_lines_without_tty():
+    renderer = progress.ProgressRenderer(interval=0.01, summary_interval=0,
+                                         stream=StringIO())
+    p = _start(renderer, 'a.mp4', 100)
+    p.read(10)
+    time.sleep(0.1)
+    renderer.close()
+
+    lines = renderer.stream.getvalue().splitlines()
+    assert lines
+    assert all(line.startswith('[1 active]') for line in lines)
+
+
+def test_status_line_is_redrawn_on_tty():
+    renderer = progress.ProgressRenderer(interval=0.01, stream=FakeTTY())
+    p = _start(renderer, 'a.mp4', 100)
+    p.read(10)
+    time.sleep(0.1)
+    p.stop()
+
+    output = renderer.stream.getvalue()
+    assert '\n' not in output[:output.index('a.mp4   ')]
+    assert output.count('\r[1 active]') > 1
+    assert output.endswith('\n')
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+
+"""
+Test the speed limits.
+"""
+
+import datetime
+
+import pytest
+
+from coursera import ratelimit
+
+
+@pytest.mark.parametrize(
+    "text,expected", [
+        ('1000', 1000),
+        ('500K', 512000),
+        ('20M', 20971520),
+        ('1.5m', 1572864),
+        ('1GB', 1073741824),
+        ('0', None),
+        ('unlimited', None),
+    ]
+)
+def test_parse_rate(text, expected):
+    assert ratelimit.parse_rate(text) == expected
+
+
+@pytest.mark.parametrize("text", ['', 'fast', '20X', '-5'])
+def test_parse_invalid_rate(text):
+    pytest.raises(ValueError, ratelimit.parse_rate, text)
+
+
+def _at(hour, minute=0):
+    return datetime.datetime(2016, 1, 1, hour, minute)
+
+
+def test_schedule():
+    schedule = ratelimit.RateSchedule.parse(
+        '1M', '09:00-18:00=20M,22:00-06:30=0')
+
+    assert schedule.get_rate(_at(8, 59)) == 1048576
+    assert schedule.get_rate(_at(9)) == 20971520
+    assert schedule.get_rate(_at(17, 59)) == 20971520
+    assert schedule.get_rate(_at(18)) == 1048576
+    assert schedule.get_rate(_at(23)) is None
+    assert schedule.get_rate(_at(6, 29)) is None
+    assert schedule.is_limited()
+
+
+def test_schedule_without_limits():
+    schedule = ratelimit.RateSchedule.parse(None, None)
+    assert schedule.get_rate(_at(12)) is None
+    assert not schedule.is_limited()
+
+
+@pytest.mark.parametrize(
+    "schedule", ['09:00-18:00', '9-18=1M', '25:00-26:00=1M', '09:00-18:00=x'])
+def test_parse_invalid_schedule(schedule):
+    pytest.raises(ValueError, ratelimit.RateSchedule.parse, None, schedule)
+
+
+def test_token_bucket_without_limit():
+    bucket = ratelimit.TokenBucket(ratelimit.RateSchedule())
+    assert bucket.reserve(10 ** 9) == 0
+
+
+def test_token_bucket_is_shared():
+    bucket = ratelimit.TokenBucket(ratelimit.RateSchedule(1000), burst=0)
+
+    first = bucket.reserve(500)
+    second = bucket.reserve(500)
+
+    # the second reader waits for the tokens taken by the first one too
+    assert 0.4 < first <= 0.5
+    assert 0.9 < second <= 1.0
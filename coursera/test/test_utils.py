@@ -131,6 +131,15 @@ def test_fix_url_doesnt_alters_empty_url():
     assert utils.fix_url(url) == ""
 
 
+def test_get_url_expiry():
+    assert utils.get_url_expiry(
+        'https://cdn.example.org/v.mp4?Expires=1500000000&Signature=abc'
+    ) == 1500000000
+    assert utils.get_url_expiry('https://cdn.example.org/v.mp4') is None
+    assert utils.get_url_expiry(
+        'https://cdn.example.org/v.mp4?expires=soon') is None
+
+
 def test_decode_input():
     encoded_inputs = [
         str("/home/user/темп"),
@@ -214,3 +223,37 @@ def test_grab_hidden_video_url():
     p = coursera_dl.OLD_grab_hidden_video_url(session,
                                           'http://www.hidden.video')
     assert 'video1.mp4' == p
+
+
+SYLLABUS_JSON = (
+    '{"courseMaterial": {"elements": ['
+    '{"slug": "m1", "elements": []}, {"slug": "m\\u00e9", "elements": []}'
+    ']}, "other": [1, 2, 3]}'
+)
+
+
+@pytest.mark.parametrize("data", [SYLLABUS_JSON,
+                                  SYLLABUS_JSON.encode('utf-8')])
+@pytest.mark.parametrize("backend", ['orjson', 'stdlib'])
+def test_json_loads(monkeypatch, data, backend):
+    if backend == 'orjson':
+        pytest.importorskip('orjson')
+    else:
+        monkeypatch.setattr(utils, 'orjson', None)
+
+    dom = utils.json_loads(data)
+    assert dom['other'] == [1, 2, 3]
+    assert dom['courseMaterial']['elements'][1]['slug'] == u'm\xe9'
+
+
+@pytest.mark.parametrize("data", [SYLLABUS_JSON,
+                                  SYLLABUS_JSON.encode('utf-8')])
+@pytest.mark.parametrize("threshold", [0, utils.INCREMENTAL_JSON_THRESHOLD])
+def test_iter_json_items(data, threshold):
+    if threshold == 0:
+        pytest.importorskip('ijson')
+
+    items = list(utils.iter_json_items(data, 'courseMaterial.elements',
+                                       threshold))
+    assert items == [{'slug': 'm1', 'elements': []},
+                     {'slug': u'm\xe9', 'elements': []}]
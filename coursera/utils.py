@@ -5,6 +5,8 @@ This module provides utility functions that are used within the script.
 """
 
 import errno
+import io
+import json
 import os
 import random
 import re
@@ -17,11 +19,28 @@ from .define import COURSERA_URL
 
 from six.moves import html_parser
 
+# Optional, faster JSON backends
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+# Size from which JSON documents are parsed incrementally (if ijson is
+# available), instead of being loaded all at once. The decoded document
+# takes several times the size of its text, but below this size that is at
+# most a few tens of MB, which is not worth the much slower parsing of ijson.
+INCREMENTAL_JSON_THRESHOLD = 8 * 1024 * 1024
+
 #  six.moves doesn’t support urlparse
 if six.PY3:  # pragma: no cover
-    from urllib.parse import urlparse, urljoin
+    from urllib.parse import urlparse, urljoin, parse_qsl
 else:
-    from urlparse import urlparse, urljoin
+    from urlparse import urlparse, urljoin, parse_qsl
 
 # Python3 (and six) don't provide string
 if six.PY3:
@@ -109,6 +128,19 @@ def mkdir_p(path, mode=0o777):
             raise
 
 
+def replace_file(src, dst):
+    """
+    Rename src to dst, replacing dst if it exists.
+    """
+
+    if hasattr(os, 'replace'):
+        os.replace(src, dst)
+    else:  # Python 2
+        if os.name == 'nt' and os.path.exists(dst):
+            os.remove(dst)
+        os.rename(src, dst)
+
+
 def fix_url(url):
     """
     Strip whitespace characters from the beginning and the end of the url
@@ -135,3 +167,74 @@ def make_coursera_absolute_url(url):
         return urljoin(COURSERA_URL, url)
 
     return url
+
+
+def get_url_expiry(url):
+    """
+    Return the time (in seconds since the epoch) after which a signed URL
+    stops working, as given by its Expires parameter, or None if it has
+    none.
+    """
+    for name, value in parse_qsl(urlparse(url).query):
+        if name.lower() == 'expires' and value.isdigit():
+            return int(value)
+    return None
+
+
+def json_loads(data):
+    """
+    Deserialize a JSON document given as bytes or text.
+
+    If orjson is available, it is used instead of the json module. It parses
+    bytes directly, without decoding them to text first.
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+
+    if isinstance(data, bytes):
+        data = data.decode('utf-8')
+    return json.loads(data)
+
+
+class _Utf8Reader(object):
+    """
+    Binary file-like object reading a text string as UTF-8, encoding it a
+    chunk at a time instead of making an encoded copy of the whole string.
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.pos = 0
+
+    def read(self, size=-1):
+        if size < 0:
+            size = len(self.text) - self.pos
+        chunk = self.text[self.pos:self.pos + size]
+        self.pos += len(chunk)
+        return chunk.encode('utf-8')
+
+
+def iter_json_items(data, path, threshold=INCREMENTAL_JSON_THRESHOLD):
+    """
+    Yield the items of the array found at the given dotted path (e.g.,
+    "courseMaterial.elements") of the JSON document in data.
+
+    Documents bigger than threshold are parsed incrementally with ijson (if
+    available), so that only one item of the array is decoded at a time,
+    instead of the whole document. The text of the document itself is still
+    held in memory by the caller.
+    """
+    if ijson is not None and len(data) >= threshold:
+        if isinstance(data, bytes):
+            f = io.BytesIO(data)
+        else:
+            f = _Utf8Reader(data)
+        for item in ijson.items(f, path + '.item'):
+            yield item
+        return
+
+    dom = json_loads(data)
+    for key in path.split('.'):
+        dom = dom[key]
+    for item in dom:
+        yield item